@@ -52,10 +52,12 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.StaticAssetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.PrincipalMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -94,6 +96,20 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# The local-memory cache is per process; point this at a shared backend
+# (e.g. Redis or Memcached) when running more than one worker, so that
+# quiz snapshot invalidation reaches every process.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'quizwebapp',
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -135,8 +151,20 @@ STATICFILES_DIRS = [
 ]
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
-# Enable Sass processor
-SASS_PROCESSOR_ENABLED = True
+# Built by `python manage.py build_assets`: minified, content-hashed
+# and precompressed (see core.assets)
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'core.assets.PrecompressedManifestStaticFilesStorage',
+    },
+}
+
+# Compile Sass on request in development only; elsewhere build_assets
+# compiles it ahead of time
+SASS_PROCESSOR_ENABLED = DEBUG
 SASS_PROCESSOR_ROOT = BASE_DIR / 'static'  # Output compiled CSS in the same directory as SCSS
 
 # Optional: Set output style to 'expanded' (for easier reading)
@@ -166,4 +194,15 @@ LOGIN_URL = '/authenticate/login/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Files without a public URL (lesson attachments). Keep it outside
+# MEDIA_ROOT and out of the web server's reach.
+PRIVATE_MEDIA_ROOT = os.path.join(BASE_DIR, 'private_media')
+
+# Lesson attachments are served by the app, to enrolled users only.
+# Set to 'x-accel-redirect' (nginx, with an internal location at
+# ATTACHMENT_ACCEL_PREFIX aliased to PRIVATE_MEDIA_ROOT) or 'x-sendfile'
+# (Apache, lighttpd) to let the web server send the file.
+ATTACHMENT_SENDFILE = None
+ATTACHMENT_ACCEL_PREFIX = '/protected-media/'
+
 
@@ -16,5 +16,6 @@ class CoreConfig(AppConfig):
         Executes when the application is ready.
         """
         from .signals import assign_teacher_permissions
+        from . import jobs
         # assign_teacher_permissions()
         from django.contrib.auth.models import Group, Permission
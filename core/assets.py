@@ -0,0 +1,205 @@
+"""
+Built static assets: minified, fingerprinted and precompressed.
+
+`build_assets` compiles the SCSS referenced by templates and collects
+the static files into STATIC_ROOT through
+`PrecompressedManifestStaticFilesStorage`, which
+
+- minifies JavaScript and CSS (rjsmin, rcssmin) as they are collected,
+- gives every file a content-hashed name, listed in `staticfiles.json`,
+  so `{% static %}` and `{% sass_src %}` link to the current version,
+- writes `.gz` and `.br` siblings of the text files.
+
+`serve_asset` (mounted by `StaticAssetMiddleware`) serves STATIC_ROOT,
+picking the precompressed sibling the browser accepts. Hashed names
+never change content, so they are sent with immutable, year-long cache
+headers.
+
+Brotli is optional: without the `brotli` package only gzip siblings
+are written.
+"""
+import gzip
+import mimetypes
+import os
+from functools import lru_cache
+
+import rcssmin
+import rjsmin
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.http import FileResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Hashed files never change: browsers may keep them a year
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+
+# Files under their original names may change on the next build
+MUTABLE_MAX_AGE = 60
+
+# Text files worth compressing
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.map', '.svg', '.json', '.txt', '.html', '.xml', '.ico')
+
+# Smaller files gain too little from compression
+MIN_COMPRESS_SIZE = 256
+
+_MINIFIERS = {
+    '.js': lambda text: rjsmin.jsmin(text, keep_bang_comments=True),
+    '.css': lambda text: rcssmin.cssmin(text, keep_bang_comments=True),
+}
+
+# Content-Encoding and file suffix of the precompressed siblings, by
+# preference
+_ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def minify(name, content):
+    """
+    Return the minified content of a JavaScript or CSS file, or None
+    if the file is of another type or already minified.
+    """
+    base, extension = os.path.splitext(name)
+    minifier = _MINIFIERS.get(extension)
+    if minifier is None or base.endswith('.min'):
+        return None
+    try:
+        text = content.decode('utf-8')
+    except UnicodeDecodeError:
+        return None
+    return minifier(text).encode('utf-8')
+
+
+def compress(path):
+    """
+    Write the gzip (and, if available, brotli) siblings of a file,
+    when they are smaller than the file.
+
+    Returns:
+        list: The paths written.
+    """
+    if not path.endswith(COMPRESSIBLE_EXTENSIONS) or os.path.getsize(path) < MIN_COMPRESS_SIZE:
+        return []
+    with open(path, 'rb') as file:
+        data = file.read()
+    variants = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(data, quality=11)
+    written = []
+    for suffix, compressed in variants.items():
+        if len(compressed) < len(data):
+            with open(path + suffix, 'wb') as file:
+                file.write(compressed)
+            written.append(path + suffix)
+    return written
+
+
+class PrecompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Manifest static files storage that minifies JavaScript and CSS as
+    they are collected and precompresses every collected file.
+
+    Before the first build (in development and tests) files missing
+    from the manifest are linked under their original names.
+    """
+    manifest_strict = False
+
+    def _save(self, name, content):
+        # Both the collected copy and the hashed one are written here
+        content.seek(0)
+        minified = minify(name, content.read())
+        content.seek(0)
+        if minified is not None:
+            content = ContentFile(minified)
+        return super()._save(name, content)
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            # Not collected yet
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name, hashed_name in self.hashed_files.items():
+            for stored in {name, hashed_name}:
+                if self.exists(stored):
+                    compress(self.path(stored))
+
+
+@lru_cache(maxsize=4)
+def _hashed_names(manifest_hash):
+    return frozenset(getattr(staticfiles_storage, 'hashed_files', {}).values())
+
+
+def is_hashed(name):
+    """
+    Check whether a static file name is a content-hashed one, listed in
+    the manifest.
+    """
+    return name in _hashed_names(getattr(staticfiles_storage, 'manifest_hash', ''))
+
+
+def _accepted_encodings(request):
+    accepted = set()
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, _, params = item.strip().partition(';')
+        if params.replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+def serve_asset(request, name):
+    """
+    Serve a file of STATIC_ROOT, precompressed if the browser accepts
+    it, with cache headers fit for its name.
+
+    Returns:
+        HttpResponse: The response, or None if there is no such file.
+    """
+    try:
+        path = safe_join(settings.STATIC_ROOT, name)
+    except SuspiciousFileOperation:
+        return None
+    if not os.path.isfile(path):
+        return None
+
+    accepted = _accepted_encodings(request)
+    encoding, served = None, path
+    for coding, suffix in _ENCODINGS:
+        if coding in accepted and os.path.isfile(path + suffix):
+            encoding, served = coding, path + suffix
+            break
+
+    stat = os.stat(served)
+    last_modified = int(stat.st_mtime)
+    etag = quote_etag(f"{stat.st_size:x}-{stat.st_mtime_ns:x}")
+    cache_control = (
+        f"public, max-age={IMMUTABLE_MAX_AGE}, immutable" if is_hashed(name)
+        else f"public, max-age={MUTABLE_MAX_AGE}"
+    )
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = FileResponse(
+            open(served, 'rb'),
+            content_type=mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        )
+        if encoding:
+            response['Content-Encoding'] = encoding
+        response['Last-Modified'] = http_date(last_modified)
+    response['ETag'] = etag
+    response['Cache-Control'] = cache_control
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
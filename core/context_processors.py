@@ -1,13 +1,15 @@
-from profiles.models import Profile
+from django.utils.functional import SimpleLazyObject
+from .principal import Principal
 
 def user_profile(request):
     """
     A context processor to make the authenticated user's
-    Profile available globally in all templates.
+    Profile, and the request's principal, available globally
+    in all templates.
 
-    This function retrieves the Profile associated with
-    the logged-in user and adds it to the template context
-    under the key `user_profile`.
+    The profile comes from the request's principal (see
+    `core.principal`), so it is loaded at most once per
+    request, and only if a template uses it.
 
     Args:
         request (HttpRequest): The incoming HTTP request
@@ -15,16 +17,18 @@ def user_profile(request):
         Returns:
             dict: A dictionary containing the 
                   `user_profile` key which maps to the
-                  user's Profile object if authenticated,
-                  or None otherwise.
+                  user's Profile object (loaded lazily) if
+                  authenticated, or None otherwise, and the
+                  `principal` key.
     """
+    principal = getattr(request, 'principal', None)
+    if principal is None:
+        # Requests that did not go through PrincipalMiddleware
+        principal = Principal(request.user)
     if request.user.is_authenticated:
-        try:
-            # Attempt to retrieve the user's Profile
-            profile = Profile.objects.get(user=request.user)
-        except Profile.DoesNotExist:
-            # Handle cases where the user does not have profile
-            profile = None
-        return {'user_profile': profile}
+        return {
+            'user_profile': SimpleLazyObject(lambda: principal.profile),
+            'principal': principal,
+        }
     # Return None if the user is not authenticated.
-    return {'user_profile': None}
\ No newline at end of file
+    return {'user_profile': None, 'principal': principal}
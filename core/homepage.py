@@ -0,0 +1,132 @@
+"""
+Caching of the homepage and the navigation bar.
+
+Anonymous visitors all see the same homepage, so it is rendered once
+and served from the shared cache until something it shows changes.
+The cached page carries a version; the signals in `core.signals` move
+the version on when a course is saved or deleted, or when an
+enrollment could reorder the popular courses, which invalidates the
+page with one cache write.
+
+The navigation bar of logged-in users is cached per user as a
+template fragment and dropped when their profile changes.
+"""
+import time
+from functools import wraps
+
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.db.models import F
+from django.http import HttpResponse
+
+from courses.models import Course, CourseStats
+
+# Number of popular courses on the homepage
+POPULAR_COURSES = 3
+
+# Lifetime of a cached page. Versions keep pages fresh; the timeout
+# only bounds memory held by old versions.
+PAGE_TIMEOUT = 60 * 60
+
+_VERSION_KEY = 'homepage_version'
+
+# Enrollment counts of the popular courses on the cached homepage
+_POPULAR_KEY = 'homepage_popular'
+
+
+def get_homepage_version():
+    """
+    Return the current version of the cached homepage.
+    """
+    version = cache.get(_VERSION_KEY)
+    if version is None:
+        version = str(time.time_ns())
+        if not cache.add(_VERSION_KEY, version, None):
+            version = cache.get(_VERSION_KEY, version)
+    return version
+
+
+def bump_homepage_version():
+    """
+    Invalidate the cached homepage.
+    """
+    cache.set(_VERSION_KEY, str(time.time_ns()), None)
+
+
+def cache_anonymous_page(view):
+    """
+    Decorator serving a view from the cache to anonymous GET requests.
+
+    Responses are cached per path and homepage version. Responses that
+    set cookies (e.g. a CSRF token) or are not 200 OK are never cached.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+            return view(request, *args, **kwargs)
+        key = f"page:{get_homepage_version()}:{request.get_full_path()}"
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+        response = view(request, *args, **kwargs)
+        if (response.status_code == 200 and not response.cookies
+                and not getattr(response, 'streaming', False)
+                and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE')):
+            cache.set(key, (response.content, response['Content-Type']), PAGE_TIMEOUT)
+        return response
+    return wrapper
+
+
+def get_popular_courses():
+    """
+    Return the most enrolled courses, read from their counters, and
+    remember their enrollment counts for `enrollments_changed`.
+    """
+    courses = list(
+        Course.objects.select_related('stats').order_by(
+            F('stats__enrollments').desc(nulls_last=True), '-id'
+        )[:POPULAR_COURSES]
+    )
+    cache.set(
+        _POPULAR_KEY,
+        {course.id: getattr(getattr(course, 'stats', None), 'enrollments', 0) for course in courses},
+        None
+    )
+    return courses
+
+
+def course_changed(course_id):
+    """
+    Invalidate the homepage if a changed course is, or could join, the
+    popular courses.
+    """
+    popular = cache.get(_POPULAR_KEY)
+    if popular is None or course_id in popular or len(popular) < POPULAR_COURSES:
+        bump_homepage_version()
+
+
+def enrollments_changed(course_id):
+    """
+    Invalidate the homepage if a course whose enrollments changed is,
+    or now ranks with, the popular courses.
+
+    Meant to run after the change committed, when the counters of the
+    course are up to date.
+    """
+    popular = cache.get(_POPULAR_KEY)
+    if popular is None or course_id in popular or len(popular) < POPULAR_COURSES:
+        bump_homepage_version()
+        return
+    enrollments = CourseStats.objects.filter(
+        course_id=course_id
+    ).values_list('enrollments', flat=True).first() or 0
+    if enrollments >= min(popular.values()):
+        bump_homepage_version()
+
+
+def invalidate_navigation(user_id):
+    """
+    Drop the cached navigation bar of a user.
+    """
+    cache.delete(make_template_fragment_key('navigation', [user_id]))
@@ -0,0 +1,261 @@
+"""
+Resized variants of uploaded images.
+
+Course images and profile avatars get WebP and JPEG copies at a few
+widths, so pages can offer a `srcset` instead of the full-size upload.
+Variants are stored under the SHA-256 of the source file's content
+(`variants/<hash>/<width>.<ext>`), so identical uploads share their
+variants and a variant's URL never changes meaning.
+
+An image field is registered with the model field that records its
+variants, e.g. `Course.image_variants`:
+
+    {"source": "courses/moon.png", "width": 1200,
+     "webp": {"320": "variants/ab.../320.webp", ...},
+     "jpeg": {"320": "variants/ab.../320.jpg", ...}}
+
+When a save changes the image, the variants are generated after
+commit on a background thread. The `generate_image_variants` job and
+management command pick up any image still without them. Recording
+the variants sends no signals, so each registration names the cached
+pages to invalidate once they are recorded.
+
+Variants live as long as their source: when `collect_stored_files`
+deletes an unreferenced content-addressed image, its variants go too.
+"""
+import hashlib
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.db.models.signals import post_save
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .storage import on_collect
+
+logger = logging.getLogger(__name__)
+
+# Widths of the variants, in pixels. Widths above the source's own are
+# skipped.
+VARIANT_WIDTHS = (160, 320, 640, 1280)
+
+# Pillow format, file extension and save options of each variant type
+VARIANT_FORMATS = {
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='image-variants')
+
+# Directory of the variants, inside the default storage
+VARIANTS_DIR = 'variants/'
+
+# (model, image field name) -> variants field name
+_registry = {}
+
+# (model, image field name) -> called with the object whose variants
+# were recorded
+_recorded_hooks = {}
+
+
+def register(model, field_name, variants_field_name, recorded=None):
+    """
+    Generate variants of `model.<field_name>`, recorded in
+    `model.<variants_field_name>`, whenever a save changes the image.
+
+    Called from the `ready` method of the model's app.
+
+    Args:
+        recorded (callable): Called with the object once its variants
+            are recorded, to invalidate the cached pages showing it.
+    """
+    _registry[(model, field_name)] = variants_field_name
+    if recorded is not None:
+        _recorded_hooks[(model, field_name)] = recorded
+
+    def image_saved(sender, instance, raw=False, **kwargs):
+        if not raw and needs_variants(instance, field_name):
+            schedule_variants(instance, field_name)
+
+    post_save.connect(
+        image_saved,
+        sender=model,
+        weak=False,
+        dispatch_uid=f"image_variants:{model._meta.label}.{field_name}"
+    )
+
+
+def registered_fields():
+    """
+    Return `(model, image field name, variants field name)` triples.
+    """
+    return [(model, field, variants) for (model, field), variants in _registry.items()]
+
+
+def _hash_file(file):
+    digest = hashlib.sha256()
+    file.seek(0)
+    for chunk in iter(lambda: file.read(64 * 1024), b''):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def _render(image, width, pil_format, options):
+    height = max(1, round(image.height * width / image.width))
+    resized = image.resize((width, height), Image.Resampling.LANCZOS)
+    if pil_format == 'JPEG' and resized.mode != 'RGB':
+        # JPEG has no alpha: flatten onto white
+        background = Image.new('RGB', resized.size, 'white')
+        background.paste(resized, mask=resized.getchannel('A') if 'A' in resized.getbands() else None)
+        resized = background
+    buffer = io.BytesIO()
+    resized.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def build_variants(field_file):
+    """
+    Store the variants of an image file, reusing the ones already
+    stored for the same content.
+
+    Args:
+        field_file (FieldFile): The source image.
+
+    Returns:
+        dict: The variants record of the image, or None if the file is
+            missing or not an image.
+    """
+    try:
+        with field_file.storage.open(field_file.name, 'rb') as file:
+            content_hash = _hash_file(file)
+            image = ImageOps.exif_transpose(Image.open(file))
+            image.load()
+    except (FileNotFoundError, UnidentifiedImageError, OSError) as error:
+        logger.warning("Cannot make variants of %s: %s", field_file.name, error)
+        return None
+
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or 'A' in image.getbands() else 'RGB')
+    widths = [width for width in VARIANT_WIDTHS if width < image.width] or [image.width]
+    record = {'source': field_file.name, 'width': image.width}
+    for key, (pil_format, extension, options) in VARIANT_FORMATS.items():
+        record[key] = {}
+        for width in widths:
+            name = f"{VARIANTS_DIR}{content_hash}/{width}.{extension}"
+            if not default_storage.exists(name):
+                name = default_storage.save(name, ContentFile(_render(image, width, pil_format, options)))
+            record[key][str(width)] = name
+    return record
+
+
+def generate_variants(model, pk, field_name):
+    """
+    Generate and record the variants of one object's image.
+
+    The record is only written if the object still has the same image,
+    so a slow run never overwrites the variants of a newer upload.
+
+    Returns:
+        bool: Whether a record was written.
+    """
+    variants_field = _registry[(model, field_name)]
+    obj = model.objects.filter(pk=pk).first()
+    if obj is None:
+        return False
+    field_file = getattr(obj, field_name)
+    if field_file:
+        # An unreadable image is recorded without variants, so that it
+        # is not retried on every backfill; pages show the original.
+        record = build_variants(field_file) or {'source': field_file.name}
+        same_image = Q(**{field_name: field_file.name})
+    else:
+        record = {}
+        same_image = Q(**{field_name: ''}) | Q(**{f'{field_name}__isnull': True})
+    if not model.objects.filter(same_image, pk=pk).update(**{variants_field: record}):
+        return False
+    recorded = _recorded_hooks.get((model, field_name))
+    if recorded is not None:
+        recorded(obj)
+    return True
+
+
+@on_collect
+def delete_variants(content_hash):
+    """
+    Delete the variants of an image, given the SHA-256 of its content.
+    """
+    directory = f"{VARIANTS_DIR}{content_hash}"
+    try:
+        _, names = default_storage.listdir(directory)
+    except FileNotFoundError:
+        return
+    for name in names:
+        default_storage.delete(f"{directory}/{name}")
+    try:
+        os.rmdir(default_storage.path(directory))
+    except OSError:
+        pass
+
+
+def _run_in_background(model, pk, field_name):
+    try:
+        generate_variants(model, pk, field_name)
+    except Exception:
+        logger.exception("Generating image variants of %s %s failed", model.__name__, pk)
+    finally:
+        close_old_connections()
+
+
+def needs_variants(instance, field_name):
+    """
+    Check whether an object's image changed since its variants were
+    made.
+    """
+    field_file = getattr(instance, field_name)
+    record = getattr(instance, _registry[(type(instance), field_name)]) or {}
+    return (field_file.name or '') != record.get('source', '')
+
+
+def schedule_variants(instance, field_name):
+    """
+    Generate the variants of an object's image on a background thread,
+    after the current transaction commits.
+    """
+    model, pk = type(instance), instance.pk
+    transaction.on_commit(lambda: _executor.submit(_run_in_background, model, pk, field_name))
+
+
+def backfill_variants(batch_size=100):
+    """
+    Generate the variants of every registered image that lacks them.
+
+    Returns:
+        int: The number of images processed.
+    """
+    processed = 0
+    for model, field_name, variants_field in registered_fields():
+        queryset = model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+        for obj in queryset.only('pk', field_name, variants_field).iterator(chunk_size=batch_size):
+            if needs_variants(obj, field_name):
+                generate_variants(model, obj.pk, field_name)
+                processed += 1
+    return processed
+
+
+def variant_srcset(record, kind):
+    """
+    Return the `srcset` attribute value of one variant type of an
+    image's variants record, or '' if there are none.
+    """
+    if not record or not record.get(kind):
+        return ''
+    return ', '.join(
+        f"{default_storage.url(name)} {width}w"
+        for width, name in sorted(record[kind].items(), key=lambda item: int(item[0]))
+    )
@@ -0,0 +1,12 @@
+"""
+Periodic jobs of the core app, run by `core.scheduler`.
+"""
+from .images import backfill_variants
+from .scheduler import every
+from .storage import collect_garbage
+
+# Images whose variants were lost, e.g. to a restart mid-generation
+every(300, name='backfill_image_variants')(backfill_variants)
+
+# Stored files no course, lesson or profile points at any more
+every(60 * 60 * 24, name='collect_stored_files')(collect_garbage)
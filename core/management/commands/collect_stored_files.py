@@ -0,0 +1,47 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from core.storage import collect_garbage, recount_references
+
+class Command(BaseCommand):
+    """
+    Custom management command to delete the files of the
+    content-addressed storage that no course, lesson or profile points
+    at any more.
+
+    Usage:
+        python manage.py collect_stored_files [--batch-size 500] [--grace-hours 24] [--recount]
+    """
+    help = 'Delete unreferenced files of the content-addressed storage'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='How many files to check at a time.'
+        )
+        parser.add_argument(
+            '--grace-hours',
+            type=float,
+            default=24,
+            help='Keep unreferenced files touched within this many hours.'
+        )
+        parser.add_argument(
+            '--recount',
+            action='store_true',
+            help='Recount the references of every file first.'
+        )
+
+    def handle(self, *args, **options):
+        """
+        Collects the garbage and reports how many files were deleted.
+        """
+        if options['recount']:
+            corrected = recount_references(batch_size=options['batch_size'])
+            self.stdout.write(f"Corrected the references of {corrected} files.")
+        deleted = collect_garbage(
+            batch_size=options['batch_size'],
+            grace_period=timedelta(hours=options['grace_hours'])
+        )
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} files."))
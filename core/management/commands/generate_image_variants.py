@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from core.images import backfill_variants
+
+class Command(BaseCommand):
+    """
+    Custom management command to generate the resized copies of course
+    images and avatars that do not have them yet, e.g. images uploaded
+    before variants existed.
+
+    Usage:
+        python manage.py generate_image_variants [--batch-size 100]
+    """
+    help = 'Generate missing resized copies of course images and avatars'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='How many objects to load at a time.'
+        )
+
+    def handle(self, *args, **options):
+        """
+        Generates the variants and reports how many images were done.
+        """
+        processed = backfill_variants(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} images."))
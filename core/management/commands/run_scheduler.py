@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from core.scheduler import get_jobs, run_forever, run_pending
+
+class Command(BaseCommand):
+    """
+    Custom management command to run the periodic jobs of the apps,
+    such as publishing scheduled quizzes.
+
+    Usage:
+        python manage.py run_scheduler [--once] [--poll 1]
+    """
+    help = 'Run the periodic jobs of the apps'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Run every job once and exit, e.g. from cron.'
+        )
+        parser.add_argument(
+            '--poll',
+            type=float,
+            default=1.0,
+            help='Seconds between checks for due jobs.'
+        )
+
+    def handle(self, *args, **options):
+        """
+        Runs the jobs once, or keeps running them at their intervals.
+        """
+        if options['once']:
+            self.report(run_pending(force=True))
+            return
+        self.stdout.write(
+            f"Running {len(get_jobs())} jobs: "
+            + ", ".join(job.name for job in get_jobs())
+        )
+        run_forever(poll=options['poll'], on_results=self.report)
+
+    def report(self, results):
+        for name, result in results:
+            self.stdout.write(self.style.SUCCESS(f"{name}: {result}"))
@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+
+from .assets import serve_asset
+from .principal import Principal
+
+
+class PrincipalMiddleware:
+    """
+    Attach a lazy `Principal` to every request as `request.principal`.
+
+    Must come after `AuthenticationMiddleware`. The principal is only
+    built when a view or template uses it.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.principal = SimpleLazyObject(lambda: Principal(request.user))
+        return self.get_response(request)
+
+
+class StaticAssetMiddleware:
+    """
+    Serve the built static files (see `core.assets`) under STATIC_URL,
+    precompressed and with long-lived cache headers.
+
+    Must come first, so that asset requests skip sessions and
+    authentication. Files not in STATIC_ROOT fall through, e.g. to the
+    development server's static views.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefix = settings.STATIC_URL
+
+    def __call__(self, request):
+        if request.method in ('GET', 'HEAD') and request.path.startswith(self.prefix):
+            response = serve_asset(request, request.path[len(self.prefix):])
+            if response is not None:
+                return response
+        return self.get_response(request)
@@ -1,3 +1,32 @@
 from django.db import models
 
-# Create your models here.
+
+class StoredFile(models.Model):
+    """
+    A file of the content-addressed storage (see `core.storage`).
+
+    Attributes:
+        name (CharField): The storage name of the file, derived from the
+            SHA-256 of its content.
+        size (PositiveBigIntegerField): The length of the file, in bytes.
+        references (PositiveIntegerField): The number of model fields
+            pointing at the file. Files left without references are
+            deleted by the `collect_stored_files` command.
+        created_at (DateTimeField): When the file was first stored.
+        updated_at (DateTimeField): When the file was last stored or
+            its references changed.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField(default=0)
+    references = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Garbage collection looks for unreferenced, old files
+            models.Index(fields=['references', 'updated_at'], name='stored_file_orphan_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.references} references)"
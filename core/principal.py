@@ -0,0 +1,108 @@
+"""
+The principal of a request: the user with their profile and roles.
+
+`PrincipalMiddleware` gives every request a lazy `request.principal`.
+Nothing is loaded until it is used, and then at most once per request:
+the profile with one query, the roles (the names of the user's groups)
+from the shared cache, or with one query on a miss. The handlers in
+`core.signals` drop the cached roles when a user's groups change and
+when a group is renamed or deleted.
+"""
+from functools import cached_property
+
+from django.core.cache import cache
+from django.db import transaction
+
+from profiles.models import Profile
+
+# Lifetime of cached roles. Group changes invalidate them.
+ROLES_TIMEOUT = 60 * 60
+
+# Roles already loaded for a user instance
+_ROLES_ATTR = '_principal_roles'
+
+
+def _roles_key(user_id):
+    return f"user_roles:{user_id}"
+
+
+def get_roles(user):
+    """
+    Return the names of the groups of a user.
+
+    The roles are remembered on the user instance, so asking again
+    within a request is free, and kept in the shared cache across
+    requests.
+
+    Args:
+        user (User): The user, possibly anonymous.
+
+    Returns:
+        frozenset: The group names.
+    """
+    if not user.is_authenticated:
+        return frozenset()
+    roles = getattr(user, _ROLES_ATTR, None)
+    if roles is None:
+        roles = cache.get(_roles_key(user.pk))
+        if roles is None:
+            roles = frozenset(user.groups.values_list('name', flat=True))
+            cache.set(_roles_key(user.pk), roles, ROLES_TIMEOUT)
+        setattr(user, _ROLES_ATTR, roles)
+    return roles
+
+
+def invalidate_roles(user_ids, instance=None):
+    """
+    Drop the cached roles of users: now, and again once the current
+    transaction commits, in case another request cached the old roles
+    in between.
+
+    Args:
+        user_ids (iterable): The ids of the users.
+        instance (User): A user instance whose remembered roles should
+            be dropped too, if any.
+    """
+    keys = [_roles_key(user_id) for user_id in user_ids]
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+    if instance is not None and hasattr(instance, _ROLES_ATTR):
+        delattr(instance, _ROLES_ATTR)
+
+
+class Principal:
+    """
+    The user of a request, with their profile and roles loaded on
+    first use.
+
+    Attributes:
+        user (User): The user, possibly anonymous.
+    """
+
+    def __init__(self, user):
+        self.user = user
+
+    @cached_property
+    def profile(self):
+        """
+        The user's Profile, or None for anonymous users and users
+        without one.
+        """
+        if not self.user.is_authenticated:
+            return None
+        return Profile.objects.filter(user=self.user).first()
+
+    @property
+    def roles(self):
+        """
+        The names of the user's groups.
+        """
+        return get_roles(self.user)
+
+    @property
+    def is_teacher(self):
+        return 'Teacher' in self.roles
+
+    @property
+    def is_student(self):
+        return 'Student' in self.roles
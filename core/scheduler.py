@@ -0,0 +1,104 @@
+"""
+A lightweight in-process scheduler for periodic jobs.
+
+Apps register their jobs with `every`, usually from a module imported
+in their `AppConfig.ready`, and the `run_scheduler` management command
+runs them in a single long-lived process (or once per invocation, when
+started by cron). Jobs must be safe to run again at any time: each run
+picks up whatever work is due.
+"""
+import logging
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Job:
+    """
+    A periodic job.
+
+    Attributes:
+        name (str): The name of the job.
+        func (callable): The function to run, without arguments.
+        interval (float): Seconds between two runs.
+        next_run (float): The monotonic time of the next run.
+    """
+    name: str
+    func: Callable
+    interval: float
+    next_run: float = 0.0
+
+
+_jobs = {}
+
+
+def every(seconds, name=None):
+    """
+    Decorator registering a function as a job that runs every
+    `seconds` seconds.
+
+    Args:
+        seconds (float): Seconds between two runs.
+        name (str): The name of the job. Defaults to the dotted path of
+            the function.
+    """
+    def decorator(func):
+        job_name = name or f"{func.__module__}.{func.__qualname__}"
+        _jobs[job_name] = Job(name=job_name, func=func, interval=seconds)
+        return func
+    return decorator
+
+
+def get_jobs():
+    """
+    Return the registered jobs.
+    """
+    return list(_jobs.values())
+
+
+def run_pending(force=False):
+    """
+    Run every job that is due.
+
+    A failing job is logged and retried at its next interval; it does
+    not stop the other jobs.
+
+    Args:
+        force (bool): Run every job, due or not.
+
+    Returns:
+        list: `(name, result)` pairs of the jobs that ran successfully.
+    """
+    results = []
+    for job in get_jobs():
+        current = time.monotonic()
+        if not force and current < job.next_run:
+            continue
+        job.next_run = current + job.interval
+        close_old_connections()
+        try:
+            results.append((job.name, job.func()))
+        except Exception:
+            logger.exception("Scheduled job %s failed", job.name)
+    return results
+
+
+def run_forever(poll=1.0, on_results=None):
+    """
+    Run the due jobs every `poll` seconds, forever.
+
+    Args:
+        poll (float): Seconds between two checks for due jobs.
+        on_results (callable): Called with the results of every
+            check, if given.
+    """
+    while True:
+        results = run_pending()
+        if on_results and results:
+            on_results(results)
+        time.sleep(poll)
@@ -1,6 +1,11 @@
-from django.db.models.signals import post_save, m2m_changed
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
 from django.contrib.auth.models import User, Group, Permission
 from django.dispatch import receiver
+from courses.models import Course, Enrollment
+from profiles.models import Profile
+from .homepage import course_changed, enrollments_changed, invalidate_navigation
+from .principal import invalidate_roles
 
 @receiver(post_save, sender=User)
 def assign_default_group(sender, instance, created, **kwargs):
@@ -23,11 +28,40 @@ def assign_teacher_permissions_on_group_change(sender, instance, action, **kwarg
     """
     This signal is triggered when a user's groups are changed.
     If the user is added to the 'Teacher' group, assign the necessary permissions.
+    The cached roles of the affected users are dropped.
     """
     if action == "pre_add":
         if 'Teacher' in Group.objects.filter(id__in=kwargs['pk_set']).values_list('name', flat=True):
             assign_teacher_permissions(instance)
 
+    if kwargs['reverse']:
+        # Changed from the group's side: the pk_set holds user ids
+        if action == "pre_clear":
+            invalidate_roles(instance.user_set.values_list('id', flat=True))
+        elif action in ("post_add", "post_remove"):
+            invalidate_roles(kwargs['pk_set'])
+    elif action in ("post_add", "post_remove", "post_clear"):
+        invalidate_roles([instance.pk], instance)
+
+
+@receiver(post_save, sender=Group)
+def invalidate_roles_on_group_change(sender, instance, created, **kwargs):
+    """
+    Drop the cached roles of the members of a group that may have been
+    renamed.
+    """
+    if not created:
+        invalidate_roles(list(instance.user_set.values_list('id', flat=True)))
+
+
+@receiver(pre_delete, sender=Group)
+def invalidate_roles_on_group_delete(sender, instance, **kwargs):
+    """
+    Drop the cached roles of the members of a group about to be deleted.
+    Memberships go with the group without an m2m signal.
+    """
+    invalidate_roles(list(instance.user_set.values_list('id', flat=True)))
+
 
 def assign_teacher_permissions(instance):
     """
@@ -53,3 +87,41 @@ def assign_teacher_permissions(instance):
             print(f"Permission '{perm_codename}' created and assigned to Teacher group.")
 
     print("Permissions successfully assigned to the Teacher group.")
+
+
+@receiver([post_save, post_delete], sender=Course)
+def invalidate_homepage_on_course_change(sender, instance, **kwargs):
+    """
+    Invalidate the cached homepage when one of its courses changes.
+    """
+    course_id = instance.id
+    transaction.on_commit(lambda: course_changed(course_id))
+
+
+@receiver([post_save, post_delete], sender=Enrollment)
+def invalidate_homepage_on_enrollment(sender, instance, **kwargs):
+    """
+    Invalidate the cached homepage when an enrollment may reorder its
+    popular courses.
+    """
+    course_id = instance.course_id
+    transaction.on_commit(lambda: enrollments_changed(course_id))
+
+
+@receiver([post_save, post_delete], sender=Profile)
+def invalidate_navigation_on_profile_change(sender, instance, **kwargs):
+    """
+    Drop the cached navigation bar of a user whose avatar may have
+    changed.
+    """
+    invalidate_navigation(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def invalidate_navigation_on_user_change(sender, instance, created, **kwargs):
+    """
+    Drop the cached navigation bar of a user whose username may have
+    changed.
+    """
+    if not created:
+        invalidate_navigation(instance.id)
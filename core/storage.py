@@ -0,0 +1,413 @@
+"""
+Content-addressed, deduplicated storage of uploaded files.
+
+Files saved to `content_storage` are named after the SHA-256 of their
+content (`cas/<first two hex digits>/<digest><extension>`), so the same
+slide deck or banner uploaded to many lessons and courses is stored once
+and has one URL, which browsers may cache for good: `content_file`
+serves these URLs with far-future, immutable cache headers.
+
+Files that only some users may see (lesson attachments) are saved to
+`private_content_storage` instead, under `PRIVATE_MEDIA_ROOT`, out of
+reach of any public URL; the views that check access deliver them.
+
+Each stored file has a `StoredFile` row counting the model fields that
+point at it. Fields are registered with `track`, which keeps the counts
+up to date as objects are saved and deleted, in the same transaction.
+Files nobody points at any more are deleted by `collect_garbage` (the
+`collect_stored_files` command), after a grace period that protects
+files being saved at that moment, together with the files derived from
+them (image variants), through the `on_collect` hooks.
+
+Content is hashed while it is copied, in `BLOCK_SIZE` blocks, so large
+uploads are never read into memory. A file already on disk whose
+SHA-256 the caller verified (a `sha256` attribute with the hex digest)
+is moved into place without being read again.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.utils.deconstruct import deconstructible
+from django.utils.functional import cached_property
+from django.utils.timezone import now
+
+from .models import StoredFile
+
+logger = logging.getLogger(__name__)
+
+# Directory of the content-addressed files, inside MEDIA_ROOT
+PREFIX = 'cas/'
+
+# Directory of the private content-addressed files, inside
+# PRIVATE_MEDIA_ROOT
+PRIVATE_PREFIX = 'attachments/'
+
+# Size of the blocks files are hashed and copied in
+BLOCK_SIZE = 64 * 1024
+
+# Files without references are kept this long before deletion, so that
+# a file being saved, but not yet referenced, is never collected
+GARBAGE_GRACE_PERIOD = timedelta(hours=24)
+
+# Temporary files of saves are named with this prefix
+_INCOMING = '.incoming-'
+
+# (model, field name) of the tracked fields
+_tracked = []
+
+# Called with the digest of every collected file
+_collect_hooks = []
+
+
+def is_content_name(name):
+    """
+    Check whether a storage name belongs to the content-addressed
+    storage.
+    """
+    return bool(name) and name.startswith((PREFIX, PRIVATE_PREFIX))
+
+
+def content_name(digest, extension, prefix=PREFIX):
+    return f"{prefix}{digest[:2]}/{digest}{extension}"
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    A file system storage naming files after the SHA-256 of their
+    content. Saving content that is already stored returns the existing
+    name without writing anything.
+    """
+    prefix = PREFIX
+
+    def get_available_name(self, name, max_length=None):
+        # The name is chosen by _save, from the content
+        return name
+
+    def _save(self, name, content):
+        extension = os.path.splitext(name)[1].lower()[:16]
+        incoming_dir = self.path(self.prefix)
+        os.makedirs(incoming_dir, exist_ok=True)
+
+        digest = hashlib.sha256()
+        hexdigest = None
+        size = 0
+        if hasattr(content, 'temporary_file_path'):
+            # Already on disk: hash it, then move it into place
+            source = content.temporary_file_path()
+            owned = False
+            hexdigest = getattr(content, 'sha256', None)
+            if hexdigest:
+                # Verified by the caller
+                size = os.path.getsize(source)
+            else:
+                with open(source, 'rb') as file:
+                    for block in iter(lambda: file.read(BLOCK_SIZE), b''):
+                        digest.update(block)
+                        size += len(block)
+        else:
+            fd, source = tempfile.mkstemp(dir=incoming_dir, prefix=_INCOMING)
+            owned = True
+            try:
+                with os.fdopen(fd, 'wb') as file:
+                    for block in content.chunks(BLOCK_SIZE):
+                        digest.update(block)
+                        file.write(block)
+                        size += len(block)
+            except BaseException:
+                os.remove(source)
+                raise
+
+        name = content_name(hexdigest or digest.hexdigest(), extension, self.prefix)
+        # Recorded first, so that garbage collection leaves the file be
+        _record(name, size)
+        full_path = self.path(name)
+        if os.path.exists(full_path):
+            # Already stored
+            if owned:
+                os.remove(source)
+        else:
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            file_move_safe(source, full_path, allow_overwrite=True)
+            if self.file_permissions_mode is not None:
+                os.chmod(full_path, self.file_permissions_mode)
+        return name
+
+
+def _record(name, size):
+    # Touch the row, so that the grace period protects the file until
+    # the object being saved references it
+    if StoredFile.objects.filter(name=name).update(updated_at=now()):
+        return
+    try:
+        with transaction.atomic():
+            StoredFile.objects.create(name=name, size=size)
+    except IntegrityError:
+        # Stored concurrently
+        pass
+
+
+@deconstructible
+class PrivateContentAddressedStorage(ContentAddressedStorage):
+    """
+    A content-addressed storage under `PRIVATE_MEDIA_ROOT`, whose files
+    have no URL: they are only delivered by views that check access.
+    """
+    prefix = PRIVATE_PREFIX
+
+    @cached_property
+    def base_location(self):
+        return self._value_or_setting(self._location, settings.PRIVATE_MEDIA_ROOT)
+
+    @property
+    def base_url(self):
+        # url() raises ValueError
+        return None
+
+    def _clear_cached_properties(self, setting, **kwargs):
+        super()._clear_cached_properties(setting, **kwargs)
+        if setting == 'PRIVATE_MEDIA_ROOT':
+            self.__dict__.pop('base_location', None)
+            self.__dict__.pop('location', None)
+
+
+content_storage = ContentAddressedStorage()
+
+private_content_storage = PrivateContentAddressedStorage()
+
+
+def storage_of(name):
+    """
+    Return the content-addressed storage a stored file name belongs to.
+    """
+    return private_content_storage if name.startswith(PRIVATE_PREFIX) else content_storage
+
+
+def adjust_references(name, delta):
+    """
+    Add `delta` to the references of a stored file. Names outside the
+    content-addressed storage are ignored.
+    """
+    if not is_content_name(name):
+        return
+    updated = StoredFile.objects.filter(name=name).update(
+        references=Greatest(F('references') + delta, 0),
+        updated_at=now()
+    )
+    storage = storage_of(name)
+    if not updated and delta > 0 and storage.exists(name):
+        # The row was lost (or the file stored by other means)
+        StoredFile.objects.create(name=name, size=storage.size(name), references=delta)
+
+
+def _name_of(value):
+    if value is None or isinstance(value, str):
+        return value or ''
+    return getattr(value, 'name', '') or ''
+
+
+def track(model, field_name):
+    """
+    Count the references of `model.<field_name>` to stored files.
+
+    Called from the `ready` method of the model's app.
+    """
+    _tracked.append((model, field_name))
+    stored_attr = f'_stored_{field_name}'
+    uid = f"stored_files:{model._meta.label}.{field_name}"
+
+    def loaded(sender, instance, **kwargs):
+        # The name in the database, as far as this instance knows
+        if field_name in instance.__dict__:
+            instance.__dict__[stored_attr] = _name_of(instance.__dict__[field_name]) if instance.pk else ''
+
+    def saving(sender, instance, raw=False, **kwargs):
+        if not raw and instance.pk and stored_attr not in instance.__dict__:
+            # Loaded with the field deferred
+            instance.__dict__[stored_attr] = _name_of(
+                model._default_manager.filter(pk=instance.pk).values_list(field_name, flat=True).first()
+            )
+
+    def saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+        if raw or (update_fields is not None and field_name not in update_fields):
+            return
+        new = _name_of(getattr(instance, field_name))
+        old = '' if created else instance.__dict__.get(stored_attr, new)
+        if old != new:
+            adjust_references(new, 1)
+            adjust_references(old, -1)
+        instance.__dict__[stored_attr] = new
+
+    def deleted(sender, instance, **kwargs):
+        adjust_references(instance.__dict__.get(stored_attr, _name_of(getattr(instance, field_name))), -1)
+
+    post_init.connect(loaded, sender=model, weak=False, dispatch_uid=uid)
+    pre_save.connect(saving, sender=model, weak=False, dispatch_uid=uid)
+    post_save.connect(saved, sender=model, weak=False, dispatch_uid=uid)
+    post_delete.connect(deleted, sender=model, weak=False, dispatch_uid=uid)
+
+
+def on_collect(hook):
+    """
+    Register a function deleting what was derived from a stored file,
+    called with the file's digest when it is collected. Usable as a
+    decorator.
+    """
+    _collect_hooks.append(hook)
+    return hook
+
+
+def _digest_of(name):
+    return os.path.splitext(os.path.basename(name))[0]
+
+
+def tracked_fields():
+    """
+    Return the `(model, field name)` pairs of the tracked fields.
+    """
+    return list(_tracked)
+
+
+def _reference_counts(names):
+    names = list(names)
+    counts = Counter()
+    for model, field_name in _tracked:
+        counts.update(
+            model._default_manager.filter(**{f'{field_name}__in': names}).values_list(field_name, flat=True)
+        )
+    return counts
+
+
+def recount_references(batch_size=500):
+    """
+    Recount the references of every stored file from the tracked
+    fields, correcting counts missed by `QuerySet.update()`.
+
+    Returns:
+        int: The number of files whose count changed.
+    """
+    corrected = 0
+    last_id = 0
+    while True:
+        batch = list(
+            StoredFile.objects.filter(id__gt=last_id).order_by('id')
+            .values_list('id', 'name', 'references')[:batch_size]
+        )
+        if not batch:
+            break
+        last_id = batch[-1][0]
+        counts = _reference_counts(name for _, name, _ in batch)
+        for file_id, name, references in batch:
+            if counts[name] != references:
+                StoredFile.objects.filter(id=file_id).update(references=counts[name])
+                corrected += 1
+    return corrected
+
+
+def collect_garbage(batch_size=500, grace_period=GARBAGE_GRACE_PERIOD):
+    """
+    Delete the stored files that no tracked field points at, and files
+    on disk that were never recorded (saves that were rolled back).
+
+    Files are handled `batch_size` at a time. Only files untouched for
+    `grace_period` are deleted; a file found referenced after all gets
+    its count corrected instead.
+
+    Returns:
+        int: The number of files deleted.
+    """
+    cutoff = now() - grace_period
+    deleted = 0
+    last_id = 0
+    while True:
+        batch = list(
+            StoredFile.objects.filter(id__gt=last_id, references=0, updated_at__lt=cutoff)
+            .order_by('id').values_list('id', 'name')[:batch_size]
+        )
+        if not batch:
+            break
+        last_id = batch[-1][0]
+        counts = _reference_counts(name for _, name in batch)
+        for file_id, name in batch:
+            if counts[name]:
+                StoredFile.objects.filter(id=file_id).update(references=counts[name])
+                continue
+            # Unless the file was saved again meanwhile
+            if StoredFile.objects.filter(id=file_id, references=0, updated_at__lt=cutoff).delete()[0]:
+                if _delete_unrecorded(storage_of(name), name):
+                    for hook in _collect_hooks:
+                        hook(_digest_of(name))
+                    deleted += 1
+
+    for storage in (content_storage, private_content_storage):
+        deleted += _collect_unrecorded(storage, batch_size, cutoff.timestamp())
+    if deleted:
+        logger.info("Deleted %d unreferenced stored files", deleted)
+    return deleted
+
+
+def _delete_unrecorded(storage, name):
+    # The file is moved aside before the last check for its row: a save
+    # recording the name after the check finds the file missing and
+    # writes it again, and one recording it before gets it back.
+    path = storage.path(name)
+    aside = os.path.join(os.path.dirname(path), _INCOMING + os.path.basename(path))
+    try:
+        os.rename(path, aside)
+    except FileNotFoundError:
+        return False
+    if StoredFile.objects.filter(name=name).exists():
+        # Saved again meanwhile; same name, same content
+        os.replace(aside, path)
+        return False
+    os.remove(aside)
+    return True
+
+
+def _collect_unrecorded(storage, batch_size, cutoff):
+    root = storage.path(storage.prefix)
+    if not os.path.isdir(root):
+        return 0
+    deleted = 0
+    batch = []
+
+    def sweep():
+        recorded = set(StoredFile.objects.filter(name__in=[name for name, _ in batch]).values_list('name', flat=True))
+        count = 0
+        for name, path in batch:
+            if name not in recorded:
+                os.remove(path)
+                count += 1
+        batch.clear()
+        return count
+
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            try:
+                if os.path.getmtime(path) >= cutoff:
+                    continue
+            except FileNotFoundError:
+                continue
+            if filename.startswith(_INCOMING):
+                # Left over by an interrupted save
+                os.remove(path)
+                deleted += 1
+                continue
+            batch.append((os.path.relpath(path, storage.location).replace(os.sep, '/'), path))
+            if len(batch) >= batch_size:
+                deleted += sweep()
+    if batch:
+        deleted += sweep()
+    return deleted
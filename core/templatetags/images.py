@@ -0,0 +1,44 @@
+from django import template
+from django.core.files.storage import default_storage
+
+from core.images import variant_srcset
+
+register = template.Library()
+
+
+@register.simple_tag
+def srcset(variants, kind='jpeg'):
+    """
+    Return the `srcset` value of the resized copies of an image.
+
+    Usage:
+        <img srcset="{% srcset course.image_variants 'webp' %}" ...>
+    """
+    return variant_srcset(variants, kind)
+
+
+@register.inclusion_tag('core/components/responsive_image.html')
+def responsive_image(image, variants, alt='', sizes='100vw', css_class='', width=None, height=None):
+    """
+    Render a <picture> offering the WebP and JPEG copies of an image,
+    falling back to the original until the copies exist.
+
+    Usage:
+        {% responsive_image course.image course.image_variants alt=course.title sizes="150px" %}
+    """
+    fallback = None
+    jpeg = (variants or {}).get('jpeg')
+    if jpeg:
+        fallback = default_storage.url(jpeg[max(jpeg, key=int)])
+    elif image:
+        fallback = image.url
+    return {
+        'src': fallback,
+        'webp_srcset': variant_srcset(variants, 'webp'),
+        'jpeg_srcset': variant_srcset(variants, 'jpeg'),
+        'alt': alt,
+        'sizes': sizes,
+        'css_class': css_class,
+        'width': width,
+        'height': height,
+    }
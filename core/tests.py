@@ -1,3 +1,333 @@
-from django.test import TestCase
+import gzip
+import io
+import os
+import shutil
+import tempfile
+from unittest import mock
+from PIL import Image
+from django.test import TestCase, override_settings
+from datetime import timedelta
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.template import Context, Template
+from django.templatetags.static import static
+from django.conf import settings as django_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.urls import reverse
+from django.contrib.auth.models import User, Group
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from courses.models import Course, Enrollment, Lesson
+from profiles.models import Profile
+from .homepage import get_homepage_version
+from .images import generate_variants
+from .models import StoredFile
+from .storage import collect_garbage, content_storage, private_content_storage, recount_references
+from .principal import Principal, get_roles
+from .utils import is_teacher
 
-# Create your tests here.
+
+class HomepageCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.teacher = User.objects.create_user(username="hometeacher", password="testpassword")
+        self.teacher.groups.add(Group.objects.get_or_create(name='Teacher')[0])
+        self.student = User.objects.create_user(username="homestudent", password="testpassword")
+        self.course = Course.objects.create(title="Astronomy", description="Stars.", teacher=self.teacher)
+
+    def test_anonymous_homepage_is_served_from_cache(self):
+        self.client.get(reverse('homepage'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('homepage'))
+        self.assertContains(response, "Astronomy")
+
+    def test_course_changes_invalidate_the_page(self):
+        self.client.get(reverse('homepage'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course.title = "Cosmology"
+            self.course.save()
+        self.assertContains(self.client.get(reverse('homepage')), "Cosmology")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Enrollment.objects.create(student=self.student, course=self.course)
+        self.assertContains(self.client.get(reverse('homepage')), "1 students")
+
+    def test_logged_in_navigation_is_cached(self):
+        self.client.login(username="homestudent", password="testpassword")
+        self.client.get(reverse('homepage'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('homepage'))
+        self.assertContains(response, "My Courses")
+        self.assertFalse(any('profiles_profile' in query['sql'] for query in queries))
+
+
+class PrincipalTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="principal", password="testpassword")
+        self.teachers = Group.objects.get_or_create(name='Teacher')[0]
+
+    def fresh_user(self):
+        return User.objects.get(pk=self.user.pk)
+
+    def test_roles_are_loaded_once_and_cached(self):
+        user = self.fresh_user()
+        with self.assertNumQueries(1):
+            self.assertEqual(get_roles(user), {'Student'})
+            self.assertFalse(is_teacher(user))
+        # Another request: a new user instance, roles from the cache
+        user = self.fresh_user()
+        with self.assertNumQueries(0):
+            self.assertTrue(Principal(user).is_student)
+
+    def test_group_changes_invalidate_roles(self):
+        self.assertFalse(is_teacher(self.user))
+        self.user.groups.add(self.teachers)
+        self.assertTrue(is_teacher(self.user))
+        # Course.clean sees the new role
+        Course.objects.create(title="Roles", description="", teacher=self.user)
+
+        self.teachers.user_set.remove(self.user)
+        self.assertFalse(is_teacher(self.fresh_user()))
+        self.user.groups.add(self.teachers)
+        self.teachers.user_set.clear()
+        self.assertFalse(is_teacher(self.fresh_user()))
+
+    def test_renamed_and_deleted_groups_invalidate_roles(self):
+        self.user.groups.add(self.teachers)
+        self.assertTrue(is_teacher(self.fresh_user()))
+        self.teachers.name = 'Instructor'
+        self.teachers.save()
+        self.assertEqual(get_roles(self.fresh_user()), {'Student', 'Instructor'})
+        self.teachers.delete()
+        self.assertEqual(get_roles(self.fresh_user()), {'Student'})
+
+    def test_roles_are_invalidated_again_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.groups.add(self.teachers)
+            # Cached by a concurrent request before the commit
+            cache.set(f"user_roles:{self.user.pk}", frozenset({'Student'}))
+        self.assertTrue(is_teacher(self.fresh_user()))
+
+    def test_profile_is_loaded_once_on_use(self):
+        with self.assertNumQueries(0):
+            principal = Principal(self.user)
+        with self.assertNumQueries(1):
+            self.assertEqual(principal.profile.user_id, self.user.pk)
+            self.assertIs(principal.profile, principal.profile)
+
+
+def make_png(width=800, height=400, color='navy'):
+    buffer = io.BytesIO()
+    Image.new('RGBA', (width, height), color).save(buffer, 'PNG')
+    return SimpleUploadedFile('cover.png', buffer.getvalue(), content_type='image/png')
+
+
+class ImageVariantTests(TestCase):
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=self.media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.teacher = User.objects.create_user(username="imageteacher", password="testpassword")
+        self.teacher.groups.add(Group.objects.get_or_create(name='Teacher')[0])
+
+    def create_course(self, title):
+        return Course.objects.create(title=title, description="", teacher=self.teacher, image=make_png())
+
+    def test_variants_are_content_hashed_and_shared(self):
+        first = self.create_course("First")
+        second = self.create_course("Second")
+        self.assertTrue(generate_variants(Course, first.id, 'image'))
+        self.assertTrue(generate_variants(Course, second.id, 'image'))
+        first.refresh_from_db()
+        second.refresh_from_db()
+        record = first.image_variants
+        self.assertEqual(record['source'], first.image.name)
+        self.assertEqual(sorted(record['webp'], key=int), ['160', '320', '640'])
+        self.assertEqual(record['webp'], second.image_variants['webp'])
+        with Image.open(f"{self.media}/{record['jpeg']['320']}") as variant:
+            self.assertEqual((variant.format, variant.size), ('JPEG', (320, 160)))
+
+        html = Template(
+            "{% load images %}{% responsive_image course.image course.image_variants alt='Cover' %}"
+        ).render(Context({'course': first}))
+        self.assertIn('type="image/webp"', html)
+        self.assertIn(f"/media/{record['webp']['640']} 640w", html)
+        self.assertIn(f'src="/media/{record["jpeg"]["640"]}"', html)
+
+    def test_recorded_variants_invalidate_cached_pages(self):
+        course = self.create_course("Cover")
+        version = get_homepage_version()
+        generate_variants(Course, course.id, 'image')
+        self.assertNotEqual(get_homepage_version(), version)
+
+        profile, _ = Profile.objects.get_or_create(user=self.teacher)
+        Profile.objects.filter(pk=profile.pk).update(avatar=content_storage.save('avatar.png', make_png()))
+        key = make_template_fragment_key('navigation', [self.teacher.id])
+        cache.set(key, 'cached navigation')
+        generate_variants(Profile, profile.pk, 'avatar')
+        self.assertIsNone(cache.get(key))
+
+    def test_variants_are_collected_with_their_image(self):
+        course = self.create_course("Replaced")
+        generate_variants(Course, course.id, 'image')
+        course.refresh_from_db()
+        variants_dir = os.path.dirname(os.path.join(self.media, course.image_variants['webp']['160']))
+        self.assertTrue(os.path.isdir(variants_dir))
+
+        course.image = make_png(color='red')
+        course.save()
+        collect_garbage(grace_period=timedelta(0))
+        self.assertFalse(os.path.exists(variants_dir))
+
+    def test_backfill_command(self):
+        course = self.create_course("Backfill")
+        call_command('generate_image_variants', stdout=io.StringIO())
+        course.refresh_from_db()
+        self.assertIn('jpeg', course.image_variants)
+
+    def test_only_new_images_are_scheduled(self):
+        course = self.create_course("Scheduled")
+        generate_variants(Course, course.id, 'image')
+        course.refresh_from_db()
+        with self.captureOnCommitCallbacks() as unchanged:
+            course.description = "Updated"
+            course.save()
+        # A new image is handed to a background thread after commit
+        with self.captureOnCommitCallbacks() as changed:
+            course.image = make_png(color='red')
+            course.save()
+        self.assertEqual(len(changed), len(unchanged) + 1)
+
+
+class ContentStorageTests(TestCase):
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=self.media, PRIVATE_MEDIA_ROOT=os.path.join(self.media, 'private'))
+        settings.enable()
+        self.addCleanup(settings.disable)
+        teacher = User.objects.create_user(username="storageteacher", password="testpassword")
+        teacher.groups.add(Group.objects.get_or_create(name='Teacher')[0])
+        self.course = Course.objects.create(title="Storage", description="", teacher=teacher)
+
+    def lesson(self, content):
+        return Lesson.objects.create(
+            course=self.course, title="Slides", description="",
+            attachment=SimpleUploadedFile('slides.pdf', content)
+        )
+
+    def references(self, name):
+        return StoredFile.objects.get(name=name).references
+
+    def test_identical_uploads_are_stored_once(self):
+        first = self.lesson(b'same slides')
+        second = self.lesson(b'same slides')
+        self.assertEqual(first.attachment.name, second.attachment.name)
+        self.assertRegex(first.attachment.name, r'^attachments/[0-9a-f]{2}/[0-9a-f]{64}\.pdf$')
+        self.assertEqual(self.references(first.attachment.name), 2)
+        self.assertEqual(len(os.listdir(os.path.dirname(first.attachment.path))), 1)
+
+        shared = first.attachment.name
+        second.attachment = ContentFile(b'new slides', name='slides.pdf')
+        second.save()
+        self.assertEqual(self.references(shared), 1)
+        # Also when the object was loaded without the field
+        deferred = Lesson.objects.only('title').get(pk=first.pk)
+        deferred.attachment = ContentFile(b'new slides', name='slides.pdf')
+        deferred.save()
+        self.assertEqual(self.references(shared), 0)
+        self.assertEqual(self.references(second.attachment.name), 2)
+
+    def test_garbage_collection(self):
+        kept = self.lesson(b'kept')
+        dropped = self.lesson(b'dropped')
+        dropped_name = dropped.attachment.name
+        dropped.delete()
+        # Referenced by a bulk update, which sends no signals
+        Lesson.objects.filter(pk=kept.pk).update(attachment=dropped_name)
+        self.assertEqual(recount_references(), 2)
+        Lesson.objects.filter(pk=kept.pk).update(attachment='')
+        recount_references()
+        # A save whose transaction was rolled back left a file behind
+        unrecorded = content_storage.path('cas/00/' + '0' * 64 + '.pdf')
+        os.makedirs(os.path.dirname(unrecorded))
+        open(unrecorded, 'wb').close()
+
+        # Within the grace period nothing goes
+        self.assertEqual(collect_garbage(), 0)
+        self.assertEqual(collect_garbage(batch_size=1, grace_period=timedelta(0)), 3)
+        self.assertFalse(StoredFile.objects.filter(references=0).exists())
+        self.assertFalse(os.path.exists(unrecorded))
+
+    def test_garbage_collection_spares_files_saved_meanwhile(self):
+        lesson = self.lesson(b'saved again')
+        name = lesson.attachment.name
+        lesson.delete()
+        rename = os.rename
+
+        def save_concurrently(source, target):
+            # Another request saves the same content as the row goes
+            self.lesson(b'saved again')
+            rename(source, target)
+
+        with mock.patch('os.rename', side_effect=save_concurrently):
+            self.assertEqual(collect_garbage(grace_period=timedelta(0)), 0)
+        self.assertEqual(self.references(name), 1)
+        with private_content_storage.open(name, 'rb') as file:
+            self.assertEqual(file.read(), b'saved again')
+
+    def test_files_are_served_as_immutable(self):
+        self.course.image = ContentFile(b'cacheable', name='banner.png')
+        self.course.save()
+        name = self.course.image.name
+        response = self.client.get(content_storage.url(name))
+        self.assertEqual(b''.join(response.streaming_content), b'cacheable')
+        self.assertIn('immutable', response['Cache-Control'])
+        response = self.client.get(content_storage.url(name), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+
+class AssetBuildTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.static_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.static_root, ignore_errors=True)
+        cls.enterClassContext(override_settings(STATIC_ROOT=cls.static_root))
+        call_command('build_assets', verbosity=0, stdout=io.StringIO())
+
+    def test_assets_are_compiled_minified_and_hashed(self):
+        url = static('global/main.css')
+        self.assertRegex(url, r'^/static/global/main\.[0-9a-f]{12}\.css$')
+        with open(os.path.join(self.static_root, url[len('/static/'):])) as css:
+            self.assertNotIn('\n  ', css.read())
+        self.assertTrue(os.path.exists(os.path.join(self.static_root, url[len('/static/'):] + '.gz')))
+        # No compiled CSS is left in the source tree
+        self.assertFalse(os.path.exists(os.path.join(django_settings.BASE_DIR, 'static', 'global', 'main.css')))
+
+    def test_precompressed_immutable_serving(self):
+        url = static('global/main.css')
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('Accept-Encoding', response['Vary'])
+        with open(os.path.join(self.static_root, url[len('/static/'):]), 'rb') as css:
+            self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), css.read())
+
+        # Original names are served uncompressed to clients without
+        # gzip, and may change
+        response = self.client.get('/static/global/main.css', HTTP_ACCEPT_ENCODING='identity')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertNotIn('immutable', response['Cache-Control'])
+        response = self.client.get('/static/global/main.css', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
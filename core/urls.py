@@ -1,8 +1,11 @@
 #authentication/urls.py
+from django.conf import settings
 from django.urls import path,include
 from . import views
+from .storage import PREFIX
 
 urlpatterns = [
     path('', views.homepage_view, name='homepage'),
+    path(f"{settings.MEDIA_URL.strip('/')}/{PREFIX}<path:path>", views.content_file, name='content_file'),
     # path('teachers/', views.teachers_view, name='teachers'),
 ]
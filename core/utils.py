@@ -1,23 +1,31 @@
+from .principal import get_roles
+
 def is_teacher(user):
     """
     Check if the given user belongs to the 'Teacher' group.
 
+    The user's roles are loaded once per request and cached across
+    requests (see `core.principal`).
+
     Args:
         user (User): The user instance to check.
 
     Returns:
         bool: True if the user is in the 'Teacher' group, else false.
     """
-    return user.groups.filter(name='Teacher').exists()
+    return 'Teacher' in get_roles(user)
 
 def is_student(user):
     """
     Check if the given user belongs to the 'Student' group.
 
+    The user's roles are loaded once per request and cached across
+    requests (see `core.principal`).
+
     Args:
         user (User): The user instance to check.
 
     Returns:
         bool: True if the user is in the 'Student' group, else false.
     """
-    return user.groups.filter(name='Student').exists()
\ No newline at end of file
+    return 'Student' in get_roles(user)
\ No newline at end of file
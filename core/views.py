@@ -1,23 +1,58 @@
-from django.http import HttpResponse
+import mimetypes
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
 from django.shortcuts import render
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
 from django.template.exceptions import TemplateDoesNotExist
 #from django.template.loader import get_template
-from django.db.models import Count
-from courses.models import Course  
+from .homepage import cache_anonymous_page, get_popular_courses
+from .storage import PREFIX, content_storage
+
+# Content-addressed files never change: browsers may keep them a year
+CONTENT_MAX_AGE = 60 * 60 * 24 * 365
 
 
+@cache_anonymous_page
 def homepage_view(request):
     """
     View function that renders the homepage template.
+
+    Anonymous visitors are served a cached copy of the page (see
+    `core.homepage`).
     """
     try:
-        popular_courses = Course.objects.annotate(num_enrollments=Count('enrollments')).order_by('-num_enrollments')[:3]
+        popular_courses = get_popular_courses()
         return render(request, 'core/homepage.html', {'popular_courses': popular_courses})
     except TemplateDoesNotExist:
         return HttpResponse(
             "Template not found",
             status=404
         )
+
+
+def content_file(request, path):
+    """
+    Serves a file of the content-addressed storage with immutable,
+    far-future cache headers (see `core.storage`).
+
+    Its name is the SHA-256 of its content, which doubles as its ETag.
+    """
+    name = PREFIX + path
+    etag = quote_etag(path.rsplit('/', 1)[-1].split('.', 1)[0])
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        not_modified['Cache-Control'] = f"public, max-age={CONTENT_MAX_AGE}, immutable"
+        return not_modified
+    try:
+        file = content_storage.open(name, 'rb')
+    except (FileNotFoundError, IsADirectoryError, SuspiciousFileOperation):
+        raise Http404("No such file.")
+    response = FileResponse(file, content_type=mimetypes.guess_type(name)[0] or 'application/octet-stream')
+    response['ETag'] = etag
+    response['Cache-Control'] = f"public, max-age={CONTENT_MAX_AGE}, immutable"
+    return response
     
 from django.shortcuts import render
 from django.contrib.auth.models import User, Group
@@ -1,7 +1,13 @@
 from django.contrib import admin
-from .models import Course, Enrollment, Lesson
+from django.contrib.admin.widgets import AdminFileWidget
+from django.db import models
+from .models import Course, Enrollment, Lesson, Quiz, Question
+from .exams import open_exam
+from .grading import regrade_quiz
+from .item_analysis import analyze_quiz, rebuild_quiz_statistics
+from .snapshot import invalidate_quiz_snapshot_on_commit
 from django.urls import reverse
-from django.utils.html import format_html
+from django.utils.html import format_html, format_html_join
 
 class EnrollmentInline(admin.TabularInline):
     model = Enrollment
@@ -48,7 +54,11 @@ class CourseAdmin(admin.ModelAdmin):
     """
     Admin interface for managing the Course model.
     """
-    list_display = ('title', 'get_teacher', 'created_at')
+    list_display = (
+        'title', 'get_teacher', 'created_at', 'get_enrollments',
+        'get_lessons', 'get_quizzes', 'get_average_score', 'get_last_activity'
+    )
+    list_select_related = ('teacher', 'stats')
     # inlines = [EnrollmentInline, LessonInline]
     inlines = [EnrollmentInline, LessonInline]
 
@@ -59,6 +69,37 @@ class CourseAdmin(admin.ModelAdmin):
         return obj.teacher.username
     get_teacher.short_description = 'Teacher'
 
+    def _stats(self, obj):
+        # Courses created before their counters are listed as empty
+        return getattr(obj, 'stats', None)
+
+    @admin.display(description='Students', ordering='stats__enrollments')
+    def get_enrollments(self, obj):
+        stats = self._stats(obj)
+        return stats.enrollments if stats else 0
+
+    @admin.display(description='Lessons', ordering='stats__lessons')
+    def get_lessons(self, obj):
+        stats = self._stats(obj)
+        return stats.lessons if stats else 0
+
+    @admin.display(description='Quizzes', ordering='stats__quizzes')
+    def get_quizzes(self, obj):
+        stats = self._stats(obj)
+        return stats.quizzes if stats else 0
+
+    @admin.display(description='Average Score')
+    def get_average_score(self, obj):
+        stats = self._stats(obj)
+        if stats is None or stats.average_score is None:
+            return '-'
+        return f"{stats.average_score:.1f}%"
+
+    @admin.display(description='Last Activity', ordering='stats__last_activity_at')
+    def get_last_activity(self, obj):
+        stats = self._stats(obj)
+        return stats.last_activity_at if stats else None
+
     def save_model(self, request, obj, form, change):
         """
         Set the teacher field to the current user for new courses.
@@ -87,12 +128,42 @@ class CourseAdmin(admin.ModelAdmin):
             return qs
         return qs.filter(teacher=request.user)
 
+class PrivateFileWidget(AdminFileWidget):
+    """
+    File input for files without a public URL: the current file is
+    named, not linked.
+    """
+    template_name = 'courses/widgets/private_file_input.html'
+
+    def is_initial(self, value):
+        return bool(value)
+
 @admin.register(Lesson)
 class LessonAdmin(admin.ModelAdmin):
     """
     Admin interface for managing the Lesson model.
     """
     list_display = ('title', 'course', 'created_at')
+    readonly_fields = ('large_attachment',)
+    formfield_overrides = {models.FileField: {'widget': PrivateFileWidget}}
+
+    class Media:
+        js = ('courses/attachment_upload.js',)
+
+    @admin.display(description='Upload a large attachment')
+    def large_attachment(self, obj):
+        """
+        A resumable, chunked upload of the attachment, for files too
+        large to send with the form.
+        """
+        if not obj.pk:
+            return "Save the lesson first."
+        return format_html(
+            '<div class="chunked-upload" data-start-url="{}">'
+            '<input type="file"> <progress max="100" value="0"></progress> '
+            '<span class="chunked-upload-status"></span></div>',
+            reverse('start_attachment_upload', args=[obj.course_id, obj.pk])
+        )
 
 @admin.register(Enrollment)
 class EnrollmentAdmin(admin.ModelAdmin):
@@ -150,3 +221,127 @@ class EnrollmentAdmin(admin.ModelAdmin):
     def has_add_permission(self, request):
         """Disable adding enrollments directly from the admin."""
         return False
+
+
+class QuestionInline(admin.TabularInline):
+    """
+    Inline editing of the questions of a quiz. Rows can be dragged to
+    reorder them, which rewrites their positions.
+    """
+    model = Question
+    extra = 0
+    fields = ('position', 'type', 'level', 'score', 'content')
+    ordering = ('position', 'id')
+    classes = ('sortable-questions',)
+
+
+@admin.register(Quiz)
+class QuizAdmin(admin.ModelAdmin):
+    """
+    Admin interface for managing the Quiz model.
+    """
+    list_display = ('title', 'course', 'published', 'published_at')
+    list_filter = ('published', 'course')
+    search_fields = ('title', 'course__title')
+    readonly_fields = ('item_analysis',)
+    inlines = [QuestionInline]
+    actions = ['open_exams', 'regrade', 'rebuild_statistics']
+
+    class Media:
+        js = ('courses/question_sort.js',)
+
+    def save_formset(self, request, form, formset, change):
+        """
+        Renumber the questions after saving them, so that reordered,
+        added and deleted rows leave the positions as 1, 2, 3, ...
+        """
+        super().save_formset(request, form, formset, change)
+        if formset.model is Question:
+            Question.renumber(form.instance.pk)
+            invalidate_quiz_snapshot_on_commit(form.instance.pk)
+
+    @admin.action(description='Open as exam (prepare attempts for enrolled students)')
+    def open_exams(self, request, queryset):
+        """
+        Create the attempts of all enrolled students of the selected
+        quizzes and open them, or schedule them to open at their
+        future publish time.
+        """
+        for quiz in queryset:
+            created, opens_at = open_exam(quiz)
+            self.message_user(
+                request,
+                f"{quiz.title}: prepared {created} attempts, opens at {opens_at:%Y-%m-%d %H:%M}."
+            )
+
+    @admin.action(description='Regrade all finished attempts')
+    def regrade(self, request, queryset):
+        """
+        Regrade the selected quizzes against their current answer key.
+        """
+        for quiz in queryset:
+            graded, changed = regrade_quiz(quiz.id)
+            self.message_user(
+                request,
+                f"{quiz.title}: regraded {graded} takes, {changed} scores changed."
+            )
+
+    @admin.action(description='Rebuild item statistics')
+    def rebuild_statistics(self, request, queryset):
+        """
+        Recompute the item statistics of the selected quizzes.
+        """
+        for quiz in queryset:
+            rebuild_quiz_statistics(quiz.id)
+        self.message_user(request, f"Rebuilt statistics of {len(queryset)} quizzes.")
+
+    @admin.display(description='Item analysis')
+    def item_analysis(self, obj):
+        """
+        Render the difficulty, discrimination and distractor rates of
+        every question, and the quiz's Cronbach's alpha.
+        """
+        if not obj.pk:
+            return '-'
+        analysis = analyze_quiz(obj.pk)
+
+        def percent(value):
+            return '-' if value is None else f"{value:.0%}"
+
+        def number(value):
+            return '-' if value is None else f"{value:.2f}"
+
+        rows = format_html_join(
+            '',
+            '<tr><td>{}</td><td>{}</td><td>{}</td><td>{}</td></tr>',
+            (
+                (
+                    item['question'].content[:80],
+                    percent(item['difficulty']),
+                    number(item['discrimination']),
+                    ', '.join(
+                        f"{answer.content[:30]}{'*' if answer.is_correct else ''}: {percent(rate)}"
+                        for answer, rate in item['answers']
+                    ),
+                )
+                for item in analysis['questions']
+            )
+        )
+        return format_html(
+            '<p>Takes: {} &middot; Cronbach\'s alpha: {}</p>'
+            '<table><thead><tr><th>Question</th><th>Difficulty (p)</th>'
+            '<th>Discrimination (r<sub>pb</sub>)</th><th>Answer selection (* correct)</th>'
+            '</tr></thead><tbody>{}</tbody></table>',
+            analysis['takes'],
+            number(analysis['alpha']),
+            rows
+        )
+
+    def get_queryset(self, request):
+        """
+        Restrict quizzes shown to those of the logged-in teacher's courses.
+        """
+        qs = super().get_queryset(request).select_related('course')
+        if request.user.is_superuser:
+            return qs
+        return qs.filter(course__teacher=request.user)
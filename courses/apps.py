@@ -22,3 +22,11 @@ class CoursesConfig(AppConfig):
 
     def ready(self):
         import courses.signals
+        import courses.jobs
+        from core.homepage import course_changed
+        from core.images import register
+        from core.storage import track
+        from .models import Course, Lesson
+        register(Course, 'image', 'image_variants', recorded=lambda course: course_changed(course.id))
+        track(Course, 'image')
+        track(Lesson, 'attachment')
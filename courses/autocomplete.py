@@ -0,0 +1,181 @@
+"""
+In-process prefix index for course title autocomplete.
+
+Every process keeps the course titles in a sorted array of folded
+keys, one key per word of the title (the title from that word on), so
+typing the start of any word finds the course with a binary search and
+without touching the database. Keys are case-folded and stripped of
+accents, so "φυσικη" matches "Φυσική".
+
+The index is built with one query on first use and tagged with a
+version kept in the shared cache. Saving or deleting a course moves
+the version on; the process that made the change patches a copy of its
+index and swaps it in, and the other processes notice the new version
+and rebuild. An index in use is never modified, so searches need no
+lock.
+"""
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+
+from django.core.cache import cache
+
+from .models import Course
+
+_VERSION_KEY = 'course_autocomplete_version'
+
+# Seconds browsers and proxies may reuse a suggestions response
+SUGGESTIONS_MAX_AGE = 30
+
+
+def fold(text):
+    """
+    Fold text for matching: case-folded, without accents, with runs of
+    whitespace collapsed.
+    """
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return ' '.join(stripped.split())
+
+
+def _keys(title):
+    words = fold(title).split(' ')
+    return [' '.join(words[i:]) for i in range(len(words)) if words[i]]
+
+
+class PrefixIndex:
+    """
+    Sorted-array prefix index of course titles.
+
+    Attributes:
+        entries (list): Sorted `(key, course_id)` pairs.
+        titles (dict): Maps course ids to their titles.
+    """
+
+    def __init__(self, courses=()):
+        self.titles = dict(courses)
+        self.entries = sorted(
+            (key, course_id)
+            for course_id, title in self.titles.items()
+            for key in _keys(title)
+        )
+
+    def __len__(self):
+        return len(self.titles)
+
+    def copy(self):
+        """
+        Return an index with copies of this one's entries and titles,
+        to apply changes to.
+        """
+        index = PrefixIndex()
+        index.titles = dict(self.titles)
+        index.entries = list(self.entries)
+        return index
+
+    def add(self, course_id, title):
+        """
+        Insert or update a course.
+        """
+        self.remove(course_id)
+        self.titles[course_id] = title
+        for key in _keys(title):
+            insort(self.entries, (key, course_id))
+
+    def remove(self, course_id):
+        """
+        Remove a course, if present.
+        """
+        title = self.titles.pop(course_id, None)
+        if title is None:
+            return
+        for key in _keys(title):
+            i = bisect_left(self.entries, (key, course_id))
+            if i < len(self.entries) and self.entries[i] == (key, course_id):
+                del self.entries[i]
+
+    def search(self, prefix, limit=5):
+        """
+        Return up to `limit` `(course_id, title)` pairs of courses with
+        a word starting with the prefix, courses whose title starts
+        with it first.
+        """
+        prefix = fold(prefix)
+        if not prefix:
+            return []
+        starts, others = [], []
+        seen = set()
+        i = bisect_left(self.entries, (prefix,))
+        # Bound the scan for very common prefixes
+        end = min(len(self.entries), i + limit * 20)
+        while i < end and len(starts) < limit:
+            key, course_id = self.entries[i]
+            if not key.startswith(prefix):
+                break
+            if course_id not in seen:
+                seen.add(course_id)
+                title_start = fold(self.titles[course_id]) == key
+                (starts if title_start else others).append((course_id, self.titles[course_id]))
+            i += 1
+        return (starts + others)[:limit]
+
+
+_lock = threading.Lock()
+_index = None
+_index_version = None
+
+
+def _get_version():
+    version = cache.get(_VERSION_KEY)
+    if version is None:
+        version = str(time.time_ns())
+        if not cache.add(_VERSION_KEY, version, None):
+            version = cache.get(_VERSION_KEY, version)
+    return version
+
+
+def get_index():
+    """
+    Return the current prefix index of this process, rebuilding it if
+    another process changed the courses.
+    """
+    global _index, _index_version
+    version = _get_version()
+    if _index is None or _index_version != version:
+        index = PrefixIndex(Course.objects.values_list('id', 'title'))
+        with _lock:
+            _index, _index_version = index, version
+    return _index
+
+
+def course_changed(course_id, title=None):
+    """
+    Apply a saved (with its `title`) or deleted course to the index.
+
+    Meant to run after the change committed.
+    """
+    global _index, _index_version
+    with _lock:
+        current = _index is not None and _index_version == cache.get(_VERSION_KEY)
+        new_version = str(time.time_ns())
+        cache.set(_VERSION_KEY, new_version, None)
+        if not current:
+            return
+        # Searches may be reading the current index
+        index = _index.copy()
+        if title is None:
+            index.remove(course_id)
+        else:
+            index.add(course_id, title)
+        _index, _index_version = index, new_version
+
+
+def suggest(prefix, limit=5):
+    """
+    Return up to `limit` `{'id', 'title'}` suggestions for a prefix.
+    """
+    return [
+        {'id': course_id, 'title': title}
+        for course_id, title in get_index().search(prefix, limit)
+    ]
@@ -0,0 +1,48 @@
+"""
+Helpers for structures kept in the shared cache.
+"""
+from django.core.cache import cache
+
+# How long a process may hold the update lock of a cached structure.
+LOCK_TIMEOUT = 5
+
+
+def patch_cached(key, patch, timeout):
+    """
+    Update a cached structure in place.
+
+    `patch` is called with the cached value, which it may modify, and
+    the value is stored back. Nothing happens on a cache miss: the
+    next reader loads a fresh value anyway.
+
+    If another process is patching the same key, the cached value is
+    dropped instead, and a dirty marker tells the lock holder not to
+    store its copy, which misses this update; the holder checks the
+    marker both before and after storing, so that the value is dropped
+    whichever of the two processes gets there last.
+
+    Args:
+        key (str): The cache key.
+        patch (callable): Called with the cached value.
+        timeout (int): The cache timeout of the stored value.
+    """
+    lock = f"{key}:lock"
+    dirty = f"{key}:dirty"
+    if not cache.add(lock, 1, LOCK_TIMEOUT):
+        cache.set(dirty, 1, LOCK_TIMEOUT)
+        cache.delete(key)
+        return
+    try:
+        cache.delete(dirty)
+        value = cache.get(key)
+        if value is None:
+            return
+        patch(value)
+        if cache.get(dirty) is None:
+            cache.set(key, value, timeout)
+            if cache.get(dirty) is None:
+                return
+        # Another update came in meanwhile
+        cache.delete(key)
+    finally:
+        cache.delete(lock)
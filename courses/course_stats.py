@@ -0,0 +1,180 @@
+"""
+Denormalized course counters.
+
+Every course has a `CourseStats` row with its enrollment, lesson and
+quiz counts, the running sum of its take scores and the time of its
+last activity. Signals apply each change as a single-row update (see
+`courses.signals`); regrades and deleted quizzes recompute the course
+instead, and `reconcile_course_stats` recomputes every course in
+chunks, reporting the rows that had drifted.
+"""
+from django.db import transaction
+from django.db.models import Count, F, FloatField, Max, Q, Sum
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Course, CourseStats, Enrollment, Lesson, Quiz, TakeResult
+from .snapshot import get_quiz_snapshot
+
+_COUNTERS = ('enrollments', 'lessons', 'quizzes', 'graded_takes', 'score_percent_sum')
+
+
+def adjust_course_stats(course_id, activity_at=None, **deltas):
+    """
+    Add deltas to the counters of a course in one update.
+
+    Counters never drop below zero. A course without a stats row is
+    recomputed instead when something was added.
+
+    Args:
+        course_id (int): The id of the course.
+        activity_at (datetime): The time of the change, if it counts as
+            activity.
+        **deltas: Amounts to add, keyed by counter name.
+    """
+    changes = {
+        name: Greatest(F(name) + delta, 0) if delta < 0 else F(name) + delta
+        for name, delta in deltas.items()
+    }
+    if activity_at is not None:
+        changes['last_activity_at'] = Greatest(
+            Coalesce('last_activity_at', activity_at), activity_at
+        )
+    updated = CourseStats.objects.filter(course_id=course_id).update(**changes)
+    # Deletions may run while the whole course is being deleted
+    if not updated and any(delta > 0 for delta in deltas.values()):
+        rebuild_course_stats([course_id])
+
+
+def _score_percent(result):
+    if not result.max_score:
+        return 0.0
+    return float(result.score) * 100 / float(result.max_score)
+
+
+def record_take_result(result):
+    """
+    Add a newly graded take to the score average of its course.
+
+    Args:
+        result (TakeResult): The result of the take.
+    """
+    take = result.take
+    adjust_course_stats(
+        get_quiz_snapshot(take.quiz_id).course_id,
+        activity_at=take.finished_at,
+        graded_takes=1,
+        score_percent_sum=_score_percent(result),
+    )
+
+
+def _differs(stored, computed):
+    # The running score sum picks up rounding errors along the way
+    if abs(stored.score_percent_sum - computed.score_percent_sum) > 1e-6:
+        return True
+    return any(
+        getattr(stored, name) != getattr(computed, name)
+        for name in (*_COUNTERS[:-1], 'last_activity_at')
+    )
+
+
+def compute_course_stats(course_ids):
+    """
+    Compute the counters of courses from scratch.
+
+    Runs one grouped query per counted table, whatever the number of
+    courses.
+
+    Args:
+        course_ids (list): The ids of the courses.
+
+    Returns:
+        dict: Unsaved `CourseStats` instances keyed by course id, for
+            the courses that exist.
+    """
+    stats = {
+        course_id: CourseStats(course_id=course_id)
+        for course_id in Course.objects.filter(id__in=course_ids).values_list('id', flat=True)
+    }
+
+    def activity(row, field):
+        current = stats[row['course']].last_activity_at
+        if row[field] is not None and (current is None or row[field] > current):
+            stats[row['course']].last_activity_at = row[field]
+
+    for row in (Enrollment.objects.filter(course__in=stats).values('course')
+                .annotate(count=Count('id'), latest=Max('enrolled_at'))):
+        stats[row['course']].enrollments = row['count']
+        activity(row, 'latest')
+    for row in (Lesson.objects.filter(course__in=stats).values('course')
+                .annotate(count=Count('id'), latest=Max('created_at'))):
+        stats[row['course']].lessons = row['count']
+        activity(row, 'latest')
+    for row in Quiz.objects.filter(course__in=stats).values('course').annotate(count=Count('id')):
+        stats[row['course']].quizzes = row['count']
+    for row in (TakeResult.objects.filter(take__quiz__course__in=stats)
+                .values(course=F('take__quiz__course'))
+                .annotate(
+                    count=Count('take'),
+                    percent_sum=Sum(
+                        F('score') * 100.0 / F('max_score'),
+                        filter=~Q(max_score=0),
+                        output_field=FloatField()
+                    ),
+                    latest=Max('take__finished_at'))):
+        stats[row['course']].graded_takes = row['count']
+        stats[row['course']].score_percent_sum = row['percent_sum'] or 0.0
+        activity(row, 'latest')
+    return stats
+
+
+def rebuild_course_stats(course_ids):
+    """
+    Recompute and save the counters of courses.
+
+    Args:
+        course_ids (list): The ids of the courses.
+
+    Returns:
+        int: The number of courses whose stored counters were wrong or
+            missing.
+    """
+    computed = compute_course_stats(course_ids)
+    stored = CourseStats.objects.in_bulk(list(computed))
+    fields = [*_COUNTERS, 'last_activity_at']
+    drifted = [
+        stats for course_id, stats in computed.items()
+        if course_id not in stored or _differs(stored[course_id], stats)
+    ]
+    with transaction.atomic():
+        CourseStats.objects.bulk_create(
+            drifted,
+            update_conflicts=True,
+            unique_fields=['course'],
+            update_fields=[*fields, 'updated_at'],
+        )
+    return len(drifted)
+
+
+def reconcile_course_stats(chunk_size=500):
+    """
+    Recompute the counters of every course, a chunk of courses at a
+    time, and repair the ones that drifted.
+
+    Args:
+        chunk_size (int): How many courses to recompute at a time.
+
+    Returns:
+        tuple: The number of courses checked and of courses repaired.
+    """
+    checked = repaired = 0
+    last_id = 0
+    while True:
+        course_ids = list(
+            Course.objects.filter(id__gt=last_id)
+            .order_by('id').values_list('id', flat=True)[:chunk_size]
+        )
+        if not course_ids:
+            return checked, repaired
+        repaired += rebuild_course_stats(course_ids)
+        checked += len(course_ids)
+        last_id = course_ids[-1]
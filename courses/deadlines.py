@@ -0,0 +1,72 @@
+"""
+Finalization of timed attempts that ran out of time.
+
+An attempt of a timed quiz gets a deadline when it starts. Students
+who submit in time finish their attempt as usual; attempts that are
+still open after their deadline are finished here, in batches, by the
+`finalize_expired_takes` management command. Attempts without a single
+answer are left open: most are the attempts `open_exam` prepared for
+students who never sat the exam, and grading them would put zeros in
+the results. A student who shows up after the deadline still gets
+theirs finished as it is.
+
+Each batch closes its attempts with a single UPDATE, found through the
+partial index on open attempts' deadlines, and grades them per quiz
+with the vectorized `regrade_quiz`. The statistics, leaderboards and
+distributions of the quizzes are rebuilt once, after the last batch.
+Thousands of attempts expiring at the end of an exam therefore cost a
+handful of queries per quiz.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef
+from django.utils.timezone import now
+
+from .grading import quiz_regraded, regrade_quiz
+from .models import Quiz, Take, TakeAnswer
+
+
+def finalize_expired_takes(batch_size=1000):
+    """
+    Finish and grade every open attempt that is past its deadline and
+    has answers.
+
+    An attempt is finished at its deadline, not when it is found, so
+    its duration never exceeds the time limit.
+
+    Args:
+        batch_size (int): How many attempts to finalize per batch.
+
+    Returns:
+        int: The number of finalized attempts.
+    """
+    finalized = 0
+    graded_quizzes = set()
+    while True:
+        cutoff = now() - Take.DEADLINE_GRACE
+        with transaction.atomic():
+            expired = list(
+                Take.objects.select_for_update()
+                .filter(finished_at__isnull=True, deadline__lte=cutoff)
+                .filter(Exists(TakeAnswer.objects.filter(take=OuterRef('pk'))))
+                .order_by('deadline')
+                .values_list('id', 'quiz_id')[:batch_size]
+            )
+            if not expired:
+                break
+            Take.objects.filter(id__in=[take_id for take_id, _ in expired]).update(
+                finished_at=F('deadline')
+            )
+
+        by_quiz = defaultdict(list)
+        for take_id, quiz_id in expired:
+            by_quiz[quiz_id].append(take_id)
+        for quiz_id, take_ids in by_quiz.items():
+            regrade_quiz(quiz_id, chunk_size=batch_size, take_ids=take_ids, notify=False)
+        graded_quizzes.update(by_quiz)
+        finalized += len(expired)
+
+    for quiz_id in graded_quizzes:
+        quiz_regraded.send(sender=Quiz, quiz_id=quiz_id)
+    return finalized
@@ -0,0 +1,145 @@
+"""
+Score distributions of quizzes.
+
+For every quiz we keep the sorted scores of its finished takes and a
+histogram of them in the shared cache. A take's percentile is then a
+binary search instead of an aggregate query over `Take`. The
+distribution is patched when a take is graded, and rebuilt from the
+takes on a cache miss, after a regrade, or with the
+`rebuild_score_distributions` management command.
+"""
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .caching import patch_cached
+from .models import Take
+from .snapshot import get_quiz_snapshot
+
+# Number of histogram buckets between zero and the quiz's maximum score.
+BUCKETS = 10
+
+# Lifetime of a cached distribution.
+DISTRIBUTION_TIMEOUT = 60 * 60 * 24
+
+
+def _cents(score):
+    return int(Decimal(score) * 100)
+
+
+def _cache_key(quiz_id):
+    return f"score_distribution:{quiz_id}"
+
+
+class ScoreDistribution:
+    """
+    The scores of the finished takes of a quiz.
+
+    Attributes:
+        max_cents (int): The maximum score of the quiz, in cents.
+        scores (array): The sorted scores, in cents.
+        histogram (list): How many scores fall in each of the
+            `BUCKETS` equal-width buckets between zero and the maximum.
+    """
+
+    def __init__(self, max_score, scores=()):
+        self.max_cents = _cents(max_score)
+        self.scores = array('q', sorted(_cents(score) for score in scores))
+        self.histogram = [0] * BUCKETS
+        for cents in self.scores:
+            self.histogram[self._bucket(cents)] += 1
+
+    def __len__(self):
+        return len(self.scores)
+
+    def _bucket(self, cents):
+        if self.max_cents <= 0:
+            return BUCKETS - 1
+        return max(0, min(BUCKETS - 1, cents * BUCKETS // self.max_cents))
+
+    def add(self, score):
+        """
+        Add the score of a newly finished take.
+        """
+        cents = _cents(score)
+        insort(self.scores, cents)
+        self.histogram[self._bucket(cents)] += 1
+
+    def percentile(self, score):
+        """
+        Return the percentile rank of a score: the percentage of takes
+        that scored lower, counting equal scores as half.
+        """
+        if not self.scores:
+            return None
+        cents = _cents(score)
+        below = bisect_left(self.scores, cents)
+        equal = bisect_right(self.scores, cents) - below
+        return 100 * (below + equal / 2) / len(self.scores)
+
+    def buckets(self):
+        """
+        Return the histogram as `(low, high, count, percentage)` tuples,
+        with the bounds as scores.
+        """
+        width = Decimal(self.max_cents) / BUCKETS / 100
+        total = len(self.scores) or 1
+        return [
+            (width * i, width * (i + 1), count, 100 * count / total)
+            for i, count in enumerate(self.histogram)
+        ]
+
+
+def build_distribution(quiz_id):
+    """
+    Build the distribution of a quiz from its finished takes.
+    """
+    return ScoreDistribution(
+        get_quiz_snapshot(quiz_id).score,
+        Take.objects.filter(
+            quiz_id=quiz_id,
+            finished_at__isnull=False
+        ).values_list('score', flat=True)
+    )
+
+
+def get_distribution(quiz_id):
+    """
+    Return the cached distribution of a quiz, building it on a miss.
+    """
+    distribution = cache.get(_cache_key(quiz_id))
+    if distribution is None:
+        distribution = rebuild_distribution(quiz_id)
+    return distribution
+
+
+def rebuild_distribution(quiz_id):
+    """
+    Rebuild and cache the distribution of a quiz.
+    """
+    distribution = build_distribution(quiz_id)
+    cache.set(_cache_key(quiz_id), distribution, DISTRIBUTION_TIMEOUT)
+    return distribution
+
+
+def record_score(take):
+    """
+    Add the score of a newly finished take to its quiz's distribution
+    once the surrounding transaction commits.
+    """
+    transaction.on_commit(lambda: patch_cached(
+        _cache_key(take.quiz_id),
+        lambda distribution: distribution.add(take.score),
+        DISTRIBUTION_TIMEOUT
+    ))
+
+
+def invalidate_distribution(quiz_id):
+    """
+    Drop the cached distribution of a quiz, e.g. when its maximum
+    score changes.
+    """
+    cache.delete(_cache_key(quiz_id))
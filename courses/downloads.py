@@ -0,0 +1,163 @@
+"""
+Protected delivery of lesson attachments.
+
+Attachments are served by `lesson_attachment` to the members of their
+course only. Responses carry an ETag and Last-Modified date, answer
+conditional requests with 304, and serve single byte ranges with 206,
+so interrupted downloads and video seeking resume where they stopped.
+
+Files are streamed in `ATTACHMENT_CHUNK_SIZE` blocks. When the front
+web server is configured for it (`ATTACHMENT_SENDFILE` is
+'x-sendfile' or 'x-accel-redirect'), the view only checks access and
+hands the file to the server in a header, freeing the worker at once.
+"""
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe, quote_etag
+
+# Size of the blocks attachments are streamed in
+ATTACHMENT_CHUNK_SIZE = getattr(settings, 'ATTACHMENT_CHUNK_SIZE', 64 * 1024)
+
+# Off-load downloads to the web server: None, 'x-sendfile' (Apache,
+# lighttpd) or 'x-accel-redirect' (nginx)
+ATTACHMENT_SENDFILE = getattr(settings, 'ATTACHMENT_SENDFILE', None)
+
+# Internal nginx location mapped to PRIVATE_MEDIA_ROOT, for
+# X-Accel-Redirect
+ATTACHMENT_ACCEL_PREFIX = getattr(settings, 'ATTACHMENT_ACCEL_PREFIX', '/protected-media/')
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class AttachmentResponse(FileResponse):
+    block_size = ATTACHMENT_CHUNK_SIZE
+
+
+class _FileRange:
+    """
+    A read-only view of `length` bytes of a file from its current
+    position, for streaming a byte range.
+    """
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size) if size else b''
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """
+    Parse a `Range` header for a file of `size` bytes.
+
+    Only single ranges are supported; anything else is ignored and
+    the whole file is sent, as RFC 9110 allows.
+
+    Returns:
+        tuple: `(start, end)` inclusive byte positions, None to send
+            the whole file, or False if the range cannot be satisfied.
+    """
+    match = _RANGE_RE.match(header.strip()) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # The last N bytes
+        length = int(last)
+        if length == 0:
+            return False
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, end
+
+
+def _if_range_matches(request, etag, last_modified):
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def serve_attachment(request, field_file, filename=None):
+    """
+    Build the response delivering a stored file.
+
+    Args:
+        request (HttpRequest): The download request.
+        field_file (FieldFile): The file, in a storage with local paths.
+        filename (str): The name to save the file as; defaults to the
+            name of the stored file.
+
+    Returns:
+        HttpResponse: 200, 206, 304, 412 or 416.
+    """
+    path = field_file.path
+    stat = os.stat(path)
+    last_modified = int(stat.st_mtime)
+    etag = quote_etag(f"{stat.st_size:x}-{stat.st_mtime_ns:x}")
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return not_modified
+
+    filename = filename or os.path.basename(field_file.name)
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    if ATTACHMENT_SENDFILE:
+        # The web server sends the file, ranges included
+        response = HttpResponse(content_type=content_type)
+        if ATTACHMENT_SENDFILE == 'x-accel-redirect':
+            response['X-Accel-Redirect'] = ATTACHMENT_ACCEL_PREFIX + field_file.name
+        else:
+            response['X-Sendfile'] = path
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+    else:
+        byte_range = None
+        if request.method in ('GET', 'HEAD') and _if_range_matches(request, etag, last_modified):
+            byte_range = parse_range(request.META.get('HTTP_RANGE'), stat.st_size)
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f"bytes */{stat.st_size}"
+            return response
+
+        file = open(path, 'rb')
+        if byte_range is None:
+            response = AttachmentResponse(
+                file, as_attachment=True, filename=filename, content_type=content_type
+            )
+        else:
+            start, end = byte_range
+            file.seek(start)
+            response = AttachmentResponse(
+                _FileRange(file, end - start + 1),
+                as_attachment=True, filename=filename, content_type=content_type, status=206
+            )
+            response['Content-Range'] = f"bytes {start}-{end}/{stat.st_size}"
+            response['Content-Length'] = str(end - start + 1)
+        response['Accept-Ranges'] = 'bytes'
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    # Only the user's own browser may keep a copy
+    response['Cache-Control'] = 'private, max-age=0, must-revalidate'
+    return response
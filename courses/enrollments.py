@@ -0,0 +1,157 @@
+"""
+Course membership of users, for authorization checks.
+
+The ids of the courses a user is enrolled in, and of the courses they
+teach, are kept in the shared cache under a per-user version, and
+remembered on the user instance for the rest of the request. Saving
+or deleting an enrollment (or changing a course's teacher) moves the
+user's version on (see `courses.signals`), so checking access to a
+course costs no query in steady state.
+
+Views that need access to a course are wrapped in
+`enrollment_required`.
+"""
+import time
+from dataclasses import dataclass
+from functools import wraps
+
+from django.contrib import messages
+from django.core.cache import cache
+from django.http import Http404
+from django.shortcuts import redirect
+
+from .models import Course, Enrollment, Quiz
+from .snapshot import get_quiz_snapshot
+
+# Lifetime of cached memberships. Versions keep them fresh; the
+# timeout only bounds memory held by old versions.
+MEMBERSHIP_TIMEOUT = 60 * 60 * 24
+
+# Memberships already loaded for a user instance
+_MEMBERSHIP_ATTR = '_course_membership'
+
+
+@dataclass(frozen=True)
+class Membership:
+    """
+    The courses of a user.
+
+    Attributes:
+        enrolled (frozenset): Ids of the courses the user is enrolled in.
+        teaching (frozenset): Ids of the courses the user teaches.
+    """
+    enrolled: frozenset = frozenset()
+    teaching: frozenset = frozenset()
+
+    def can_access(self, course_id):
+        return course_id in self.enrolled or course_id in self.teaching
+
+
+def _version_key(user_id):
+    return f"membership_version:{user_id}"
+
+
+def get_membership_version(user_id):
+    """
+    Return the current version of a user's cached memberships.
+    """
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        version = str(time.time_ns())
+        if not cache.add(_version_key(user_id), version, None):
+            version = cache.get(_version_key(user_id), version)
+    return version
+
+
+def bump_membership_version(user_id, instance=None):
+    """
+    Invalidate the cached memberships of a user.
+
+    Args:
+        user_id (int): The id of the user.
+        instance (User): A user instance whose remembered memberships
+            should be dropped too, if any.
+    """
+    cache.set(_version_key(user_id), str(time.time_ns()), None)
+    if instance is not None and hasattr(instance, _MEMBERSHIP_ATTR):
+        delattr(instance, _MEMBERSHIP_ATTR)
+
+
+def get_membership(user):
+    """
+    Return the courses of a user, from the request, the shared cache,
+    or two queries on a miss.
+
+    Args:
+        user (User): The user, possibly anonymous.
+
+    Returns:
+        Membership: The user's courses.
+    """
+    if not user.is_authenticated:
+        return Membership()
+    membership = getattr(user, _MEMBERSHIP_ATTR, None)
+    if membership is None:
+        key = f"membership:{user.pk}:{get_membership_version(user.pk)}"
+        membership = cache.get(key)
+        if membership is None:
+            membership = Membership(
+                enrolled=frozenset(
+                    Enrollment.objects.filter(student=user).values_list('course_id', flat=True)
+                ),
+                teaching=frozenset(
+                    Course.objects.filter(teacher=user).values_list('id', flat=True)
+                ),
+            )
+            cache.set(key, membership, MEMBERSHIP_TIMEOUT)
+        setattr(user, _MEMBERSHIP_ATTR, membership)
+    return membership
+
+
+def is_enrolled(user, course_id):
+    """
+    Check whether a user is enrolled in a course.
+    """
+    return course_id in get_membership(user).enrolled
+
+
+def can_access_course(user, course_id):
+    """
+    Check whether a user may see a course: its students, its teacher
+    and superusers may.
+    """
+    return user.is_superuser or get_membership(user).can_access(course_id)
+
+
+def can_manage_course(user, course_id):
+    """
+    Check whether a user may change a course: its teacher and
+    superusers may.
+    """
+    return user.is_superuser or course_id in get_membership(user).teaching
+
+
+def _course_of(kwargs):
+    if 'course_id' in kwargs:
+        return kwargs['course_id']
+    try:
+        return get_quiz_snapshot(kwargs['quiz_id']).course_id
+    except Quiz.DoesNotExist:
+        raise Http404("No Quiz matches the given query.")
+
+
+def enrollment_required(view):
+    """
+    Decorator letting only the users who may see a course into a view.
+
+    The course is the view's `course_id` argument, or the course of
+    its `quiz_id` argument. Other users are sent back to the course
+    list.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not can_access_course(request.user, _course_of(kwargs)):
+            messages.error(request, "You are not enrolled in this course.")
+            return redirect('course_list')
+        return view(request, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,74 @@
+"""
+Opening quizzes as exams.
+
+When an exam opens, every enrolled student hits the quiz at once. If
+each of them had to create their `Take` on the first page load, those
+inserts would serialize on the database exactly at the busiest moment.
+`open_exam` creates the attempts of all enrolled students up front, in
+one transaction, and warms the quiz snapshot, so the first page load
+of each student only reads.
+
+An exam can be opened ahead of time: if the quiz is scheduled to
+publish (`publish_at`) or open (`published_at`) in the future, the
+attempts are prepared now and start at that time, and the quiz stays
+closed until then.
+"""
+from django.db import transaction
+from django.db.models import Max
+from django.utils.timezone import now
+
+from .models import Enrollment, Take
+from .snapshot import get_quiz_snapshot
+
+
+def open_exam(quiz, batch_size=1000):
+    """
+    Create the attempts of every enrolled student of a quiz's course
+    and open the quiz, now or at its scheduled `published_at`.
+
+    The attempts start when the exam opens, so a timed quiz gives
+    every student the same deadline. Students who already have an
+    attempt keep it. The attempts of students who never answer are not
+    graded when they expire (see `courses.deadlines`).
+
+    Args:
+        quiz (Quiz): The quiz to open.
+        batch_size (int): How many attempts to insert per query.
+
+    Returns:
+        tuple: The number of created attempts and the opening time.
+    """
+    opens_at = now()
+    scheduled_at = quiz.publish_at if not quiz.published and quiz.publish_at else quiz.published_at
+    if scheduled_at and scheduled_at > opens_at:
+        opens_at = scheduled_at
+    deadline = opens_at + quiz.time_limit if quiz.time_limit else None
+
+    with transaction.atomic():
+        last_id = Take.objects.aggregate(last=Max('id'))['last'] or 0
+        students = list(
+            Enrollment.objects.filter(course_id=quiz.course_id)
+            .exclude(student__takes__quiz=quiz)
+            .values_list('student_id', flat=True)
+        )
+        Take.objects.bulk_create(
+            [Take(user_id=student_id, quiz=quiz, deadline=deadline) for student_id in students],
+            batch_size=batch_size,
+            ignore_conflicts=True
+        )
+        # `created_at` is stamped on insert; the attempts start at
+        # opening. Only this exam's students: attempts other requests
+        # inserted meanwhile keep their own start.
+        for start in range(0, len(students), batch_size):
+            Take.objects.filter(
+                quiz=quiz, id__gt=last_id, user_id__in=students[start:start + batch_size]
+            ).update(created_at=opens_at)
+
+        # A quiz scheduled to publish later is left to the publisher job
+        if not quiz.published and opens_at != quiz.publish_at:
+            quiz.published = True
+            quiz.published_at = opens_at
+            quiz.save(update_fields=['published', 'published_at', 'updated_at'])
+
+    transaction.on_commit(lambda: get_quiz_snapshot(quiz.id))
+    return len(students), opens_at
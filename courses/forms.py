@@ -2,25 +2,33 @@ from django import forms
 from .models import Quiz, Question, Answer
 
 class QuizSubmissionForm(forms.Form):
+    """
+    A form with one field per question of a quiz, used to answer the
+    whole quiz in a single request.
+
+    The form is built from a `QuizSnapshot`, so rendering and
+    validating it does not query the database.
+    """
     def __init__(self, *args, **kwargs):
         self.quiz = kwargs.pop('quiz')
         super().__init__(*args, **kwargs)
 
         # Dynamically generate fields for each question
-        for question in self.quiz.questions.all():
+        for question in self.quiz.questions:
             field_name = f"question_{question.id}"
             if question.type == Question.MULTIPLE_CHOICE:
-                self.fields[field_name] = forms.ChoiceField(
-                    choices=[(answer.id, answer.content) for answer in question.answers.all()],
-                    widget=forms.RadioSelect,
+                self.fields[field_name] = forms.MultipleChoiceField(
+                    choices=[(answer.id, answer.content) for answer in question.answers],
+                    widget=forms.CheckboxSelectMultiple,
                     label=question.content,
+                    required=False
                 )
             elif question.type == Question.TRUE_FALSE:
                 self.fields[field_name] = forms.ChoiceField(
                     choices=[
-                        (answer.id, "True") for answer in question.answers.filter(is_correct=True)
+                        (answer.id, "True") for answer in question.answers if answer.is_correct
                     ] + [
-                        (answer.id, "False") for answer in question.answers.filter(is_correct=False)
+                        (answer.id, "False") for answer in question.answers if not answer.is_correct
                     ],
                     widget=forms.RadioSelect,
                     label=question.content,
@@ -30,4 +38,30 @@ class QuizSubmissionForm(forms.Form):
                     widget=forms.Textarea,
                     label=question.content,
                     required=False
-                )
\ No newline at end of file
+                )
+
+    def selected_answers(self):
+        """
+        Return the submitted answers of a valid form.
+
+        Short answers are stored against the first (reference) answer
+        of their question, since every `TakeAnswer` must point to an
+        `Answer`.
+
+        Returns:
+            list: `(answer_id, content)` pairs, where `content` is the
+                text of a short answer and None otherwise.
+        """
+        selected = []
+        for question in self.quiz.questions:
+            value = self.cleaned_data.get(f"question_{question.id}")
+            if not value:
+                continue
+            if question.type == Question.SHORT_ANSWER:
+                if question.answers:
+                    selected.append((question.answers[0].id, value))
+            elif question.type == Question.MULTIPLE_CHOICE:
+                selected.extend((int(answer_id), None) for answer_id in value)
+            else:
+                selected.append((int(value), None))
+        return selected
@@ -0,0 +1,364 @@
+"""
+Grading of quiz attempts.
+
+A `Take` is graded once, when it is finished. The outcome is stored
+in a `TakeResult` together with a per-question breakdown, and the
+total is mirrored to `Take.score`.
+
+Scoring rules, per question:
+
+    * MULTIPLE_CHOICE: full score if at least one answer was selected
+      and every selected answer is correct.
+    * TRUE_FALSE: full score if exactly one answer was selected and it
+      is the correct one.
+    * SHORT_ANSWER: full score if an answer was given.
+"""
+from decimal import Decimal
+
+import numpy as np
+from django.db import transaction
+from django.dispatch import Signal
+from django.utils.timezone import now
+
+from .models import Quiz, Question, Take, TakeAnswer, TakeResult
+from .snapshot import build_quiz_snapshot, get_quiz_snapshot
+
+# Sent after a single take was graded, with the `take`, its `result`,
+# and `created` telling whether the take was graded for the first time.
+take_graded = Signal()
+
+# Sent after the results of many takes of a quiz changed at once, with
+# the `quiz_id`. Receivers should rebuild whatever they derive from
+# the quiz's results.
+quiz_regraded = Signal()
+
+
+def is_correct_answer(question_type, selected, correct_selected):
+    """
+    Return whether a question was answered correctly.
+
+    Args:
+        question_type (int): The type of the question.
+        selected (int): How many answers were selected.
+        correct_selected (int): How many of them are correct.
+
+    Returns:
+        bool: True if the question earns its score.
+    """
+    if selected == 0:
+        return False
+    if question_type == Question.MULTIPLE_CHOICE:
+        return selected == correct_selected
+    if question_type == Question.TRUE_FALSE:
+        return selected == 1 and correct_selected == 1
+    if question_type == Question.SHORT_ANSWER:
+        return True
+    return False
+
+
+def build_breakdown(quiz, selections):
+    """
+    Grade a set of selections against the answer key of a quiz.
+
+    Args:
+        quiz (QuizSnapshot): The quiz being graded.
+        selections (iterable): `(answer_id, content)` pairs of the
+            attempt.
+
+    Returns:
+        tuple: The total earned score and the per-question breakdown.
+    """
+    selected_by_question = {}
+    for answer_id, content in selections:
+        question_id = quiz.answer_questions.get(answer_id)
+        if question_id is not None:
+            selected_by_question.setdefault(question_id, []).append((answer_id, content))
+
+    total = Decimal('0.00')
+    breakdown = []
+    for question in quiz.questions:
+        selected = selected_by_question.get(question.id, [])
+        answer_ids = sorted(answer_id for answer_id, _ in selected)
+        correct = quiz.answer_key[question.id]
+        is_correct = is_correct_answer(
+            question.type,
+            len(answer_ids),
+            sum(1 for answer_id in answer_ids if answer_id in correct)
+        )
+        earned = Decimal(question.score) if is_correct else Decimal('0.00')
+        total += earned
+        breakdown.append({
+            'question': question.id,
+            'answers': answer_ids,
+            'text': next((content for _, content in selected if content), None),
+            'correct': is_correct,
+            'earned': str(earned),
+        })
+    return total, breakdown
+
+
+def grade_take(take, quiz=None):
+    """
+    Grade a quiz attempt and persist its result.
+
+    Args:
+        take (Take): The attempt to grade.
+        quiz (QuizSnapshot): The snapshot of the attempt's quiz, if
+            the caller already has it.
+
+    Returns:
+        TakeResult: The stored result.
+    """
+    if quiz is None:
+        quiz = get_quiz_snapshot(take.quiz_id)
+    selections = TakeAnswer.objects.filter(take=take).values_list('answer_id', 'content')
+    total, breakdown = build_breakdown(quiz, selections)
+
+    with transaction.atomic():
+        result, created = TakeResult.objects.update_or_create(
+            take=take,
+            defaults={
+                'score': total,
+                'max_score': quiz.score,
+                'total_questions': quiz.total_questions,
+                'breakdown': breakdown,
+            }
+        )
+        if take.score != total:
+            take.score = total
+            take.save(update_fields=['score'])
+        take_graded.send(sender=Take, take=take, result=result, created=created)
+    return result
+
+
+def finish_take(take, quiz=None):
+    """
+    Mark a quiz attempt as finished and grade it.
+
+    Args:
+        take (Take): The attempt to finish.
+        quiz (QuizSnapshot): The snapshot of the attempt's quiz, if
+            the caller already has it.
+
+    Returns:
+        TakeResult: The stored result.
+    """
+    with transaction.atomic():
+        # A timed attempt never lasts longer than its time limit
+        take.finished_at = now()
+        if take.deadline and take.deadline < take.finished_at:
+            take.finished_at = take.deadline
+        take.save(update_fields=['finished_at'])
+        return grade_take(take, quiz)
+
+
+def _cents(value):
+    return int((Decimal(value) * 100).to_integral_value())
+
+
+def _from_cents(cents):
+    return Decimal(int(cents)).scaleb(-2)
+
+
+def correctness_matrix(quiz, take_ids, rows):
+    """
+    Decide which questions many attempts of a quiz answered correctly.
+
+    Args:
+        quiz (QuizSnapshot): The quiz being graded.
+        take_ids (numpy.ndarray): Sorted ids of the attempts.
+        rows (numpy.ndarray): An `(n, 2)` array of `(take_id,
+            answer_id)` selections of those attempts.
+
+    Returns:
+        numpy.ndarray: A boolean `takes x questions` matrix.
+    """
+    n_takes, n_questions = len(take_ids), quiz.total_questions
+    question_types = np.array([q.type for q in quiz.questions], dtype=np.int64)
+
+    # Answer id -> (question index, is correct), as sorted lookup arrays
+    answer_ids = np.array(sorted(quiz.answer_questions), dtype=np.int64)
+    question_index = {q.id: i for i, q in enumerate(quiz.questions)}
+    answer_question = np.array(
+        [question_index[quiz.answer_questions[a]] for a in answer_ids],
+        dtype=np.int64
+    )
+    answer_correct = np.array(
+        [a in quiz.answer_key[quiz.answer_questions[a]] for a in answer_ids],
+        dtype=np.int64
+    )
+
+    selected = np.zeros(n_takes * n_questions, dtype=np.int64)
+    correct_selected = np.zeros(n_takes * n_questions, dtype=np.int64)
+    if len(rows) and len(answer_ids):
+        take_pos = np.searchsorted(take_ids, rows[:, 0])
+        answer_pos = np.searchsorted(answer_ids, rows[:, 1])
+        # Drop selections of other takes or of answers no longer in the quiz
+        take_pos = np.minimum(take_pos, n_takes - 1)
+        answer_pos = np.minimum(answer_pos, len(answer_ids) - 1)
+        known = (take_ids[take_pos] == rows[:, 0]) & (answer_ids[answer_pos] == rows[:, 1])
+        take_pos, answer_pos = take_pos[known], answer_pos[known]
+
+        cells = take_pos * n_questions + answer_question[answer_pos]
+        size = n_takes * n_questions
+        selected = np.bincount(cells, minlength=size)
+        correct_selected = np.bincount(cells, weights=answer_correct[answer_pos], minlength=size).astype(np.int64)
+
+    selected = selected.reshape(n_takes, n_questions)
+    correct_selected = correct_selected.reshape(n_takes, n_questions)
+
+    # The same rules as `is_correct_answer`, applied column-wise
+    answered = selected > 0
+    return np.select(
+        [
+            question_types == Question.MULTIPLE_CHOICE,
+            question_types == Question.TRUE_FALSE,
+            question_types == Question.SHORT_ANSWER,
+        ],
+        [
+            answered & (selected == correct_selected),
+            (selected == 1) & (correct_selected == 1),
+            answered,
+        ],
+        default=False
+    )
+
+
+def grade_matrix(quiz, take_ids, rows):
+    """
+    Score many attempts of a quiz at once.
+
+    Args:
+        quiz (QuizSnapshot): The quiz being graded.
+        take_ids (numpy.ndarray): Sorted ids of the attempts.
+        rows (numpy.ndarray): An `(n, 2)` array of `(take_id,
+            answer_id)` selections of those attempts.
+
+    Returns:
+        tuple: The boolean `takes x questions` correctness matrix and
+            the matching matrix of earned points, in cents.
+    """
+    correct = correctness_matrix(quiz, take_ids, rows)
+    question_cents = np.array([_cents(q.score) for q in quiz.questions], dtype=np.int64)
+    return correct, correct * question_cents
+
+
+def load_selections(quiz_id, take_ids=None):
+    """
+    Load every finished attempt of a quiz together with its selections.
+
+    Args:
+        quiz_id (int): The id of the quiz.
+        take_ids (list): Only load these attempts, if given.
+
+    Returns:
+        tuple: The sorted attempt ids and their current scores in cents
+            (both `numpy.ndarray`), the `(take_id, answer_id, content)`
+            selections (list), and an `(n, 2)` array with the
+            `(take_id, answer_id)` pairs of those selections.
+    """
+    takes = Take.objects.filter(quiz_id=quiz_id, finished_at__isnull=False)
+    selections = TakeAnswer.objects.filter(take__quiz_id=quiz_id, take__finished_at__isnull=False)
+    if take_ids is not None:
+        takes = takes.filter(id__in=take_ids)
+        selections = selections.filter(take_id__in=take_ids)
+
+    takes = np.array(
+        takes.order_by('id').values_list('id', 'score'),
+        dtype=object
+    ).reshape(-1, 2)
+    take_ids = takes[:, 0].astype(np.int64)
+    scores = np.array([_cents(score) for score in takes[:, 1]], dtype=np.int64)
+
+    selections = list(
+        selections.order_by('take_id', 'answer_id')
+        .values_list('take_id', 'answer_id', 'content')
+    )
+    rows = np.array(
+        [(take_id, answer_id) for take_id, answer_id, _ in selections],
+        dtype=np.int64
+    ).reshape(-1, 2)
+    return take_ids, scores, selections, rows
+
+
+def regrade_quiz(quiz_id, chunk_size=1000, take_ids=None, notify=True):
+    """
+    Regrade every finished attempt of a quiz against its current
+    answer key.
+
+    Selections are loaded as NumPy arrays and all attempts are scored
+    at once with `grade_matrix`. Changed scores are written back to
+    `Take` with `bulk_update`, and every `TakeResult` is rewritten in
+    chunks so that the per-question breakdown matches the new key.
+
+    Args:
+        quiz_id (int): The id of the quiz to regrade.
+        chunk_size (int): How many rows to write per query.
+        take_ids (list): Only grade these finished attempts, e.g. a
+            batch that was just finalized, if given.
+        notify (bool): Send `quiz_regraded`, which rebuilds the quiz's
+            statistics, leaderboards and distribution. Callers grading
+            a quiz in several calls send it once at the end instead.
+
+    Returns:
+        tuple: The number of regraded attempts and the number of
+            attempts whose score changed.
+    """
+    # Grade against the database, not a possibly stale cached snapshot
+    quiz = build_quiz_snapshot(quiz_id)
+
+    take_ids, old_scores, selections, rows = load_selections(quiz_id, take_ids)
+
+    correct, earned = grade_matrix(quiz, take_ids, rows)
+    new_scores = earned.sum(axis=1)
+    changed = np.flatnonzero(new_scores != old_scores)
+
+    # Group the selections of every take by question for the breakdowns
+    answers_by_take = {}
+    texts_by_take = {}
+    for take_id, answer_id, content in selections:
+        question_id = quiz.answer_questions.get(answer_id)
+        if question_id is None:
+            continue
+        answers_by_take.setdefault((take_id, question_id), []).append(answer_id)
+        if content:
+            texts_by_take.setdefault((take_id, question_id), content)
+
+    max_score = Decimal(quiz.score)
+    results = []
+    for i, take_id in enumerate(take_ids.tolist()):
+        breakdown = [
+            {
+                'question': question.id,
+                'answers': answers_by_take.get((take_id, question.id), []),
+                'text': texts_by_take.get((take_id, question.id)),
+                'correct': bool(is_correct),
+                'earned': str(_from_cents(cents)),
+            }
+            for question, is_correct, cents in zip(quiz.questions, correct[i], earned[i])
+        ]
+        results.append(TakeResult(
+            take_id=take_id,
+            score=_from_cents(new_scores[i]),
+            max_score=max_score,
+            total_questions=quiz.total_questions,
+            breakdown=breakdown,
+        ))
+
+    changed_takes = [
+        Take(id=int(take_ids[i]), score=_from_cents(new_scores[i]))
+        for i in changed
+    ]
+
+    with transaction.atomic():
+        Take.objects.bulk_update(changed_takes, ['score'], batch_size=chunk_size)
+        TakeResult.objects.bulk_create(
+            results,
+            batch_size=chunk_size,
+            update_conflicts=True,
+            unique_fields=['take'],
+            update_fields=['score', 'max_score', 'total_questions', 'breakdown', 'graded_at'],
+        )
+    if notify:
+        quiz_regraded.send(sender=Quiz, quiz_id=quiz_id)
+    return len(take_ids), len(changed_takes)
@@ -0,0 +1,206 @@
+"""
+Item analysis of quiz questions.
+
+For every quiz we keep the sufficient statistics of its takes x
+questions correctness matrix in `QuizStatistics`,
+`QuestionStatistics` and `AnswerStatistics`. From those the classic
+item statistics are derived on demand, in O(questions):
+
+    * difficulty: the share of takes that answered a question
+      correctly (the item p-value).
+    * discrimination: the point-biserial correlation between answering
+      a question correctly and the take's total.
+    * distractor rates: the share of takes that selected each answer.
+    * Cronbach's alpha of the whole quiz (KR-20 for these binary
+      items).
+
+A take's total is the number of questions it answered correctly.
+"""
+import math
+
+import numpy as np
+from django.db import transaction
+from django.db.models import F
+
+from .grading import correctness_matrix, load_selections
+from .models import QuizStatistics, QuestionStatistics, AnswerStatistics
+from .snapshot import build_quiz_snapshot, get_quiz_snapshot
+
+
+def rebuild_quiz_statistics(quiz_id, chunk_size=1000):
+    """
+    Recompute the statistics of a quiz from all of its finished takes.
+
+    The correctness matrix of all takes is built at once with NumPy,
+    so this stays fast for quizzes with tens of thousands of takes.
+
+    Args:
+        quiz_id (int): The id of the quiz.
+        chunk_size (int): How many rows to write per query.
+    """
+    quiz = build_quiz_snapshot(quiz_id)
+    take_ids, _, _, rows = load_selections(quiz_id)
+    correct = correctness_matrix(quiz, take_ids, rows).astype(np.int64)
+
+    totals = correct.sum(axis=1)
+    question_correct = correct.sum(axis=0)
+    question_total_sums = correct.T @ totals
+
+    answer_ids = sorted(quiz.answer_questions)
+    selected_ids, selected_counts = np.unique(rows[:, 1], return_counts=True)
+    selected = dict(zip(selected_ids.tolist(), selected_counts.tolist()))
+
+    with transaction.atomic():
+        QuizStatistics.objects.update_or_create(
+            quiz_id=quiz_id,
+            defaults={
+                'takes': len(take_ids),
+                'total_sum': int(totals.sum()),
+                'total_square_sum': int((totals ** 2).sum()),
+            }
+        )
+        QuestionStatistics.objects.bulk_create(
+            [
+                QuestionStatistics(
+                    question_id=question.id,
+                    quiz_id=quiz_id,
+                    attempts=len(take_ids),
+                    correct=int(question_correct[i]),
+                    correct_total_sum=int(question_total_sums[i]),
+                )
+                for i, question in enumerate(quiz.questions)
+            ],
+            batch_size=chunk_size,
+            update_conflicts=True,
+            unique_fields=['question'],
+            update_fields=['quiz', 'attempts', 'correct', 'correct_total_sum'],
+        )
+        AnswerStatistics.objects.bulk_create(
+            [
+                AnswerStatistics(
+                    answer_id=answer_id,
+                    question_id=quiz.answer_questions[answer_id],
+                    selected=selected.get(answer_id, 0),
+                )
+                for answer_id in answer_ids
+            ],
+            batch_size=chunk_size,
+            update_conflicts=True,
+            unique_fields=['answer'],
+            update_fields=['question', 'selected'],
+        )
+
+
+def record_take(result):
+    """
+    Add a newly graded take to the statistics of its quiz.
+
+    This is a handful of single-statement updates, independent of the
+    number of takes already counted. A quiz without statistics yet is
+    rebuilt from scratch instead.
+
+    Args:
+        result (TakeResult): The result of the take.
+    """
+    quiz_id = result.take.quiz_id
+    correct_ids = [entry['question'] for entry in result.breakdown if entry.get('correct')]
+    answer_ids = [answer_id for entry in result.breakdown for answer_id in entry['answers']]
+    total = len(correct_ids)
+
+    with transaction.atomic():
+        updated = QuizStatistics.objects.filter(quiz_id=quiz_id).update(
+            takes=F('takes') + 1,
+            total_sum=F('total_sum') + total,
+            total_square_sum=F('total_square_sum') + total * total,
+        )
+        if not updated:
+            rebuild_quiz_statistics(quiz_id)
+            return
+        QuestionStatistics.objects.filter(
+            question_id__in=[entry['question'] for entry in result.breakdown]
+        ).update(attempts=F('attempts') + 1)
+        QuestionStatistics.objects.filter(question_id__in=correct_ids).update(
+            correct=F('correct') + 1,
+            correct_total_sum=F('correct_total_sum') + total,
+        )
+        AnswerStatistics.objects.filter(answer_id__in=answer_ids).update(
+            selected=F('selected') + 1
+        )
+
+
+def _nan_to_none(value):
+    return None if math.isnan(value) else float(value)
+
+
+def analyze_quiz(quiz_id):
+    """
+    Derive the item statistics of a quiz from its stored totals.
+
+    Args:
+        quiz_id (int): The id of the quiz.
+
+    Returns:
+        dict: The number of `takes`, the quiz's `alpha`, and one entry
+            per question under `questions`, each with its `question`
+            snapshot, `difficulty`, `discrimination` and a list of
+            `(answer, selection rate)` pairs under `answers`. Values
+            that are undefined (e.g. no takes yet) are None.
+    """
+    quiz = get_quiz_snapshot(quiz_id)
+    quiz_stats = QuizStatistics.objects.filter(quiz_id=quiz_id).first()
+    question_stats = {
+        s.question_id: s for s in QuestionStatistics.objects.filter(quiz_id=quiz_id)
+    }
+    answer_selected = dict(
+        AnswerStatistics.objects.filter(question__quiz_id=quiz_id)
+        .values_list('answer_id', 'selected')
+    )
+
+    n = quiz_stats.takes if quiz_stats else 0
+    attempts = np.array(
+        [getattr(question_stats.get(q.id), 'attempts', 0) for q in quiz.questions],
+        dtype=float
+    )
+    correct = np.array(
+        [getattr(question_stats.get(q.id), 'correct', 0) for q in quiz.questions],
+        dtype=float
+    )
+    correct_sums = np.array(
+        [getattr(question_stats.get(q.id), 'correct_total_sum', 0) for q in quiz.questions],
+        dtype=float
+    )
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = quiz_stats.total_sum / n if n else math.nan
+        variance = quiz_stats.total_square_sum / n - mean ** 2 if n else math.nan
+        difficulty = correct / attempts
+        correct_mean = correct_sums / correct
+        discrimination = (
+            (correct_mean - mean) / math.sqrt(variance)
+            * np.sqrt(difficulty / (1 - difficulty))
+        ) if variance > 0 else np.full(len(attempts), math.nan)
+        discrimination[(difficulty <= 0) | (difficulty >= 1)] = math.nan
+
+    answered = attempts > 0
+    k = int(answered.sum())
+    alpha = None
+    if k > 1 and variance > 0:
+        item_variance = (difficulty[answered] * (1 - difficulty[answered])).sum()
+        alpha = float(k / (k - 1) * (1 - item_variance / variance))
+
+    questions = []
+    for i, question in enumerate(quiz.questions):
+        questions.append({
+            'question': question,
+            'difficulty': _nan_to_none(difficulty[i]),
+            'discrimination': _nan_to_none(discrimination[i]),
+            'answers': [
+                (
+                    answer,
+                    answer_selected.get(answer.id, 0) / attempts[i] if attempts[i] else None
+                )
+                for answer in question.answers
+            ],
+        })
+
+    return {'takes': n, 'alpha': alpha, 'questions': questions}
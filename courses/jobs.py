@@ -0,0 +1,12 @@
+"""
+Periodic jobs of the courses app, run by `core.scheduler`.
+"""
+from core.scheduler import every
+
+from .deadlines import finalize_expired_takes
+from .publishing import publish_due_quizzes
+from .uploads import discard_stale_uploads
+
+every(30, name='publish_due_quizzes')(publish_due_quizzes)
+every(30, name='finalize_expired_takes')(finalize_expired_takes)
+every(60 * 60, name='discard_stale_uploads')(discard_stale_uploads)
@@ -0,0 +1,222 @@
+"""
+Per-quiz and per-course leaderboards.
+
+A leaderboard is a sorted list of `(-score, duration, user_id)` keys,
+so the best score comes first and ties go to the faster user. It is
+kept in the shared cache and patched in place whenever a take is
+graded, which makes top-N a slice and "my rank" a binary search. The
+`LeaderboardEntry` table holds the same data for cold starts.
+
+A quiz board ranks users by their take of the quiz. A course board
+ranks them by the sum of their scores (and durations) over all the
+quizzes of the course.
+"""
+from bisect import bisect_left, insort
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+
+from .caching import patch_cached
+from .models import LeaderboardEntry, Take
+from .snapshot import get_quiz_snapshot
+
+# Lifetime of a cached leaderboard. Boards are patched in place, the
+# timeout only bounds how long a board can drift from the database.
+LEADERBOARD_TIMEOUT = 60 * 60
+
+
+def quiz_board(quiz_id):
+    return f"quiz:{quiz_id}"
+
+
+def course_board(course_id):
+    return f"course:{course_id}"
+
+
+def _cache_key(board):
+    return f"leaderboard:{board}"
+
+
+def _key(user_id, score, duration):
+    return (-int(Decimal(score) * 100), duration // timedelta(milliseconds=1), user_id)
+
+
+class Leaderboard:
+    """
+    A sorted leaderboard.
+
+    Attributes:
+        board (str): The board name.
+        keys (list): The sorted `(-score cents, duration ms, user_id)`
+            keys.
+        users (dict): Maps user ids to their key.
+    """
+
+    def __init__(self, board, entries=()):
+        self.board = board
+        self.users = {user_id: _key(user_id, score, duration) for user_id, score, duration in entries}
+        self.keys = sorted(self.users.values())
+
+    def __len__(self):
+        return len(self.keys)
+
+    def set(self, user_id, score, duration):
+        """
+        Insert or move a user on the board.
+        """
+        self.remove(user_id)
+        key = _key(user_id, score, duration)
+        insort(self.keys, key)
+        self.users[user_id] = key
+
+    def remove(self, user_id):
+        """
+        Take a user off the board, if present.
+        """
+        key = self.users.pop(user_id, None)
+        if key is not None:
+            del self.keys[bisect_left(self.keys, key)]
+
+    def rank(self, user_id):
+        """
+        Return the 1-based rank of a user, or None if not on the board.
+        """
+        key = self.users.get(user_id)
+        if key is None:
+            return None
+        return bisect_left(self.keys, key) + 1
+
+    def top(self, n=10):
+        """
+        Return the best `n` entries as `(rank, user_id, score, duration)`
+        tuples.
+        """
+        return [
+            (rank, user_id, Decimal(-cents).scaleb(-2), timedelta(milliseconds=ms))
+            for rank, (cents, ms, user_id) in enumerate(self.keys[:n], start=1)
+        ]
+
+
+def load_leaderboard(board):
+    """
+    Return a leaderboard from the cache, loading it from the database
+    on a miss.
+    """
+    leaderboard = cache.get(_cache_key(board))
+    if leaderboard is None:
+        leaderboard = Leaderboard(
+            board,
+            LeaderboardEntry.objects.filter(board=board).values_list('user_id', 'score', 'duration')
+        )
+        cache.set(_cache_key(board), leaderboard, LEADERBOARD_TIMEOUT)
+    return leaderboard
+
+
+def _set_entry(board, user_id, score, duration):
+    LeaderboardEntry.objects.update_or_create(
+        board=board,
+        user_id=user_id,
+        defaults={'score': score, 'duration': duration}
+    )
+    transaction.on_commit(lambda: patch_cached(
+        _cache_key(board),
+        lambda leaderboard: leaderboard.set(user_id, score, duration),
+        LEADERBOARD_TIMEOUT
+    ))
+
+
+def update_for_take(take):
+    """
+    Update the quiz and course boards of a finished, graded take.
+
+    Args:
+        take (Take): The graded take.
+    """
+    duration = take.duration()
+    if duration is None:
+        return
+    _set_entry(quiz_board(take.quiz_id), take.user_id, take.score, duration)
+
+    # Course standing of the user over every quiz of the course
+    course_id = get_quiz_snapshot(take.quiz_id).course_id
+    takes = Take.objects.filter(
+        user_id=take.user_id,
+        quiz__course_id=course_id,
+        finished_at__isnull=False
+    ).values_list('score', 'created_at', 'finished_at')
+    score = sum((score for score, _, _ in takes), Decimal('0.00'))
+    total_duration = sum((finished - started for _, started, finished in takes), timedelta())
+    _set_entry(course_board(course_id), take.user_id, score, total_duration)
+
+
+def _write_board(board, entries):
+    """
+    Replace the rows and the cached copy of a board.
+    """
+    with transaction.atomic():
+        LeaderboardEntry.objects.filter(board=board).delete()
+        LeaderboardEntry.objects.bulk_create(
+            [
+                LeaderboardEntry(board=board, user_id=user_id, score=score, duration=duration)
+                for user_id, score, duration in entries
+            ],
+            batch_size=1000
+        )
+    cache.set(_cache_key(board), Leaderboard(board, entries), LEADERBOARD_TIMEOUT)
+
+
+def rebuild_quiz_leaderboards(quiz_id, course_id):
+    """
+    Rebuild the board of a quiz and of its course from the takes, e.g.
+    after a regrade.
+
+    Args:
+        quiz_id (int): The id of the quiz.
+        course_id (int): The id of the quiz's course.
+    """
+    _write_board(quiz_board(quiz_id), [
+        (user_id, score, finished - started)
+        for user_id, score, started, finished in Take.objects.filter(
+            quiz_id=quiz_id,
+            finished_at__isnull=False
+        ).values_list('user_id', 'score', 'created_at', 'finished_at')
+    ])
+
+    standings = {}
+    for user_id, score, started, finished in Take.objects.filter(
+        quiz__course_id=course_id,
+        finished_at__isnull=False
+    ).values_list('user_id', 'score', 'created_at', 'finished_at'):
+        total, duration = standings.get(user_id, (Decimal('0.00'), timedelta()))
+        standings[user_id] = (total + score, duration + (finished - started))
+    _write_board(course_board(course_id), [
+        (user_id, score, duration) for user_id, (score, duration) in standings.items()
+    ])
+
+
+def leaderboard_context(board, user, n=10):
+    """
+    Return the top `n` entries of a board with their usernames, and
+    the rank of the given user.
+
+    Returns:
+        dict: `entries` as `(rank, username, score, duration)` tuples,
+            `my_rank`, and the board `size`.
+    """
+    leaderboard = load_leaderboard(board)
+    top = leaderboard.top(n)
+    usernames = dict(
+        User.objects.filter(id__in=[user_id for _, user_id, _, _ in top])
+        .values_list('id', 'username')
+    )
+    return {
+        'entries': [
+            (rank, usernames.get(user_id, ''), score, duration)
+            for rank, user_id, score, duration in top
+        ],
+        'my_rank': leaderboard.rank(user.id),
+        'size': len(leaderboard),
+    }
@@ -0,0 +1,65 @@
+"""
+Cached quiz listings of courses.
+
+The published quizzes of a course are cached under a key that carries
+a single listing version. Saving or deleting a quiz, or publishing a
+batch of scheduled quizzes, moves every listing to a new version with
+one cache write, so stale listings are never served and never need to
+be deleted one by one.
+"""
+import time
+
+from django.core.cache import cache
+
+from .models import Quiz
+
+# Lifetime of a cached listing. Versions keep listings fresh; the
+# timeout only bounds memory held by old versions.
+LISTING_TIMEOUT = 60 * 60
+
+_VERSION_KEY = 'course_listing_version'
+
+
+def get_course_listing_version():
+    """
+    Return the current version of the course listings.
+    """
+    version = cache.get(_VERSION_KEY)
+    if version is None:
+        version = str(time.time_ns())
+        if not cache.add(_VERSION_KEY, version, None):
+            version = cache.get(_VERSION_KEY, version)
+    return version
+
+
+def bump_course_listing_version():
+    """
+    Invalidate every cached course listing at once.
+    """
+    cache.set(_VERSION_KEY, str(time.time_ns()), None)
+
+
+def get_course_quizzes(course_id):
+    """
+    Return the published quizzes of a course, in creation order.
+
+    Quizzes that are published but open later are included; callers
+    compare `published_at` with the current time.
+
+    Args:
+        course_id (int): The id of the course.
+
+    Returns:
+        list: One dict per quiz with its `id`, `title`, `summary` and
+            `published_at`.
+    """
+    key = f"course_quizzes:{course_id}:{get_course_listing_version()}"
+    quizzes = cache.get(key)
+    if quizzes is None:
+        quizzes = list(
+            Quiz.objects.filter(course_id=course_id, published=True)
+            .order_by('id')
+            .values('id', 'title', 'summary', 'published_at')
+        )
+        cache.set(key, quizzes, LISTING_TIMEOUT)
+    return quizzes
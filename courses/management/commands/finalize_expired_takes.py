@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand
+from courses.deadlines import finalize_expired_takes
+
+class Command(BaseCommand):
+    """
+    Custom management command to finish and grade the attempts of
+    timed quizzes that ran out of time.
+
+    Usage:
+        python manage.py finalize_expired_takes [--loop] [--interval 30]
+    """
+    help = 'Finish and grade timed quiz attempts that are past their deadline'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of attempts finalized per batch.'
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep running, checking for expired attempts every interval.'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=30,
+            help='Seconds between checks when running with --loop.'
+        )
+
+    def handle(self, *args, **options):
+        """
+        Finalizes expired attempts once, or repeatedly with --loop.
+        """
+        while True:
+            finalized = finalize_expired_takes(batch_size=options['batch_size'])
+            if finalized or not options['loop']:
+                self.stdout.write(
+                    self.style.SUCCESS(f"Finalized {finalized} expired takes.")
+                )
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
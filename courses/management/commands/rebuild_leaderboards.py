@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from courses.leaderboards import rebuild_quiz_leaderboards
+from courses.models import Quiz
+
+class Command(BaseCommand):
+    """
+    Custom management command to rebuild the quiz and course
+    leaderboards from the stored takes, e.g. for takes finished before
+    leaderboards existed.
+
+    Usage:
+        python manage.py rebuild_leaderboards [<quiz_id> ...]
+    """
+    help = 'Rebuild quiz and course leaderboards'
+
+    def add_arguments(self, parser):
+        parser.add_argument('quiz_ids', nargs='*', type=int)
+
+    def handle(self, *args, **options):
+        """
+        Rebuilds the boards of the given quizzes, or of every quiz.
+        """
+        quizzes = Quiz.objects.all()
+        if options['quiz_ids']:
+            quizzes = quizzes.filter(id__in=options['quiz_ids'])
+        count = 0
+        for quiz_id, course_id in quizzes.values_list('id', 'course_id'):
+            rebuild_quiz_leaderboards(quiz_id, course_id)
+            count += 1
+        self.stdout.write(
+            self.style.SUCCESS(f'Rebuilt the leaderboards of {count} quizzes.')
+        )
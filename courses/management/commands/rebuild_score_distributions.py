@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from courses.distributions import rebuild_distribution
+from courses.models import Quiz
+
+class Command(BaseCommand):
+    """
+    Custom management command to rebuild the cached score
+    distributions of quizzes from their finished takes.
+
+    Usage:
+        python manage.py rebuild_score_distributions [<quiz_id> ...]
+    """
+    help = 'Rebuild quiz score distributions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('quiz_ids', nargs='*', type=int)
+
+    def handle(self, *args, **options):
+        """
+        Rebuilds the distributions of the given quizzes, or of every
+        quiz.
+        """
+        quiz_ids = options['quiz_ids'] or Quiz.objects.values_list('id', flat=True)
+        count = 0
+        for quiz_id in quiz_ids:
+            rebuild_distribution(quiz_id)
+            count += 1
+        self.stdout.write(
+            self.style.SUCCESS(f'Rebuilt the score distributions of {count} quizzes.')
+        )
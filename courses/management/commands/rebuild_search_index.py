@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from courses.search import rebuild_search_index
+
+class Command(BaseCommand):
+    """
+    Custom management command to refill the full-text search index of
+    courses and lessons.
+
+    Usage:
+        python manage.py rebuild_search_index
+    """
+    help = 'Rebuild the full-text search index of courses and lessons'
+
+    def handle(self, *args, **options):
+        """
+        Rebuilds the index, or fails if the database has none.
+        """
+        if not rebuild_search_index():
+            raise CommandError(
+                "This database has no full-text index; searches use substring matching."
+            )
+        self.stdout.write(self.style.SUCCESS("Rebuilt the course search index."))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from courses.course_stats import reconcile_course_stats
+
+class Command(BaseCommand):
+    """
+    Custom management command to recompute the denormalized counters of
+    every course and repair the ones that drifted.
+
+    Usage:
+        python manage.py reconcile_course_stats [--chunk-size 500]
+    """
+    help = 'Recompute the course counters and repair any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='How many courses to recompute at a time.'
+        )
+
+    def handle(self, *args, **options):
+        """
+        Recomputes the counters and reports how many were repaired.
+        """
+        checked, repaired = reconcile_course_stats(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Checked {checked} courses, repaired {repaired}."
+        ))
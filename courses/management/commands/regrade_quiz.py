@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from courses.grading import regrade_quiz
+from courses.models import Quiz
+
+class Command(BaseCommand):
+    """
+    Custom management command to regrade every finished attempt of a
+    quiz after its answer key changed.
+
+    Usage:
+        python manage.py regrade_quiz <quiz_id> [<quiz_id> ...]
+    """
+    help = 'Regrade all finished attempts of one or more quizzes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('quiz_ids', nargs='+', type=int)
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Number of rows written per query.'
+        )
+
+    def handle(self, *args, **options):
+        """
+        Regrades each quiz and reports how many scores changed.
+        """
+        for quiz_id in options['quiz_ids']:
+            if not Quiz.objects.filter(id=quiz_id).exists():
+                raise CommandError(f"Quiz {quiz_id} does not exist.")
+            graded, changed = regrade_quiz(quiz_id, chunk_size=options['chunk_size'])
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Quiz {quiz_id}: regraded {graded} takes, {changed} scores changed."
+                )
+            )
@@ -0,0 +1,50 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0007_create_test_quiz_attempt'),
+    ]
+
+    operations = [
+        # Create the TakeResult table
+        migrations.CreateModel(
+            name='TakeResult',
+            fields=[
+                ('take', models.OneToOneField(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    primary_key=True,
+                    related_name='result',
+                    serialize=False,
+                    to='courses.take',
+                    verbose_name='Quiz Attempt'
+                )),
+                ('score', models.DecimalField(
+                    decimal_places=2,
+                    default=0.0,
+                    max_digits=5,
+                    verbose_name='Score'
+                )),
+                ('max_score', models.DecimalField(
+                    decimal_places=2,
+                    default=0.0,
+                    max_digits=5,
+                    verbose_name='Maximum Score'
+                )),
+                ('total_questions', models.PositiveIntegerField(
+                    default=0,
+                    verbose_name='Total Questions'
+                )),
+                ('breakdown', models.JSONField(
+                    default=list,
+                    verbose_name='Per Question Breakdown'
+                )),
+                ('graded_at', models.DateTimeField(
+                    auto_now=True,
+                    verbose_name='Graded At'
+                )),
+            ],
+        ),
+    ]
@@ -0,0 +1,85 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0008_takeresult'),
+    ]
+
+    operations = [
+        # Create the QuizStatistics table
+        migrations.CreateModel(
+            name='QuizStatistics',
+            fields=[
+                ('quiz', models.OneToOneField(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    primary_key=True,
+                    related_name='statistics',
+                    serialize=False,
+                    to='courses.quiz',
+                    verbose_name='Quiz'
+                )),
+                ('takes', models.PositiveIntegerField(default=0, verbose_name='Takes')),
+                ('total_sum', models.BigIntegerField(default=0, verbose_name='Sum of Totals')),
+                ('total_square_sum', models.BigIntegerField(default=0, verbose_name='Sum of Squared Totals')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Updated At')),
+            ],
+            options={
+                'verbose_name_plural': 'Quiz statistics',
+            },
+        ),
+
+        # Create the QuestionStatistics table
+        migrations.CreateModel(
+            name='QuestionStatistics',
+            fields=[
+                ('question', models.OneToOneField(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    primary_key=True,
+                    related_name='statistics',
+                    serialize=False,
+                    to='courses.question',
+                    verbose_name='Question'
+                )),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Attempts')),
+                ('correct', models.PositiveIntegerField(default=0, verbose_name='Correct')),
+                ('correct_total_sum', models.BigIntegerField(default=0, verbose_name='Sum of Totals When Correct')),
+                ('quiz', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    related_name='question_statistics',
+                    to='courses.quiz',
+                    verbose_name='Quiz'
+                )),
+            ],
+            options={
+                'verbose_name_plural': 'Question statistics',
+            },
+        ),
+
+        # Create the AnswerStatistics table
+        migrations.CreateModel(
+            name='AnswerStatistics',
+            fields=[
+                ('answer', models.OneToOneField(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    primary_key=True,
+                    related_name='statistics',
+                    serialize=False,
+                    to='courses.answer',
+                    verbose_name='Answer'
+                )),
+                ('selected', models.PositiveIntegerField(default=0, verbose_name='Selected')),
+                ('question', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    related_name='answer_statistics',
+                    to='courses.question',
+                    verbose_name='Question'
+                )),
+            ],
+            options={
+                'verbose_name_plural': 'Answer statistics',
+            },
+        ),
+    ]
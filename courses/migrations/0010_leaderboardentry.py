@@ -0,0 +1,50 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0009_item_statistics'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # Create the LeaderboardEntry table
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.BigAutoField(
+                    auto_created=True,
+                    primary_key=True,
+                    serialize=False,
+                    verbose_name='ID'
+                )),
+                ('board', models.CharField(max_length=50, verbose_name='Leaderboard')),
+                ('score', models.DecimalField(
+                    decimal_places=2,
+                    default=0.0,
+                    max_digits=9,
+                    verbose_name='Score'
+                )),
+                ('duration', models.DurationField(verbose_name='Duration')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Updated At')),
+                ('user', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    related_name='leaderboard_entries',
+                    to=settings.AUTH_USER_MODEL,
+                    verbose_name='User'
+                )),
+            ],
+            options={
+                'verbose_name_plural': 'Leaderboard entries',
+                'constraints': [
+                    models.UniqueConstraint(
+                        fields=['board', 'user'],
+                        name='unique_board_user'
+                    )
+                ],
+            },
+        ),
+    ]
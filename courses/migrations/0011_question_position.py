@@ -0,0 +1,42 @@
+from django.db import migrations, models
+
+
+def number_questions(apps, schema_editor):
+    # Number the existing questions of every quiz in creation order
+    Question = apps.get_model('courses', 'Question')
+    questions = Question.objects.order_by('quiz_id', 'id').only('id', 'quiz_id')
+    positions = {}
+    changed = []
+    for question in questions:
+        question.position = positions[question.quiz_id] = positions.get(question.quiz_id, 0) + 1
+        changed.append(question)
+    Question.objects.bulk_update(changed, ['position'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0010_leaderboardentry'),
+    ]
+
+    operations = [
+        # Add the position of a question within its quiz
+        migrations.AddField(
+            model_name='question',
+            name='position',
+            field=models.PositiveIntegerField(
+                default=0,
+                verbose_name='Position',
+                help_text='Position of the question within its quiz. Leave 0 to add it at the end.'
+            ),
+        ),
+        migrations.AlterModelOptions(
+            name='question',
+            options={'ordering': ['quiz', 'position', 'id']},
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['quiz', 'position'], name='question_quiz_position_idx'),
+        ),
+        migrations.RunPython(number_questions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+import courses.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0011_question_position'),
+    ]
+
+    operations = [
+        # Per-attempt randomized question and answer order
+        migrations.AddField(
+            model_name='quiz',
+            name='shuffle_questions',
+            field=models.BooleanField(default=False, verbose_name='Shuffle Questions'),
+        ),
+        migrations.AddField(
+            model_name='quiz',
+            name='shuffle_answers',
+            field=models.BooleanField(default=False, verbose_name='Shuffle Answers'),
+        ),
+        migrations.AddField(
+            model_name='take',
+            name='seed',
+            field=models.PositiveIntegerField(
+                default=courses.models.random_seed,
+                verbose_name='Shuffle Seed'
+            ),
+        ),
+    ]
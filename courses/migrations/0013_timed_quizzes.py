@@ -0,0 +1,35 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0012_quiz_shuffle'),
+    ]
+
+    operations = [
+        # Time limit of a quiz and deadline of each attempt
+        migrations.AddField(
+            model_name='quiz',
+            name='time_limit',
+            field=models.DurationField(
+                blank=True,
+                null=True,
+                verbose_name='Time Limit',
+                help_text='How long an attempt may take, e.g. 00:45:00. Leave empty for no limit.'
+            ),
+        ),
+        migrations.AddField(
+            model_name='take',
+            name='deadline',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Deadline'),
+        ),
+        migrations.AddIndex(
+            model_name='take',
+            index=models.Index(
+                fields=['deadline'],
+                condition=models.Q(finished_at__isnull=True),
+                name='take_open_deadline_idx'
+            ),
+        ),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0013_timed_quizzes'),
+    ]
+
+    operations = [
+        # Scheduled publishing of quizzes
+        migrations.AddField(
+            model_name='quiz',
+            name='publish_at',
+            field=models.DateTimeField(
+                blank=True,
+                null=True,
+                verbose_name='Publish At',
+                help_text='Publish the quiz automatically at this time.'
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='quiz',
+            index=models.Index(
+                condition=models.Q(published=False),
+                fields=['publish_at'],
+                name='quiz_scheduled_publish_idx'
+            ),
+        ),
+    ]
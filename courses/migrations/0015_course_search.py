@@ -0,0 +1,65 @@
+from django.db import migrations
+from django.db.utils import OperationalError
+
+SEARCH_TABLE = 'courses_search'
+
+
+def create_search_table(apps, schema_editor):
+    # Full-text search needs SQLite with FTS5; other databases fall back
+    # to substring search.
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+                kind UNINDEXED,
+                object_id UNINDEXED,
+                course_id UNINDEXED,
+                title,
+                body,
+                teacher,
+                tokenize = 'unicode61 remove_diacritics 2'
+            )
+        """)
+    except OperationalError:
+        return
+
+    # Index the existing courses and lessons
+    Course = apps.get_model('courses', 'Course')
+    Lesson = apps.get_model('courses', 'Lesson')
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {SEARCH_TABLE} (kind, object_id, course_id, title, body, teacher) "
+            "VALUES ('course', %s, %s, %s, %s, %s)",
+            [
+                (course.id, course.id, course.title, course.description,
+                 f"{course.teacher.first_name} {course.teacher.last_name}".strip() or course.teacher.username)
+                for course in Course.objects.select_related('teacher')
+            ]
+        )
+        cursor.executemany(
+            f"INSERT INTO {SEARCH_TABLE} (kind, object_id, course_id, title, body, teacher) "
+            "VALUES ('lesson', %s, %s, %s, %s, '')",
+            [
+                (lesson.id, lesson.course_id, lesson.title, lesson.description)
+                for lesson in Lesson.objects.all()
+            ]
+        )
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0014_quiz_publish_at'),
+    ]
+
+    operations = [
+        # FTS5 index of courses and lessons
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
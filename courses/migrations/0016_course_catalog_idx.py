@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0015_course_search'),
+    ]
+
+    operations = [
+        # Keyset pagination of the course catalog
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['created_at', 'id'], name='course_catalog_idx'),
+        ),
+    ]
@@ -0,0 +1,66 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_course_stats(apps, schema_editor):
+    """
+    Count the enrollments, lessons and quizzes of existing courses.
+    Scores and activity are left to `reconcile_course_stats`.
+    """
+    Course = apps.get_model('courses', 'Course')
+    CourseStats = apps.get_model('courses', 'CourseStats')
+    courses = Course.objects.annotate(
+        num_enrollments=models.Count('enrollments', distinct=True),
+        num_lessons=models.Count('lessons', distinct=True),
+        num_quizzes=models.Count('quizzes', distinct=True),
+    )
+    CourseStats.objects.bulk_create(
+        [
+            CourseStats(
+                course_id=course.id,
+                enrollments=course.num_enrollments,
+                lessons=course.num_lessons,
+                quizzes=course.num_quizzes,
+            )
+            for course in courses.iterator()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0016_course_catalog_idx'),
+    ]
+
+    operations = [
+        # Denormalized counters of courses
+        migrations.CreateModel(
+            name='CourseStats',
+            fields=[
+                ('course', models.OneToOneField(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    primary_key=True,
+                    related_name='stats',
+                    serialize=False,
+                    to='courses.course',
+                    verbose_name='Course'
+                )),
+                ('enrollments', models.PositiveIntegerField(default=0, verbose_name='Enrollments')),
+                ('lessons', models.PositiveIntegerField(default=0, verbose_name='Lessons')),
+                ('quizzes', models.PositiveIntegerField(default=0, verbose_name='Quizzes')),
+                ('graded_takes', models.PositiveIntegerField(default=0, verbose_name='Graded Takes')),
+                ('score_percent_sum', models.FloatField(default=0, verbose_name='Sum of Score Percentages')),
+                ('last_activity_at', models.DateTimeField(blank=True, null=True, verbose_name='Last Activity')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Updated At')),
+            ],
+            options={
+                'verbose_name_plural': 'Course statistics',
+                'indexes': [
+                    models.Index(fields=['enrollments', 'course'], name='course_stats_popular_idx'),
+                ],
+            },
+        ),
+        migrations.RunPython(fill_course_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        ('courses', '0019_attachmentupload'),
+    ]
+
+    operations = [
+        # Course images and lesson attachments are stored by content
+        migrations.AlterField(
+            model_name='course',
+            name='image',
+            field=models.ImageField(blank=True, help_text='Optional images for the course.', null=True, storage=core.storage.ContentAddressedStorage(), upload_to='courses/'),
+        ),
+        migrations.AlterField(
+            model_name='lesson',
+            name='attachment',
+            field=models.FileField(blank=True, null=True, storage=core.storage.ContentAddressedStorage(), upload_to=''),
+        ),
+    ]
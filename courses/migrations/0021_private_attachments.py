@@ -0,0 +1,53 @@
+import core.storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.db import migrations, models
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+
+def move_attachments(apps, schema_editor):
+    """
+    Move the attachments stored under MEDIA_ROOT, content-addressed or
+    under their original names, to the private content storage, out of
+    reach of their public URLs.
+    """
+    Lesson = apps.get_model('courses', 'Lesson')
+    StoredFile = apps.get_model('core', 'StoredFile')
+    names = (
+        Lesson.objects.exclude(attachment__isnull=True).exclude(attachment='')
+        .exclude(attachment__startswith=core.storage.PRIVATE_PREFIX)
+        .values_list('attachment', flat=True).distinct()
+    )
+    for name in list(names):
+        try:
+            # The public content storage resolves any name in MEDIA_ROOT
+            file = core.storage.content_storage.open(name, 'rb')
+        except (FileNotFoundError, IsADirectoryError, SuspiciousFileOperation):
+            continue
+        with file:
+            new_name = core.storage.private_content_storage.save(name, file)
+        moved = Lesson.objects.filter(attachment=name).update(attachment=new_name)
+        StoredFile.objects.filter(name=new_name).update(references=F('references') + moved)
+        if core.storage.is_content_name(name):
+            # The public copy is collected once nothing else points at it
+            StoredFile.objects.filter(name=name).update(references=Greatest(F('references') - moved, 0))
+        else:
+            # Nothing else tracks a file stored under its original name
+            core.storage.content_storage.delete(name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0020_content_storage'),
+    ]
+
+    operations = [
+        # Lesson attachments have no public URL
+        migrations.AlterField(
+            model_name='lesson',
+            name='attachment',
+            field=models.FileField(blank=True, null=True, storage=core.storage.PrivateContentAddressedStorage(), upload_to=''),
+        ),
+        migrations.RunPython(move_attachments, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+from django.db import migrations
+
+SEARCH_TABLE = 'courses_search'
+
+
+def renumber_search_rows(apps, schema_editor):
+    # Give every row the rowid derived from its object (see
+    # courses.search.search_rowid): courses even, lessons odd
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [SEARCH_TABLE])
+        if cursor.fetchone() is None:
+            return
+        cursor.execute(
+            "CREATE TEMP TABLE courses_search_rows AS "
+            f"SELECT kind, object_id, course_id, title, body, teacher FROM {SEARCH_TABLE}"
+        )
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, kind, object_id, course_id, title, body, teacher) "
+            "SELECT object_id * 2 + (kind = 'lesson'), kind, object_id, course_id, title, body, teacher "
+            "FROM courses_search_rows"
+        )
+        cursor.execute("DROP TABLE courses_search_rows")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0021_private_attachments'),
+    ]
+
+    operations = [
+        # Rows are found by rowid, the only key FTS5 can seek on
+        migrations.RunPython(renumber_search_rows, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+from django.db import migrations, models
+
+
+def backfill_course_stats(apps, schema_editor):
+    """
+    Give every course its stats row, so the popular catalog ordering can
+    join the stats without an outer join. Counters are left to
+    `reconcile_course_stats`.
+    """
+    Course = apps.get_model('courses', 'Course')
+    CourseStats = apps.get_model('courses', 'CourseStats')
+    missing = Course.objects.filter(stats__isnull=True).annotate(
+        num_enrollments=models.Count('enrollments', distinct=True),
+        num_lessons=models.Count('lessons', distinct=True),
+        num_quizzes=models.Count('quizzes', distinct=True),
+    )
+    CourseStats.objects.bulk_create(
+        [
+            CourseStats(
+                course_id=course.id,
+                enrollments=course.num_enrollments,
+                lessons=course.num_lessons,
+                quizzes=course.num_quizzes,
+            )
+            for course in missing.iterator()
+        ],
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0022_search_rowids'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_course_stats, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,14 @@
-from django.db import models
+import secrets
+import uuid
+from datetime import timedelta
+
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.contrib.auth.hashers import make_password
 from django.utils.timezone import now
+from core.principal import get_roles
+from core.storage import content_storage, private_content_storage
 
 class Course(models.Model):
     """
@@ -27,6 +33,8 @@ class Course(models.Model):
             securely.
         student (ManytoManyField): A many-to-many relationship linking
             student (users) who are enrolled in the course.
+        image (ImageField): An optional image of the course.
+        image_variants (dict): The resized copies of the image.
     """
     title = models.CharField(max_length=200)
     description = models.TextField()
@@ -53,16 +61,25 @@ class Course(models.Model):
 
     image = models.ImageField(
         upload_to='courses/',
+        # Stored once per content (see core.storage)
+        storage=content_storage,
         null=True,
         blank=True,
         help_text="Optional images for the course."
     )
 
+    # Resized copies of the image (see core.images)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+
     class Meta:
         # Permissions for users to enroll in courses
         permissions = [
             ('enroll_in_course', 'Can enroll in course')
         ]
+        indexes = [
+            # Keyset pagination of the catalog
+            models.Index(fields=['created_at', 'id'], name='course_catalog_idx'),
+        ]
 
     def __str__(self):
         """
@@ -82,7 +99,7 @@ class Course(models.Model):
             ValidationError: If the teacher is not part of the 
             'Teacher' group.
         """
-        if not self.teacher.groups.filter(name="Teacher").exists():
+        if 'Teacher' not in get_roles(self.teacher):
             raise ValidationError(f"The user {self.teacher} is not in the 'Teacher' group.")
 
     def save(self, *args, **kwargs):
@@ -115,7 +132,7 @@ class Lesson(models.Model):
     """
     title = models.CharField(max_length=200)
     description = models.TextField(blank=True)
-    attachment = models.FileField(blank=True,null=True)
+    attachment = models.FileField(blank=True,null=True,storage=private_content_storage)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -128,6 +145,45 @@ class Lesson(models.Model):
     def __str__(self):
         return self.title
 
+class AttachmentUpload(models.Model):
+    """
+    A resumable upload of a lesson attachment, in progress.
+
+    The file is sent in chunks (see `courses.uploads`) and assembled in
+    a partial file. Once all `size` bytes have arrived and their
+    SHA-256 matches `sha256`, the file becomes the lesson's attachment
+    and the upload is deleted.
+
+    Attributes:
+        id (UUIDField): The public id of the upload, used in its URL.
+        lesson (ForeignKey): The lesson the file will be attached to.
+        uploaded_by (ForeignKey): The user sending the file.
+        filename (CharField): The name of the file being sent.
+        size (PositiveBigIntegerField): The length of the file, in bytes.
+        sha256 (CharField): The hex SHA-256 digest of the whole file.
+        offset (PositiveBigIntegerField): The number of bytes received.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    lesson = models.ForeignKey(
+        Lesson,
+        on_delete=models.CASCADE,
+        related_name='uploads'
+    )
+    uploaded_by = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='attachment_uploads'
+    )
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    sha256 = models.CharField(max_length=64)
+    offset = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size})"
+
 class Enrollment(models.Model):
     """
     Represents the enrollment of a student in a course.
@@ -181,12 +237,20 @@ class Quiz(models.Model):
         published (bool): Whether the quiz is published or not.
         published_at (datetime): The data and time when the quiz was
             published.
+        publish_at (datetime): When an unpublished quiz is scheduled
+            to be published.
         created_at (datetime): The date and time when the quiz was
             created.
         updated_at (datetime): The date and time when the quiz was
             last updated.
         content (str): Additional content/instructions for the quiz.
         course: (ForeignKey): The course associated with the quiz.
+        shuffle_questions (bool): Whether every attempt sees the
+            questions in its own random order.
+        shuffle_answers (bool): Whether every attempt sees the answers
+            of multiple choice questions in its own random order.
+        time_limit (timedelta): How long an attempt may take, or None
+            for untimed quizzes.
     """
     title = models.CharField(max_length=255, verbose_name="Quiz Title")
     summary = models.TextField(
@@ -209,6 +273,12 @@ class Quiz(models.Model):
         null=True,
         verbose_name="Published At"
     )
+    publish_at = models.DateTimeField(
+        blank=True,
+        null=True,
+        verbose_name="Publish At",
+        help_text="Publish the quiz automatically at this time."
+    )
     created_at = models.DateTimeField(
         auto_now_add=True,
         verbose_name="Created At"
@@ -228,6 +298,30 @@ class Quiz(models.Model):
         related_name="quizzes",
         verbose_name="Course"
     )
+    shuffle_questions = models.BooleanField(
+        default=False,
+        verbose_name="Shuffle Questions"
+    )
+    shuffle_answers = models.BooleanField(
+        default=False,
+        verbose_name="Shuffle Answers"
+    )
+    time_limit = models.DurationField(
+        blank=True,
+        null=True,
+        verbose_name="Time Limit",
+        help_text="How long an attempt may take, e.g. 00:45:00. Leave empty for no limit."
+    )
+
+    class Meta:
+        indexes = [
+            # Scheduled quizzes by publish time, for the publisher job
+            models.Index(
+                fields=['publish_at'],
+                condition=models.Q(published=False),
+                name='quiz_scheduled_publish_idx'
+            )
+        ]
 
     def __str__(self):
         return f"{self.title} ({self.course.title})"
@@ -300,6 +394,11 @@ class Question(models.Model):
         verbose_name="Score"
     )
     content = models.TextField(verbose_name="Question Content")
+    position = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Position",
+        help_text="Position of the question within its quiz. Leave 0 to add it at the end."
+    )
     created_at = models.DateTimeField(
         auto_now_add=True, 
         verbose_name="Created At"
@@ -309,8 +408,86 @@ class Question(models.Model):
         verbose_name="Updated At"
     )
 
+    class Meta:
+        ordering = ['quiz', 'position', 'id']
+        indexes = [
+            models.Index(
+                fields=['quiz', 'position'],
+                name='question_quiz_position_idx'
+            )
+        ]
+
     def __str__(self):
         return f"Question: {self.content[:50]} (Quiz: {self.quiz.title})"
+
+    def save(self, *args, **kwargs):
+        """
+        Override the save method to place new questions in their quiz.
+
+        A new question without a position is appended after the last
+        question of its quiz. A new question with a position is
+        inserted there, and the questions from that position on move
+        one place down. Closing the gap left by a deleted question is
+        handled by a `post_delete` signal.
+        """
+        if self._state.adding:
+            with transaction.atomic():
+                siblings = Question.objects.select_for_update().filter(quiz_id=self.quiz_id)
+                last = siblings.aggregate(last=models.Max('position'))['last'] or 0
+                if not self.position or self.position > last:
+                    self.position = last + 1
+                else:
+                    siblings.filter(position__gte=self.position).update(
+                        position=models.F('position') + 1
+                    )
+                super().save(*args, **kwargs)
+            return
+        super().save(*args, **kwargs)
+
+    def move_to(self, position):
+        """
+        Move the question to another position within its quiz, shifting
+        the questions in between by one place.
+
+        Args:
+            position (int): The new 1-based position.
+        """
+        with transaction.atomic():
+            siblings = Question.objects.select_for_update().filter(quiz_id=self.quiz_id)
+            last = siblings.aggregate(last=models.Max('position'))['last'] or 1
+            position = max(1, min(position, last))
+            if position < self.position:
+                siblings.filter(
+                    position__gte=position,
+                    position__lt=self.position
+                ).update(position=models.F('position') + 1)
+            elif position > self.position:
+                siblings.filter(
+                    position__gt=self.position,
+                    position__lte=position
+                ).update(position=models.F('position') - 1)
+            self.position = position
+            super().save(update_fields=['position', 'updated_at'])
+
+    @classmethod
+    def renumber(cls, quiz_id):
+        """
+        Renumber the questions of a quiz as 1, 2, 3, ... keeping their
+        current order.
+
+        Args:
+            quiz_id (int): The id of the quiz.
+        """
+        with transaction.atomic():
+            questions = list(
+                cls.objects.select_for_update().filter(quiz_id=quiz_id).order_by('position', 'id')
+            )
+            changed = []
+            for position, question in enumerate(questions, start=1):
+                if question.position != position:
+                    question.position = position
+                    changed.append(question)
+            cls.objects.bulk_update(changed, ['position'])
     
 class Answer(models.Model):
     """
@@ -358,6 +535,13 @@ class Answer(models.Model):
     def __str__(self):
         return f"Answer for Question ID {self.question.id}: {self.content[:50]}"
 
+def random_seed():
+    """
+    Return a random seed for the question order of a new `Take`.
+    """
+    return secrets.randbits(31)
+
+
 class Take(models.Model):
     """
     Represents an attempt by user to complete a quiz.
@@ -369,7 +553,14 @@ class Take(models.Model):
         created_at (datetime): The timestamp when the attempt started.
         finished_at (datetime): The timestamp when the attempt was
             completed.
+        seed (int): The seed of the attempt's question and answer order,
+            when the quiz is shuffled.
+        deadline (datetime): When a timed attempt runs out of time.
     """
+    # Answers posted this long after the deadline are still accepted,
+    # to absorb network latency.
+    DEADLINE_GRACE = timedelta(seconds=10)
+
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -397,6 +588,15 @@ class Take(models.Model):
         null=True,
         verbose_name="Finished At"
     )
+    seed = models.PositiveIntegerField(
+        default=random_seed,
+        verbose_name="Shuffle Seed"
+    )
+    deadline = models.DateTimeField(
+        blank=True,
+        null=True,
+        verbose_name="Deadline"
+    )
 
     class Meta:
         constraints = [
@@ -405,6 +605,14 @@ class Take(models.Model):
                 name='unique_user_quiz_take'
             )
         ]
+        indexes = [
+            # Open attempts by deadline, for the expired attempts finalizer
+            models.Index(
+                fields=['deadline'],
+                condition=models.Q(finished_at__isnull=True),
+                name='take_open_deadline_idx'
+            )
+        ]
     
     def clean(self):
         """
@@ -426,6 +634,15 @@ class Take(models.Model):
             return self.finished_at - self.created_at
         return None
 
+    def is_expired(self):
+        """
+        Check whether a timed attempt is past its deadline.
+
+        Returns:
+            bool: True if the attempt ran out of time.
+        """
+        return bool(self.deadline) and now() > self.deadline + self.DEADLINE_GRACE
+
     def __str__(self):
         """
         String representation of the Take.
@@ -435,6 +652,64 @@ class Take(models.Model):
 
 
 
+class TakeResult(models.Model):
+    """
+    The graded outcome of a finished quiz attempt.
+
+    A result is written once, when the attempt is finished (and again
+    if the quiz is regraded), so that showing the result page is a
+    single primary key lookup.
+
+    Attributes:
+        take (OneToOneField): The graded quiz attempt, also used as
+            the primary key.
+        score (float): The total score earned.
+        max_score (float): The maximum score of the quiz.
+        total_questions (int): The number of questions in the quiz.
+        breakdown (list): One entry per question, with the question
+            id, the selected answer ids, the short answer text, and
+            the earned points.
+        graded_at (datetime): When the attempt was last graded.
+    """
+    take = models.OneToOneField(
+        Take,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='result',
+        verbose_name="Quiz Attempt"
+    )
+    score = models.DecimalField(
+        max_digits=5,
+        decimal_places=2,
+        default=0.00,
+        verbose_name="Score"
+    )
+    max_score = models.DecimalField(
+        max_digits=5,
+        decimal_places=2,
+        default=0.00,
+        verbose_name="Maximum Score"
+    )
+    total_questions = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Total Questions"
+    )
+    breakdown = models.JSONField(
+        default=list,
+        verbose_name="Per Question Breakdown"
+    )
+    graded_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name="Graded At"
+    )
+
+    def __str__(self):
+        """
+        String representation of the TakeResult.
+        """
+        return f"Result of Take {self.take_id}: {self.score} / {self.max_score}"
+
+
 class TakeAnswer(models.Model):
     """
     Represents an answer submitted during a quiz attempt.
@@ -477,11 +752,6 @@ class TakeAnswer(models.Model):
                 fields=['take', 'answer'],
                 name='unique_take_answer'
             ),
-            # Ensure no duplicate entries for short-answer questions
-            models.UniqueConstraint(
-                fields=['take', 'content'],
-                name='unique_take_content'
-            ),
         ]
     
 
@@ -499,6 +769,222 @@ class TakeAnswer(models.Model):
         """
         return f"TakeAnswer (Take ID: {self.take.id}, Answer: {self.answer or self.content})"
 
-    
-      
-    
+
+class QuizStatistics(models.Model):
+    """
+    Running totals used for the item analysis of a quiz.
+
+    Together with `QuestionStatistics` and `AnswerStatistics` these
+    are the sufficient statistics for difficulty, discrimination,
+    distractor rates and Cronbach's alpha. They are updated
+    incrementally as takes finish, and rebuilt in one pass when the
+    quiz is regraded (see `courses.item_analysis`).
+
+    Attributes:
+        quiz (OneToOneField): The analysed quiz, also the primary key.
+        takes (int): The number of finished takes counted.
+        total_sum (int): The sum of the number of correctly answered
+            questions over all takes.
+        total_square_sum (int): The sum of the squares of those totals.
+        updated_at (datetime): When the totals were last changed.
+    """
+    quiz = models.OneToOneField(
+        Quiz,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='statistics',
+        verbose_name="Quiz"
+    )
+    takes = models.PositiveIntegerField(default=0, verbose_name="Takes")
+    total_sum = models.BigIntegerField(default=0, verbose_name="Sum of Totals")
+    total_square_sum = models.BigIntegerField(
+        default=0,
+        verbose_name="Sum of Squared Totals"
+    )
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Updated At")
+
+    class Meta:
+        verbose_name_plural = "Quiz statistics"
+
+    def __str__(self):
+        return f"Statistics for {self.quiz_id}"
+
+
+class QuestionStatistics(models.Model):
+    """
+    Running totals of a question, used for its item analysis.
+
+    Attributes:
+        question (OneToOneField): The analysed question, also the
+            primary key.
+        quiz (ForeignKey): The quiz of the question.
+        attempts (int): The number of takes that included the question.
+        correct (int): How many of those answered it correctly.
+        correct_total_sum (int): The sum of the totals of the takes that
+            answered it correctly.
+    """
+    question = models.OneToOneField(
+        Question,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='statistics',
+        verbose_name="Question"
+    )
+    quiz = models.ForeignKey(
+        Quiz,
+        on_delete=models.CASCADE,
+        related_name='question_statistics',
+        verbose_name="Quiz"
+    )
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Attempts")
+    correct = models.PositiveIntegerField(default=0, verbose_name="Correct")
+    correct_total_sum = models.BigIntegerField(
+        default=0,
+        verbose_name="Sum of Totals When Correct"
+    )
+
+    class Meta:
+        verbose_name_plural = "Question statistics"
+
+    def __str__(self):
+        return f"Statistics for Question {self.question_id}"
+
+
+class AnswerStatistics(models.Model):
+    """
+    How many times an answer was selected, used for distractor
+    analysis.
+
+    Attributes:
+        answer (OneToOneField): The analysed answer, also the primary
+            key.
+        question (ForeignKey): The question of the answer.
+        selected (int): How many takes selected the answer.
+    """
+    answer = models.OneToOneField(
+        Answer,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='statistics',
+        verbose_name="Answer"
+    )
+    question = models.ForeignKey(
+        Question,
+        on_delete=models.CASCADE,
+        related_name='answer_statistics',
+        verbose_name="Question"
+    )
+    selected = models.PositiveIntegerField(default=0, verbose_name="Selected")
+
+    class Meta:
+        verbose_name_plural = "Answer statistics"
+
+    def __str__(self):
+        return f"Statistics for Answer {self.answer_id}"
+
+
+class LeaderboardEntry(models.Model):
+    """
+    A user's standing on a quiz or course leaderboard.
+
+    These rows are the durable copy of the leaderboards kept in the
+    cache by `courses.leaderboards`, and are only read to rebuild a
+    leaderboard on a cold cache.
+
+    Attributes:
+        board (str): The leaderboard, e.g. 'quiz:1' or 'course:1'.
+        user (ForeignKey): The ranked user.
+        score (float): The user's score on the board.
+        duration (timedelta): The time the user took, used to break
+            ties (shorter ranks higher).
+        updated_at (datetime): When the entry was last changed.
+    """
+    board = models.CharField(max_length=50, verbose_name="Leaderboard")
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='leaderboard_entries',
+        verbose_name="User"
+    )
+    score = models.DecimalField(
+        max_digits=9,
+        decimal_places=2,
+        default=0.00,
+        verbose_name="Score"
+    )
+    duration = models.DurationField(verbose_name="Duration")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Updated At")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['board', 'user'],
+                name='unique_board_user'
+            )
+        ]
+        verbose_name_plural = "Leaderboard entries"
+
+    def __str__(self):
+        return f"{self.board}: {self.user_id} - {self.score}"
+
+
+class CourseStats(models.Model):
+    """
+    Denormalized counters of a course.
+
+    The counters are kept up to date by signals as enrollments,
+    lessons, quizzes and graded takes come and go (see
+    `courses.course_stats`), so pages can sort and show courses by them
+    without aggregating. The `reconcile_course_stats` management
+    command recomputes them to repair any drift.
+
+    Attributes:
+        course (OneToOneField): The course, also the primary key.
+        enrollments (int): The number of enrolled students.
+        lessons (int): The number of lessons.
+        quizzes (int): The number of quizzes.
+        graded_takes (int): The number of graded takes of its quizzes.
+        score_percent_sum (float): The sum of the scores of those takes,
+            each as a percentage of its quiz's maximum score.
+        last_activity_at (datetime): When a student last enrolled, a
+            lesson was added or a take finished.
+        updated_at (datetime): When the counters were last changed.
+    """
+    course = models.OneToOneField(
+        Course,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name="Course"
+    )
+    enrollments = models.PositiveIntegerField(default=0, verbose_name="Enrollments")
+    lessons = models.PositiveIntegerField(default=0, verbose_name="Lessons")
+    quizzes = models.PositiveIntegerField(default=0, verbose_name="Quizzes")
+    graded_takes = models.PositiveIntegerField(default=0, verbose_name="Graded Takes")
+    score_percent_sum = models.FloatField(default=0, verbose_name="Sum of Score Percentages")
+    last_activity_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Last Activity"
+    )
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Updated At")
+
+    class Meta:
+        indexes = [
+            # Popularity sorting of the homepage and the catalog
+            models.Index(fields=['enrollments', 'course'], name='course_stats_popular_idx'),
+        ]
+        verbose_name_plural = "Course statistics"
+
+    def __str__(self):
+        return f"Statistics for {self.course_id}"
+
+    @property
+    def average_score(self):
+        """
+        The average take score of the course's quizzes, as a percentage
+        of their maximum scores, or None without graded takes.
+        """
+        if not self.graded_takes:
+            return None
+        return self.score_percent_sum / self.graded_takes
@@ -0,0 +1,164 @@
+"""
+Keyset (seek) pagination.
+
+Pages are cut on an ordering key, `(created_at, id)` for the newest
+courses of the catalog, instead of an OFFSET: the next page starts
+right after the last row of the current one, so every page costs one
+indexed range scan however deep it is. Page links carry opaque cursors
+encoding the ordering fields and the key of the boundary row; a cursor
+made for another ordering, or whose values do not fit the fields, is
+rejected.
+"""
+import base64
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from functools import reduce
+
+from django.db.models import DateTimeField, Q
+from django.utils.dateparse import parse_datetime
+
+
+@dataclass(frozen=True)
+class KeysetPage:
+    """
+    A page of rows.
+
+    Attributes:
+        items (list): The rows of the page, in catalog order.
+        next_cursor (str): Cursor of the following page, or None on the
+            last page.
+        previous_cursor (str): Cursor of the preceding page, or None on
+            the first page.
+    """
+    items: list
+    next_cursor: str = None
+    previous_cursor: str = None
+
+
+def _dump(value):
+    return {'dt': value.isoformat()} if isinstance(value, datetime) else value
+
+
+def _load(value):
+    if isinstance(value, dict):
+        parsed = parse_datetime(value.get('dt', ''))
+        if parsed is None:
+            raise ValueError(value)
+        return parsed
+    if not isinstance(value, (int, float)):
+        raise ValueError(value)
+    return value
+
+
+def encode_cursor(keys, values, direction):
+    """
+    Encode the ordering fields, the key values of a boundary row and a
+    direction ('next' or 'previous').
+    """
+    payload = json.dumps([list(keys), [_dump(value) for value in values], direction])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, keys):
+    """
+    Decode a cursor made by `encode_cursor` for the ordering `keys`.
+
+    Returns:
+        tuple: `(values, direction)`.
+
+    Raises:
+        ValueError: If the cursor is malformed or made for another
+            ordering.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_keys, values, direction = json.loads(base64.urlsafe_b64decode(padded))
+        values = [_load(value) for value in values]
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    if cursor_keys != list(keys) or len(values) != len(keys) or direction not in ('next', 'previous'):
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return values, direction
+
+
+def _field(queryset, key):
+    # The annotation, or the field reached through the relations of `key`
+    annotation = queryset.query.annotations.get(key)
+    if annotation is not None:
+        return annotation.output_field
+    model = queryset.model
+    for name in key.split('__'):
+        field = model._meta.get_field(name)
+        model = field.related_model
+    return field
+
+
+def _check_types(queryset, keys, values):
+    # A datetime for datetime fields, a number for the others
+    for key, value in zip(keys, values):
+        field = _field(queryset, key)
+        if isinstance(value, datetime) != isinstance(field, DateTimeField):
+            raise ValueError(f"Invalid cursor value for {key}: {value!r}")
+
+
+def _seek(keys, values, lookup):
+    # (a, b) < (x, y)  <=>  a < x OR (a = x AND b < y)
+    condition = Q()
+    for i, key in enumerate(keys):
+        exact = {field: value for field, value in zip(keys[:i], values[:i])}
+        condition |= Q(**exact, **{f'{key}__{lookup}': values[i]})
+    return condition
+
+
+def keyset_paginate(queryset, cursor=None, page_size=12, keys=('created_at', 'id')):
+    """
+    Return a page of a queryset, in descending order of `keys`.
+
+    Runs a single query: one row past the page tells whether there is
+    a further page.
+
+    Args:
+        queryset (QuerySet): The rows to page through.
+        cursor (str): A cursor from a previous page, or None for the
+            first page.
+        page_size (int): The number of rows per page.
+        keys (tuple): Fields, possibly across relations, or annotations
+            ordering the rows; the last one must be unique, e.g. the id.
+
+    Returns:
+        KeysetPage: The page.
+
+    Raises:
+        ValueError: If the cursor is malformed or does not fit `keys`.
+    """
+    keys = list(keys)
+    direction = 'next'
+    if cursor:
+        values, direction = decode_cursor(cursor, keys)
+        _check_types(queryset, keys, values)
+        lookup = 'lt' if direction == 'next' else 'gt'
+        queryset = queryset.filter(_seek(keys, values, lookup))
+
+    if direction == 'next':
+        rows = list(queryset.order_by(*[f'-{key}' for key in keys])[:page_size + 1])
+    else:
+        # Walk backwards from the boundary, then restore catalog order
+        rows = list(queryset.order_by(*keys)[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if direction == 'previous':
+        rows.reverse()
+    if not rows:
+        return KeysetPage(items=[])
+
+    def key_of(row):
+        return [reduce(getattr, key.split('__'), row) for key in keys]
+
+    has_next = has_more if direction == 'next' else True
+    has_previous = bool(cursor) if direction == 'next' else has_more
+    return KeysetPage(
+        items=rows,
+        next_cursor=encode_cursor(keys, key_of(rows[-1]), 'next') if has_next else None,
+        previous_cursor=encode_cursor(keys, key_of(rows[0]), 'previous') if has_previous else None,
+    )
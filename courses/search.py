@@ -0,0 +1,252 @@
+"""
+Full-text search of courses.
+
+Courses and their lessons are indexed in an SQLite FTS5 virtual table,
+`courses_search`, with one row per course (title, description and
+teacher name) and one row per lesson (title and description). Rows
+sit at a rowid derived from their object's id (`search_rowid`), so a
+row is replaced or deleted without scanning the table. Signals keep
+the table in sync with `Course`, `Lesson` and the teachers' names (see
+`courses.signals`), and the `rebuild_search_index` management command
+refills it from scratch.
+
+Results are courses ranked by bm25, best first, each with a highlighted
+snippet of its best matching row. Databases without FTS5 fall back to
+a case-insensitive substring search over titles and descriptions.
+"""
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Course, Lesson
+
+# The FTS5 table, created by migration 0015 on SQLite builds with FTS5
+SEARCH_TABLE = 'courses_search'
+
+# bm25 weights of the title, body and teacher columns
+_WEIGHTS = (10.0, 2.0, 4.0)
+
+# Placeholders for the snippet highlights, replaced after escaping
+_MARK_START, _MARK_END = '\x02', '\x03'
+
+_TOKEN_RE = re.compile(r'\w+')
+
+
+@dataclass(frozen=True)
+class SearchResult:
+    """
+    A course matching a search.
+
+    Attributes:
+        course_id (int): The id of the course.
+        rank (float): The bm25 score of the match; lower is better.
+            None for fallback results.
+        snippet (str): Safe HTML with the matching terms highlighted,
+            or None for fallback results.
+    """
+    course_id: int
+    rank: float = None
+    snippet: str = None
+
+
+@lru_cache(maxsize=None)
+def _search_table_exists(database):
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+            [SEARCH_TABLE]
+        )
+        return cursor.fetchone() is not None
+
+
+def fts_available():
+    """
+    Check whether the full-text index exists on the current database.
+    """
+    return _search_table_exists(connection.settings_dict['NAME'])
+
+
+def _match_expression(query):
+    """
+    Turn free text into an FTS5 query matching every word as a prefix.
+    User input never reaches FTS5 syntax unquoted.
+    """
+    tokens = _TOKEN_RE.findall(query)
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def _teacher_name(user):
+    return user.get_full_name() or user.username
+
+
+def search_rowid(kind, object_id):
+    """
+    Return the rowid of the search row of a course or lesson.
+
+    The other columns are UNINDEXED, so rows are only found without a
+    full scan by their rowid: courses get even rowids, lessons odd ones.
+    """
+    return object_id * 2 + (1 if kind == 'lesson' else 0)
+
+
+def _delete_rows(cursor, kind, object_ids):
+    cursor.executemany(
+        f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s",
+        [(search_rowid(kind, object_id),) for object_id in object_ids]
+    )
+
+
+def _insert_courses(cursor, courses):
+    cursor.executemany(
+        f"INSERT INTO {SEARCH_TABLE} (rowid, kind, object_id, course_id, title, body, teacher) "
+        "VALUES (%s, 'course', %s, %s, %s, %s, %s)",
+        (
+            (search_rowid('course', course.id), course.id, course.id,
+             course.title, course.description, _teacher_name(course.teacher))
+            for course in courses
+        )
+    )
+
+
+def _insert_lessons(cursor, lessons):
+    cursor.executemany(
+        f"INSERT INTO {SEARCH_TABLE} (rowid, kind, object_id, course_id, title, body, teacher) "
+        "VALUES (%s, 'lesson', %s, %s, %s, %s, '')",
+        (
+            (search_rowid('lesson', lesson.id), lesson.id, lesson.course_id, lesson.title, lesson.description)
+            for lesson in lessons
+        )
+    )
+
+
+def index_courses(courses):
+    """
+    Add or refresh the search rows of courses.
+
+    Args:
+        courses (iterable): `Course` instances, with `teacher` loaded
+            or loadable.
+    """
+    if not fts_available():
+        return
+    courses = list(courses)
+    with transaction.atomic(), connection.cursor() as cursor:
+        _delete_rows(cursor, 'course', [course.id for course in courses])
+        _insert_courses(cursor, courses)
+
+
+def index_lessons(lessons):
+    """
+    Add or refresh the search rows of lessons.
+
+    Args:
+        lessons (iterable): `Lesson` instances.
+    """
+    if not fts_available():
+        return
+    lessons = list(lessons)
+    with transaction.atomic(), connection.cursor() as cursor:
+        _delete_rows(cursor, 'lesson', [lesson.id for lesson in lessons])
+        _insert_lessons(cursor, lessons)
+
+
+def unindex(kind, object_id):
+    """
+    Remove the search row of a deleted course or lesson.
+
+    Args:
+        kind (str): 'course' or 'lesson'.
+        object_id (int): The id of the deleted object.
+    """
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        _delete_rows(cursor, kind, [object_id])
+
+
+def rebuild_search_index(chunk_size=1000):
+    """
+    Refill the search table from every course and lesson.
+
+    Args:
+        chunk_size (int): How many objects to load at a time.
+
+    Returns:
+        bool: False if the database has no full-text index.
+    """
+    if not fts_available():
+        return False
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Emptied first, so rows are only inserted
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        _insert_courses(cursor, Course.objects.select_related('teacher').iterator(chunk_size=chunk_size))
+        _insert_lessons(cursor, Lesson.objects.iterator(chunk_size=chunk_size))
+    return True
+
+
+def _highlight(snippet):
+    return mark_safe(
+        escape(snippet).replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>')
+    )
+
+
+def search_courses(query, limit=50):
+    """
+    Search courses by their title, description, teacher and lessons.
+
+    Args:
+        query (str): The user's search text.
+        limit (int): The maximum number of results.
+
+    Returns:
+        list: `SearchResult` instances, best match first.
+    """
+    expression = _match_expression(query)
+    if not expression:
+        return []
+    if not fts_available():
+        return [
+            SearchResult(course_id=course_id)
+            for course_id in Course.objects.filter(
+                Q(title__icontains=query) | Q(description__icontains=query)
+            ).order_by('title').values_list('id', flat=True)[:limit]
+        ]
+
+    # FTS5's `rank` column, computed by bm25 with the column weights;
+    # unlike bm25() itself it can be aggregated.
+    ranking = f"bm25(0, 0, 0, {', '.join(str(weight) for weight in _WEIGHTS)})"
+    with connection.cursor() as cursor:
+        # The best rank of every matching course
+        cursor.execute(
+            f"SELECT course_id, MIN(rank) AS best FROM {SEARCH_TABLE} "
+            f"WHERE {SEARCH_TABLE} MATCH %s AND rank MATCH %s "
+            "GROUP BY course_id ORDER BY best LIMIT %s",
+            [expression, ranking, limit]
+        )
+        ranks = {int(course_id): rank for course_id, rank in cursor.fetchall()}
+        if not ranks:
+            return []
+
+        # Snippets of the matching rows of those courses only
+        placeholders = ', '.join(['%s'] * len(ranks))
+        cursor.execute(
+            f"SELECT course_id, snippet({SEARCH_TABLE}, -1, %s, %s, '…', 12) "
+            f"FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s AND rank MATCH %s "
+            f"AND course_id IN ({placeholders}) ORDER BY rank",
+            [_MARK_START, _MARK_END, expression, ranking, *ranks]
+        )
+        snippets = {}
+        for course_id, snippet in cursor.fetchall():
+            snippets.setdefault(int(course_id), snippet)
+
+    return [
+        SearchResult(course_id=course_id, rank=rank, snippet=_highlight(snippets.get(course_id, '')))
+        for course_id, rank in sorted(ranks.items(), key=lambda item: item[1])
+    ]
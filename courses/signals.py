@@ -1,8 +1,23 @@
-from django.db.models.signals import post_migrate
+from django.db.models.signals import post_migrate, pre_save, post_save, post_delete
+from django.db import transaction
+from django.db.models import F, QuerySet
 from django.dispatch import receiver
-from django.contrib.auth.models import Group, Permission
+from django.contrib.auth.models import Group, Permission, User
 from django.contrib.contenttypes.models import ContentType
-from .models import Course, Enrollment
+from .models import (
+    Course, Lesson, Enrollment, Quiz, Question, Answer, Take,
+    QuizStatistics, QuestionStatistics, AnswerStatistics, CourseStats
+)
+from .autocomplete import course_changed
+from .enrollments import bump_membership_version
+from .course_stats import adjust_course_stats, record_take_result, rebuild_course_stats
+from .distributions import record_score, rebuild_distribution, invalidate_distribution
+from .grading import take_graded, quiz_regraded
+from .item_analysis import record_take, rebuild_quiz_statistics
+from .leaderboards import update_for_take, rebuild_quiz_leaderboards
+from .listings import bump_course_listing_version
+from .search import index_courses, index_lessons, unindex
+from .snapshot import get_quiz_snapshot, invalidate_quiz_snapshot_on_commit
 
 @receiver(post_migrate)
 def assign_teacher_student_permissions(sender, **kwargs):
@@ -48,3 +63,348 @@ def assign_teacher_student_permissions(sender, **kwargs):
                 permission.name = f"Can {perm_codename.replace('_', ' ')} course"
                 permission.save()
             student_group.permissions.add(permission)
+
+
+@receiver([post_save, post_delete], sender=Quiz)
+def invalidate_snapshot_on_quiz_change(sender, instance, **kwargs):
+    """
+    Drop the cached snapshot of a quiz whenever the quiz changes.
+    """
+    invalidate_quiz_snapshot_on_commit(instance.id)
+
+
+@receiver([post_save, post_delete], sender=Quiz)
+def invalidate_listings_on_quiz_change(sender, instance, **kwargs):
+    """
+    Drop the cached course listings whenever a quiz changes.
+    """
+    bump_course_listing_version()
+
+
+@receiver([post_save, post_delete], sender=Question)
+def invalidate_snapshot_on_question_change(sender, instance, **kwargs):
+    """
+    Drop the cached snapshot of the quiz a question belongs to.
+    """
+    invalidate_quiz_snapshot_on_commit(instance.quiz_id)
+
+
+@receiver(post_delete, sender=Question)
+def close_question_position_gap(sender, instance, **kwargs):
+    """
+    Move the questions after a deleted question one place up, so that
+    the positions of a quiz stay 1, 2, 3, ...
+    """
+    Question.objects.filter(
+        quiz_id=instance.quiz_id,
+        position__gt=instance.position
+    ).update(position=F('position') - 1)
+
+
+@receiver([post_save, post_delete], sender=Answer)
+def invalidate_snapshot_on_answer_change(sender, instance, origin=None, **kwargs):
+    """
+    Drop the cached snapshot of the quiz an answer belongs to.
+    """
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if origin is not None and origin_model is not Answer:
+        # Deleted along with its question, quiz or course, whose own
+        # receivers drop the snapshot
+        return
+    if Answer.question.is_cached(instance):
+        quiz_id = instance.question.quiz_id
+    else:
+        quiz_id = Question.objects.filter(
+            id=instance.question_id
+        ).values_list('quiz_id', flat=True).first()
+    if quiz_id is not None:
+        invalidate_quiz_snapshot_on_commit(quiz_id)
+
+
+@receiver(post_save, sender=Quiz)
+def create_quiz_statistics(sender, instance, created, **kwargs):
+    """
+    Start the item statistics of a new quiz at zero.
+    """
+    if created:
+        QuizStatistics.objects.get_or_create(quiz=instance)
+
+
+@receiver(post_save, sender=Question)
+def create_question_statistics(sender, instance, created, **kwargs):
+    """
+    Start the item statistics of a new question at zero.
+    """
+    if created:
+        QuestionStatistics.objects.get_or_create(
+            question=instance,
+            defaults={'quiz_id': instance.quiz_id}
+        )
+
+
+@receiver(post_save, sender=Answer)
+def create_answer_statistics(sender, instance, created, **kwargs):
+    """
+    Start the distractor statistics of a new answer at zero.
+    """
+    if created:
+        AnswerStatistics.objects.get_or_create(
+            answer=instance,
+            defaults={'question_id': instance.question_id}
+        )
+
+
+@receiver(take_graded, sender=Take)
+def update_item_statistics(sender, result, created, **kwargs):
+    """
+    Count a take in its quiz's item statistics the first time it is
+    graded.
+    """
+    if created:
+        record_take(result)
+
+
+@receiver(quiz_regraded, sender=Quiz)
+def rebuild_item_statistics(sender, quiz_id, **kwargs):
+    """
+    Rebuild the item statistics of a quiz after it was regraded.
+    """
+    rebuild_quiz_statistics(quiz_id)
+
+
+@receiver(take_graded, sender=Take)
+def update_leaderboards(sender, take, **kwargs):
+    """
+    Move the user of a graded take on the quiz and course leaderboards.
+    """
+    update_for_take(take)
+
+
+@receiver(quiz_regraded, sender=Quiz)
+def rebuild_leaderboards(sender, quiz_id, **kwargs):
+    """
+    Rebuild the quiz and course leaderboards after a regrade.
+    """
+    rebuild_quiz_leaderboards(quiz_id, get_quiz_snapshot(quiz_id).course_id)
+
+
+@receiver(post_save, sender=Quiz)
+def invalidate_distribution_on_quiz_change(sender, instance, created, **kwargs):
+    """
+    Drop the cached score distribution of a changed quiz, as its
+    histogram depends on the quiz's maximum score.
+    """
+    if not created:
+        invalidate_distribution(instance.id)
+
+
+@receiver(take_graded, sender=Take)
+def update_score_distribution(sender, take, created, **kwargs):
+    """
+    Add a newly graded take to its quiz's score distribution.
+    """
+    if created:
+        record_score(take)
+    else:
+        invalidate_distribution(take.quiz_id)
+
+
+@receiver(quiz_regraded, sender=Quiz)
+def rebuild_score_distribution(sender, quiz_id, **kwargs):
+    """
+    Rebuild the score distribution of a quiz after a regrade.
+    """
+    rebuild_distribution(quiz_id)
+
+
+@receiver(post_save, sender=Course)
+def index_course(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Add or refresh the search row of a saved course, and its
+    autocomplete entry when it is new or was renamed.
+    """
+    index_courses([instance])
+    if update_fields is not None and 'title' not in update_fields:
+        return
+    if created or getattr(instance, '_previous_title', None) != instance.title:
+        course_id, title = instance.id, instance.title
+        transaction.on_commit(lambda: course_changed(course_id, title))
+
+
+@receiver(post_delete, sender=Course)
+def unindex_course(sender, instance, **kwargs):
+    """
+    Remove a deleted course from the search index and autocomplete.
+    """
+    unindex('course', instance.id)
+    course_id = instance.id
+    transaction.on_commit(lambda: course_changed(course_id))
+
+
+@receiver(post_save, sender=Lesson)
+def index_lesson(sender, instance, **kwargs):
+    """
+    Add or refresh the search row of a saved lesson.
+    """
+    index_lessons([instance])
+
+
+@receiver(post_delete, sender=Lesson)
+def unindex_lesson(sender, instance, **kwargs):
+    """
+    Remove a deleted lesson from the search index.
+    """
+    unindex('lesson', instance.id)
+
+
+@receiver(post_save, sender=User)
+def reindex_teacher_courses(sender, instance, created, **kwargs):
+    """
+    Refresh the search rows of a teacher's courses, since they include
+    the teacher's name.
+    """
+    update_fields = kwargs.get('update_fields')
+    if created or (update_fields and not {'username', 'first_name', 'last_name'} & set(update_fields)):
+        return
+    index_courses(Course.objects.filter(teacher=instance).select_related('teacher'))
+
+
+@receiver(post_save, sender=Course)
+def create_course_stats(sender, instance, created, **kwargs):
+    """
+    Start the counters of a new course at zero.
+    """
+    if created:
+        CourseStats.objects.get_or_create(course=instance)
+
+
+@receiver(post_save, sender=Enrollment)
+def count_enrollment(sender, instance, created, **kwargs):
+    """
+    Count a new enrollment in its course's statistics.
+    """
+    if created:
+        adjust_course_stats(instance.course_id, activity_at=instance.enrolled_at, enrollments=1)
+
+
+@receiver(post_delete, sender=Enrollment)
+def uncount_enrollment(sender, instance, **kwargs):
+    """
+    Remove a deleted enrollment from its course's statistics.
+    """
+    adjust_course_stats(instance.course_id, enrollments=-1)
+
+
+@receiver(post_save, sender=Lesson)
+def count_lesson(sender, instance, created, **kwargs):
+    """
+    Count a new lesson in its course's statistics.
+    """
+    if created:
+        adjust_course_stats(instance.course_id, activity_at=instance.created_at, lessons=1)
+
+
+@receiver(post_delete, sender=Lesson)
+def uncount_lesson(sender, instance, **kwargs):
+    """
+    Remove a deleted lesson from its course's statistics.
+    """
+    adjust_course_stats(instance.course_id, lessons=-1)
+
+
+@receiver(post_save, sender=Quiz)
+def count_quiz(sender, instance, created, **kwargs):
+    """
+    Count a new quiz in its course's statistics.
+    """
+    if created:
+        adjust_course_stats(instance.course_id, quizzes=1)
+
+
+@receiver(post_delete, sender=Quiz)
+def uncount_quiz(sender, instance, **kwargs):
+    """
+    Remove a deleted quiz, and the scores of its takes, from its
+    course's statistics.
+    """
+    adjust_course_stats(instance.course_id, quizzes=-1)
+    # After commit, so that a course being deleted is left alone
+    course_id = instance.course_id
+    transaction.on_commit(lambda: rebuild_course_stats([course_id]))
+
+
+@receiver(take_graded, sender=Take)
+def update_course_stats(sender, take, result, created, **kwargs):
+    """
+    Add a newly graded take to its course's average score, or
+    recompute the course when a take is graded again.
+    """
+    if created:
+        record_take_result(result)
+    else:
+        rebuild_course_stats([get_quiz_snapshot(take.quiz_id).course_id])
+
+
+@receiver(quiz_regraded, sender=Quiz)
+def rebuild_course_stats_on_regrade(sender, quiz_id, **kwargs):
+    """
+    Recompute the average score of a course after one of its quizzes
+    was regraded.
+    """
+    rebuild_course_stats([get_quiz_snapshot(quiz_id).course_id])
+
+
+def _bump_membership(user_id, instance=None):
+    # Now for this transaction, and again after commit in case another
+    # request cached the old memberships in between
+    bump_membership_version(user_id, instance)
+    transaction.on_commit(lambda: bump_membership_version(user_id))
+
+
+@receiver([post_save, post_delete], sender=Enrollment)
+def invalidate_membership_on_enrollment(sender, instance, **kwargs):
+    """
+    Drop the cached course memberships of an enrolled or unenrolled
+    student.
+    """
+    student = instance.student if Enrollment.student.is_cached(instance) else None
+    _bump_membership(instance.student_id, student)
+
+
+@receiver(pre_save, sender=Course)
+def remember_previous_teacher(sender, instance, **kwargs):
+    """
+    Note the current teacher and title of a course about to be saved,
+    so that a replaced teacher loses access and the autocomplete only
+    hears about new titles.
+    """
+    instance._previous_teacher_id = instance._previous_title = None
+    if instance.pk:
+        previous = Course.objects.filter(
+            pk=instance.pk
+        ).values_list('teacher_id', 'title').first()
+        if previous is not None:
+            instance._previous_teacher_id, instance._previous_title = previous
+
+
+@receiver(post_save, sender=Course)
+def invalidate_membership_on_course_save(sender, instance, created, **kwargs):
+    """
+    Drop the cached course memberships of the teacher of a new course,
+    or of both teachers when the teacher changed.
+    """
+    previous = getattr(instance, '_previous_teacher_id', None)
+    if created or previous != instance.teacher_id:
+        teacher = instance.teacher if Course.teacher.is_cached(instance) else None
+        _bump_membership(instance.teacher_id, teacher)
+        if previous is not None:
+            _bump_membership(previous)
+
+
+@receiver(post_delete, sender=Course)
+def invalidate_membership_on_course_delete(sender, instance, **kwargs):
+    """
+    Drop the cached course memberships of the teacher of a deleted
+    course.
+    """
+    _bump_membership(instance.teacher_id)
@@ -0,0 +1,306 @@
+"""
+Immutable, cached snapshots of a quiz's structure.
+
+A quiz does not change while students are taking it, yet every page of
+the quiz used to re-read the quiz, its ordered questions and their
+answers from the database. A `QuizSnapshot` captures all of that once
+per quiz version and is kept in two layers:
+
+    1. A per-process LRU, keyed by (quiz id, version).
+    2. The shared Django cache, keyed by the same pair.
+
+The current version of each quiz lives in the shared cache and is
+replaced whenever a `Quiz`, `Question` or `Answer` is saved or
+deleted (see `courses.signals`), so stale snapshots are never served
+and never need to be deleted explicitly.
+
+Quizzes that shuffle their questions or answers are permuted per take
+on the fly with `QuizSnapshot.for_take`, from the take's seed, so a
+take always sees the same order without storing a copy of the quiz.
+"""
+from dataclasses import dataclass, field, replace
+from functools import lru_cache
+from typing import ClassVar
+import random
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.timezone import now
+
+from .models import Quiz, Question
+
+# Shared cache lifetime of a snapshot. Versions make snapshots safe to
+# keep forever; the timeout only bounds memory held by old versions.
+SNAPSHOT_TIMEOUT = 60 * 60 * 24
+
+# Number of snapshots kept in the memory of each process.
+SNAPSHOT_LRU_SIZE = 256
+
+
+@dataclass(frozen=True)
+class AnswerSnapshot:
+    """
+    Read-only copy of an `Answer`.
+    """
+    id: int
+    content: str
+    is_correct: bool
+
+
+@dataclass(frozen=True)
+class QuestionSnapshot:
+    """
+    Read-only copy of a `Question` together with its answers.
+
+    The question type constants are mirrored from `Question` so that
+    templates can keep comparing `question.type` against
+    `question.MULTIPLE_CHOICE` and friends.
+    """
+    MULTIPLE_CHOICE: ClassVar[int] = Question.MULTIPLE_CHOICE
+    TRUE_FALSE: ClassVar[int] = Question.TRUE_FALSE
+    SHORT_ANSWER: ClassVar[int] = Question.SHORT_ANSWER
+
+    id: int
+    position: int
+    type: int
+    level: int
+    score: object
+    content: str
+    answers: tuple
+
+    @property
+    def true_answer(self):
+        """
+        The correct answer of a True/False question.
+        """
+        return next((a for a in self.answers if a.is_correct), None)
+
+    @property
+    def false_answer(self):
+        """
+        The incorrect answer of a True/False question.
+        """
+        return next((a for a in self.answers if not a.is_correct), None)
+
+
+@dataclass(frozen=True)
+class QuizSnapshot:
+    """
+    Read-only, precompiled structure of a quiz.
+
+    Attributes:
+        id (int): The quiz id.
+        version (str): The quiz version the snapshot was built from.
+        title (str): The quiz title.
+        summary (str): The quiz summary.
+        content (str): Additional content/instructions for the quiz.
+        score (Decimal): The maximum score of the quiz.
+        published (bool): Whether the quiz is published.
+        course_id (int): The id of the course the quiz belongs to.
+        questions (tuple): The questions, in display order.
+        answer_key (dict): Maps question ids to a frozenset with the
+            ids of their correct answers.
+        answer_questions (dict): Maps answer ids to their question id.
+        total_questions (int): The number of questions.
+        total_score (Decimal): The sum of the question scores.
+        shuffle_questions (bool): Whether takes see the questions in
+            their own order.
+        shuffle_answers (bool): Whether takes see the answers of
+            multiple choice questions in their own order.
+        time_limit (timedelta): How long a take may last, or None.
+        published_at (datetime): When the quiz opens, if set.
+    """
+    id: int
+    version: str
+    title: str
+    summary: str
+    content: str
+    score: object
+    published: bool
+    course_id: int
+    questions: tuple
+    answer_key: dict = field(default_factory=dict)
+    answer_questions: dict = field(default_factory=dict)
+    total_questions: int = 0
+    total_score: object = 0
+    shuffle_questions: bool = False
+    shuffle_answers: bool = False
+    time_limit: object = None
+    published_at: object = None
+
+    def is_open(self):
+        """
+        Check whether the quiz is published and its opening time, if
+        any, has come.
+        """
+        return self.published and (self.published_at is None or self.published_at <= now())
+
+    def question(self, question_number):
+        """
+        Return the question at the given 1-based position, or None if
+        the number is out of bounds.
+        """
+        if 1 <= question_number <= self.total_questions:
+            return self.questions[question_number - 1]
+        return None
+
+    def for_take(self, take):
+        """
+        Return the quiz in the order a take sees it.
+
+        Each question gets its own generator, seeded by the take's seed
+        and the question id. The questions are sorted by a draw from
+        it, and it shuffles the question's answers, so the order is the
+        same on every request and adding or removing a question does
+        not reorder the rest. Only multiple choice answers are
+        shuffled; True/False keeps its fixed layout.
+
+        Args:
+            take (Take): The attempt.
+
+        Returns:
+            QuizSnapshot: A permuted copy of the snapshot, or the
+                snapshot itself if the quiz is not shuffled.
+        """
+        if not (self.shuffle_questions or self.shuffle_answers):
+            return self
+        return _permute_snapshot(self, take.seed)
+
+
+def _version_key(quiz_id):
+    return f"quiz_snapshot_version:{quiz_id}"
+
+
+def _snapshot_key(quiz_id, version):
+    return f"quiz_snapshot:{quiz_id}:{version}"
+
+
+def _new_version():
+    return str(time.time_ns())
+
+
+def get_quiz_version(quiz_id):
+    """
+    Return the current version token of a quiz, creating one if the
+    shared cache has none yet.
+    """
+    version = cache.get(_version_key(quiz_id))
+    if version is None:
+        # `add` keeps a version set concurrently by another process.
+        cache.add(_version_key(quiz_id), _new_version(), None)
+        version = cache.get(_version_key(quiz_id))
+    return version
+
+
+def invalidate_quiz_snapshot(quiz_id):
+    """
+    Move a quiz to a new version so that every cached snapshot of the
+    previous version is ignored from now on.
+    """
+    cache.set(_version_key(quiz_id), _new_version(), None)
+
+
+def invalidate_quiz_snapshot_on_commit(quiz_id):
+    """
+    Invalidate the snapshot of a quiz changed in the current
+    transaction: now, and again after commit, in case another request
+    cached a snapshot of the old rows under the new version in between.
+    """
+    invalidate_quiz_snapshot(quiz_id)
+    transaction.on_commit(lambda: invalidate_quiz_snapshot(quiz_id))
+
+
+def build_quiz_snapshot(quiz_id, version=''):
+    """
+    Build a snapshot of a quiz straight from the database.
+
+    Raises:
+        Quiz.DoesNotExist: If there is no quiz with the given id.
+    """
+    quiz = Quiz.objects.get(id=quiz_id)
+    questions = quiz.questions.order_by('position', 'id').prefetch_related('answers')
+
+    question_snapshots = []
+    answer_key = {}
+    answer_questions = {}
+    total_score = 0
+    for question in questions:
+        answers = tuple(
+            AnswerSnapshot(id=a.id, content=a.content, is_correct=a.is_correct)
+            for a in sorted(question.answers.all(), key=lambda a: a.id)
+        )
+        question_snapshots.append(QuestionSnapshot(
+            id=question.id,
+            position=question.position,
+            type=question.type,
+            level=question.level,
+            score=question.score,
+            content=question.content,
+            answers=answers,
+        ))
+        answer_key[question.id] = frozenset(a.id for a in answers if a.is_correct)
+        for answer in answers:
+            answer_questions[answer.id] = question.id
+        total_score += question.score
+
+    return QuizSnapshot(
+        id=quiz.id,
+        version=version,
+        title=quiz.title,
+        summary=quiz.summary or '',
+        content=quiz.content or '',
+        score=quiz.score,
+        published=quiz.published,
+        course_id=quiz.course_id,
+        questions=tuple(question_snapshots),
+        answer_key=answer_key,
+        answer_questions=answer_questions,
+        total_questions=len(question_snapshots),
+        total_score=total_score,
+        shuffle_questions=quiz.shuffle_questions,
+        shuffle_answers=quiz.shuffle_answers,
+        time_limit=quiz.time_limit,
+        published_at=quiz.published_at,
+    )
+
+
+def _permute_snapshot(quiz, seed):
+    keyed = []
+    for question in quiz.questions:
+        rng = random.Random(f"{seed}:{question.id}")
+        key = rng.random() if quiz.shuffle_questions else question.position
+        if quiz.shuffle_answers and question.type == Question.MULTIPLE_CHOICE:
+            question = replace(question, answers=tuple(rng.sample(question.answers, len(question.answers))))
+        keyed.append((key, question))
+    keyed.sort(key=lambda item: item[0])
+    return replace(quiz, questions=tuple(question for _, question in keyed))
+
+
+@lru_cache(maxsize=SNAPSHOT_LRU_SIZE)
+def _load_quiz_snapshot(quiz_id, version):
+    key = _snapshot_key(quiz_id, version)
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = build_quiz_snapshot(quiz_id, version)
+        cache.set(key, snapshot, SNAPSHOT_TIMEOUT)
+    return snapshot
+
+
+def get_quiz_snapshot(quiz_id):
+    """
+    Return the snapshot of the current version of a quiz.
+
+    In steady state this costs a single shared-cache read (the
+    version) and no database queries.
+
+    Args:
+        quiz_id (int): The id of the quiz.
+
+    Returns:
+        QuizSnapshot: The snapshot of the quiz.
+
+    Raises:
+        Quiz.DoesNotExist: If there is no quiz with the given id.
+    """
+    return _load_quiz_snapshot(quiz_id, get_quiz_version(quiz_id))
@@ -0,0 +1,205 @@
+// Resumable, chunked upload of a lesson attachment from the Lesson
+// admin page (see courses/uploads.py for the protocol).
+//
+// The file is read in slices, never whole: once to compute its SHA-256,
+// then again to send it chunk by chunk. An interrupted upload is
+// remembered per file and resumes from the offset the server reports.
+
+const CHUNK_SIZE = 8 * 1024 * 1024;
+
+// Incremental SHA-256, so that files of any size can be hashed slice
+// by slice (crypto.subtle can only hash a whole buffer).
+class Sha256 {
+    static K = new Uint32Array([
+        0x428a2f98, 0x71374491, 0xb5c0fbcf, 0xe9b5dba5, 0x3956c25b, 0x59f111f1, 0x923f82a4, 0xab1c5ed5,
+        0xd807aa98, 0x12835b01, 0x243185be, 0x550c7dc3, 0x72be5d74, 0x80deb1fe, 0x9bdc06a7, 0xc19bf174,
+        0xe49b69c1, 0xefbe4786, 0x0fc19dc6, 0x240ca1cc, 0x2de92c6f, 0x4a7484aa, 0x5cb0a9dc, 0x76f988da,
+        0x983e5152, 0xa831c66d, 0xb00327c8, 0xbf597fc7, 0xc6e00bf3, 0xd5a79147, 0x06ca6351, 0x14292967,
+        0x27b70a85, 0x2e1b2138, 0x4d2c6dfc, 0x53380d13, 0x650a7354, 0x766a0abb, 0x81c2c92e, 0x92722c85,
+        0xa2bfe8a1, 0xa81a664b, 0xc24b8b70, 0xc76c51a3, 0xd192e819, 0xd6990624, 0xf40e3585, 0x106aa070,
+        0x19a4c116, 0x1e376c08, 0x2748774c, 0x34b0bcb5, 0x391c0cb3, 0x4ed8aa4a, 0x5b9cca4f, 0x682e6ff3,
+        0x748f82ee, 0x78a5636f, 0x84c87814, 0x8cc70208, 0x90befffa, 0xa4506ceb, 0xbef9a3f7, 0xc67178f2,
+    ]);
+
+    constructor() {
+        this.state = new Uint32Array([
+            0x6a09e667, 0xbb67ae85, 0x3c6ef372, 0xa54ff53a, 0x510e527f, 0x9b05688c, 0x1f83d9ab, 0x5be0cd19,
+        ]);
+        this.block = new Uint8Array(64);
+        this.blockLength = 0;
+        this.length = 0;
+        this.words = new Uint32Array(64);
+    }
+
+    update(bytes) {
+        let position = 0;
+        this.length += bytes.length;
+        while (position < bytes.length) {
+            const taken = Math.min(64 - this.blockLength, bytes.length - position);
+            this.block.set(bytes.subarray(position, position + taken), this.blockLength);
+            this.blockLength += taken;
+            position += taken;
+            if (this.blockLength === 64) {
+                this.compress();
+                this.blockLength = 0;
+            }
+        }
+        return this;
+    }
+
+    compress() {
+        const w = this.words;
+        const s = this.state;
+        const rotr = (x, n) => (x >>> n) | (x << (32 - n));
+        for (let i = 0; i < 16; i++) {
+            const j = i * 4;
+            w[i] = (this.block[j] << 24) | (this.block[j + 1] << 16) | (this.block[j + 2] << 8) | this.block[j + 3];
+        }
+        for (let i = 16; i < 64; i++) {
+            const s0 = rotr(w[i - 15], 7) ^ rotr(w[i - 15], 18) ^ (w[i - 15] >>> 3);
+            const s1 = rotr(w[i - 2], 17) ^ rotr(w[i - 2], 19) ^ (w[i - 2] >>> 10);
+            w[i] = w[i - 16] + s0 + w[i - 7] + s1;
+        }
+        let [a, b, c, d, e, f, g, h] = s;
+        for (let i = 0; i < 64; i++) {
+            const t1 = h + (rotr(e, 6) ^ rotr(e, 11) ^ rotr(e, 25)) + ((e & f) ^ (~e & g)) + Sha256.K[i] + w[i];
+            const t2 = (rotr(a, 2) ^ rotr(a, 13) ^ rotr(a, 22)) + ((a & b) ^ (a & c) ^ (b & c));
+            h = g;
+            g = f;
+            f = e;
+            e = (d + t1) | 0;
+            d = c;
+            c = b;
+            b = a;
+            a = (t1 + t2) | 0;
+        }
+        s[0] += a; s[1] += b; s[2] += c; s[3] += d;
+        s[4] += e; s[5] += f; s[6] += g; s[7] += h;
+    }
+
+    digest() {
+        const bits = this.length * 8;
+        const padding = new Uint8Array(((this.blockLength < 56 ? 56 : 120) - this.blockLength) + 8);
+        padding[0] = 0x80;
+        const view = new DataView(padding.buffer);
+        view.setUint32(padding.length - 8, Math.floor(bits / 0x100000000));
+        view.setUint32(padding.length - 4, bits >>> 0);
+        this.update(padding);
+        const out = new Uint8Array(32);
+        const outView = new DataView(out.buffer);
+        this.state.forEach((word, i) => outView.setUint32(i * 4, word));
+        return out;
+    }
+}
+
+const toHex = (bytes) => Array.from(bytes, (byte) => byte.toString(16).padStart(2, "0")).join("");
+const toBase64 = (bytes) => btoa(String.fromCharCode(...bytes));
+
+const csrfToken = () => {
+    const input = document.querySelector("input[name='csrfmiddlewaretoken']");
+    return input ? input.value : "";
+};
+
+const readSlice = async (file, start, end) => new Uint8Array(await file.slice(start, end).arrayBuffer());
+
+async function hashFile(file, report) {
+    const hash = new Sha256();
+    for (let start = 0; start < file.size; start += CHUNK_SIZE) {
+        hash.update(await readSlice(file, start, start + CHUNK_SIZE));
+        report(`Checking file… ${Math.floor((100 * start) / file.size)}%`);
+    }
+    return toHex(hash.digest());
+}
+
+async function resumeOrStart(container, file, report) {
+    const memoryKey = `attachment-upload:${container.dataset.startUrl}:${file.name}:${file.size}:${file.lastModified}`;
+    const remembered = localStorage.getItem(memoryKey);
+    if (remembered) {
+        const response = await fetch(remembered, { method: "HEAD", credentials: "same-origin" });
+        if (response.ok) {
+            return { url: remembered, offset: Number(response.headers.get("Upload-Offset")), memoryKey };
+        }
+        localStorage.removeItem(memoryKey);
+    }
+    const form = new FormData();
+    form.append("filename", file.name);
+    form.append("size", file.size);
+    form.append("sha256", await hashFile(file, report));
+    const response = await fetch(container.dataset.startUrl, {
+        method: "POST",
+        body: form,
+        credentials: "same-origin",
+        headers: { "X-CSRFToken": csrfToken() },
+    });
+    const body = await response.json();
+    if (!response.ok) {
+        throw new Error(body.error);
+    }
+    localStorage.setItem(memoryKey, response.headers.get("Location"));
+    return { url: response.headers.get("Location"), offset: 0, memoryKey };
+}
+
+async function upload(container, file) {
+    const progress = container.querySelector("progress");
+    const status = container.querySelector(".chunked-upload-status");
+    const report = (message) => {
+        status.textContent = message;
+    };
+
+    let { url, offset, memoryKey } = await resumeOrStart(container, file, report);
+    let retries = 0;
+    while (offset < file.size) {
+        progress.value = (100 * offset) / file.size;
+        report(`Uploading… ${Math.floor(progress.value)}%`);
+        const chunk = await readSlice(file, offset, offset + CHUNK_SIZE);
+        const response = await fetch(url, {
+            method: "PATCH",
+            body: chunk,
+            credentials: "same-origin",
+            headers: {
+                "Content-Type": "application/offset+octet-stream",
+                "Upload-Offset": offset,
+                "Upload-Checksum": `sha256 ${toBase64(new Sha256().update(chunk).digest())}`,
+                "X-CSRFToken": csrfToken(),
+            },
+        });
+        const body = await response.json().catch(() => ({ error: response.statusText }));
+        if ((response.status === 409 || response.status === 422) && retries < 3) {
+            // Out of step or damaged on the way: carry on from where
+            // the server is
+            retries++;
+            offset = Number(response.headers.get("Upload-Offset"));
+            continue;
+        }
+        if (!response.ok) {
+            localStorage.removeItem(memoryKey);
+            throw new Error(body.error);
+        }
+        retries = 0;
+        offset = body.offset;
+    }
+    localStorage.removeItem(memoryKey);
+    progress.value = 100;
+    report("Uploaded. Reload the page to see the new attachment.");
+}
+
+document.addEventListener("DOMContentLoaded", () => {
+    document.querySelectorAll(".chunked-upload").forEach((container) => {
+        const input = container.querySelector("input[type='file']");
+        input.addEventListener("change", () => {
+            if (!input.files.length) {
+                return;
+            }
+            input.disabled = true;
+            upload(container, input.files[0])
+                .catch((error) => {
+                    container.querySelector(".chunked-upload-status").textContent =
+                        `Upload failed: ${error.message}. Choose the file again to resume.`;
+                })
+                .finally(() => {
+                    input.disabled = false;
+                    input.value = "";
+                });
+        });
+    });
+});
@@ -25,7 +25,7 @@ document.addEventListener('DOMContentLoaded', function () {
 
     // Fetch suggestions whenever user types
     searchInput.addEventListener("input", async function() {
-        const query = this.value.trim();
+        const query = foldQuery(this.value);
 
         // If empty, hide suggestions
         if (!query) {
@@ -106,6 +106,16 @@ document.addEventListener('DOMContentLoaded', function () {
     // ----------------------------------------
     // Helper functions
     // ----------------------------------------
+    function foldQuery(text) {
+        // Same folding as the server index, so equivalent queries share
+        // one cached response
+        return text.normalize("NFKD")
+            .replace(/[\u0300-\u036f]/g, "")
+            .toLowerCase()
+            .trim()
+            .replace(/\s+/g, " ");
+    }
+
     function highlightItem(index) {
         // Remove highlight from all items
         suggestionItems.forEach(item => item.classList.remove("highlight"));
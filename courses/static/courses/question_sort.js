@@ -0,0 +1,58 @@
+document.addEventListener("DOMContentLoaded", () => {
+    const group = document.querySelector(".sortable-questions");
+    if (!group) {
+        return;
+    }
+    const tbody = group.querySelector("tbody");
+    let dragged = null;
+
+    // Number the rows in their current order
+    const renumber = () => {
+        let position = 1;
+        tbody.querySelectorAll("tr.form-row:not(.empty-form)").forEach((row) => {
+            const input = row.querySelector("input[name$='-position']");
+            const deleted = row.querySelector("input[name$='-DELETE']");
+            if (input && !(deleted && deleted.checked)) {
+                input.value = position++;
+            }
+        });
+    };
+
+    const prepare = (row) => {
+        row.draggable = true;
+        row.style.cursor = "move";
+    };
+
+    tbody.querySelectorAll("tr.form-row").forEach(prepare);
+
+    tbody.addEventListener("dragstart", (event) => {
+        dragged = event.target.closest("tr.form-row");
+        event.dataTransfer.effectAllowed = "move";
+    });
+
+    tbody.addEventListener("dragover", (event) => {
+        const row = event.target.closest("tr.form-row");
+        if (!dragged || !row || row === dragged) {
+            return;
+        }
+        event.preventDefault();
+        const box = row.getBoundingClientRect();
+        const after = event.clientY > box.top + box.height / 2;
+        tbody.insertBefore(dragged, after ? row.nextSibling : row);
+    });
+
+    tbody.addEventListener("drop", (event) => {
+        event.preventDefault();
+        dragged = null;
+        renumber();
+    });
+
+    // Rows added with "Add another Question" can be dragged as well
+    document.addEventListener("formset:added", (event) => {
+        const row = event.target.closest ? event.target.closest("tr.form-row") : null;
+        if (row) {
+            prepare(row);
+            renumber();
+        }
+    });
+});
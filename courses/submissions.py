@@ -0,0 +1,182 @@
+"""
+Persistence of quiz answers submitted by students.
+
+Submissions are idempotent. Every rendered quiz form carries a
+one-time submission token; the first POST with a token claims it in
+the shared cache and stores the redirect it answered with, so a
+replayed POST (a double click, or a retry on a slow network) is sent
+to the same place without touching the database. Writes themselves
+are upserts and finishing a take is guarded by a row lock, so
+duplicates that slip past the cache are harmless as well.
+"""
+import re
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.timezone import now
+
+from .grading import finish_take, grade_take
+from .models import Take, TakeAnswer, TakeResult
+
+# How long a submission token is remembered.
+SUBMISSION_TIMEOUT = 60 * 10
+
+# Cached value of a claimed token whose request has not finished yet.
+_PENDING = ''
+
+_TOKEN_RE = re.compile(r'[0-9a-f]{32}')
+
+
+def new_submission_token():
+    """
+    Return a fresh token for a rendered quiz form.
+    """
+    return uuid.uuid4().hex
+
+
+def _submission_key(user_id, token):
+    return f"submission:{user_id}:{token}"
+
+
+def claim_submission(user_id, token):
+    """
+    Claim the token of a submitted form.
+
+    Args:
+        user_id (int): The id of the submitting user.
+        token (str): The token posted with the form.
+
+    Returns:
+        str: The redirect URL of the original submission if this POST
+            replays one that already completed, else None, in which
+            case the caller should process the submission.
+    """
+    if not token or not _TOKEN_RE.fullmatch(token):
+        return None
+    key = _submission_key(user_id, token)
+    if cache.add(key, _PENDING, SUBMISSION_TIMEOUT):
+        return None
+    # A replay of a request still in flight is processed again; the
+    # writes below are idempotent.
+    return cache.get(key) or None
+
+
+def complete_submission(user_id, token, url):
+    """
+    Remember where a processed submission redirected to.
+    """
+    if token and _TOKEN_RE.fullmatch(token):
+        cache.set(_submission_key(user_id, token), url, SUBMISSION_TIMEOUT)
+
+
+def release_submission(user_id, token):
+    """
+    Release the token of a submission that was rejected, so that the
+    corrected form can be posted again.
+    """
+    if token and _TOKEN_RE.fullmatch(token):
+        cache.delete(_submission_key(user_id, token))
+
+
+def start_take(user, quiz):
+    """
+    Return the user's attempt of a quiz, starting it if needed.
+
+    A new attempt of a timed quiz gets its deadline here.
+
+    Args:
+        user (User): The student.
+        quiz (QuizSnapshot): The snapshot of the quiz.
+
+    Returns:
+        Take: The attempt.
+    """
+    deadline = now() + quiz.time_limit if quiz.time_limit else None
+    take, _ = Take.objects.get_or_create(
+        user=user,
+        quiz_id=quiz.id,
+        defaults={'deadline': deadline}
+    )
+    return take
+
+
+def save_question_answers(take, question, selected_answers):
+    """
+    Store the answers of a single question of a take.
+
+    Answers of the question that are no longer selected are removed,
+    and the selected ones are upserted, so posting the same answers
+    twice leaves the same rows behind.
+
+    Args:
+        take (Take): The attempt being answered.
+        question (QuestionSnapshot): The answered question.
+        selected_answers (list): `(answer_id, content)` pairs.
+    """
+    selected_ids = [answer_id for answer_id, _ in selected_answers]
+    with transaction.atomic():
+        TakeAnswer.objects.filter(
+            take=take,
+            answer_id__in=[answer.id for answer in question.answers]
+        ).exclude(answer_id__in=selected_ids).delete()
+        TakeAnswer.objects.bulk_create(
+            [
+                TakeAnswer(take=take, answer_id=answer_id, content=content)
+                for answer_id, content in selected_answers
+            ],
+            update_conflicts=True,
+            unique_fields=['take', 'answer'],
+            update_fields=['content'],
+        )
+
+
+def complete_take(take, quiz=None):
+    """
+    Finish and grade a take, unless a concurrent request already did.
+
+    Args:
+        take (Take): The attempt to finish.
+        quiz (QuizSnapshot): The snapshot of the attempt's quiz, if
+            the caller already has it.
+
+    Returns:
+        TakeResult: The graded result of the take.
+    """
+    with transaction.atomic():
+        locked = Take.objects.select_for_update().get(id=take.id)
+        if locked.finished_at:
+            take.finished_at = locked.finished_at
+            result = TakeResult.objects.filter(take=locked).first()
+            return result or grade_take(locked, quiz)
+        return finish_take(take, quiz)
+
+
+def submit_quiz(take, quiz, selected_answers):
+    """
+    Store a whole-quiz submission, then finish and grade the take.
+
+    Any answers saved earlier for the take (e.g. from the
+    question-by-question mode) are replaced, and all new answers are
+    written with a single bulk insert inside one transaction. A take
+    that is already finished keeps its answers and result.
+
+    Args:
+        take (Take): The attempt being submitted.
+        quiz (QuizSnapshot): The snapshot of the attempt's quiz.
+        selected_answers (list): `(answer_id, content)` pairs, as
+            returned by `QuizSubmissionForm.selected_answers`.
+
+    Returns:
+        TakeResult: The graded result of the take.
+    """
+    take_answers = [
+        TakeAnswer(take=take, answer_id=answer_id, content=content)
+        for answer_id, content in selected_answers
+    ]
+
+    with transaction.atomic():
+        if Take.objects.select_for_update().filter(id=take.id, finished_at__isnull=True).exists():
+            TakeAnswer.objects.filter(take=take).delete()
+            TakeAnswer.objects.bulk_create(take_answers, ignore_conflicts=True)
+        return complete_take(take, quiz)
@@ -1,3 +1,1026 @@
-from django.test import TestCase
+import base64
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.contrib.auth.models import User, Group
+from django.core.cache import cache
+from django.core.management import call_command
+from core.models import StoredFile
+from .models import (
+    Course, Enrollment, Lesson, Quiz, Question, Answer, Take, TakeAnswer, TakeResult,
+    QuestionStatistics, CourseStats, AttachmentUpload
+)
+from django.utils.timezone import now
+from .deadlines import finalize_expired_takes
+from .exams import open_exam
+from .publishing import publish_due_quizzes
+from .search import search_courses, search_rowid
+from .autocomplete import get_index, suggest
+from .course_stats import reconcile_course_stats
+from . import downloads
+from core.scheduler import run_pending
+from .grading import quiz_regraded, regrade_quiz
+from .item_analysis import analyze_quiz, rebuild_quiz_statistics
+from .distributions import ScoreDistribution, get_distribution
+from .leaderboards import Leaderboard, load_leaderboard, quiz_board, course_board
+from .snapshot import get_quiz_snapshot
+from .pagination import encode_cursor
+from .caching import patch_cached
+from .uploads import discard_stale_uploads, partial_path
 
-# Create your tests here.
+
+class QuizTestCase(TestCase):
+    """
+    Shared fixtures: a teacher, a student enrolled in a course, and a
+    published quiz of the course with one Multiple Choice and one
+    True/False question.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.teacher = User.objects.create_user(
+            username="quizteacher",
+            password="testpassword"
+        )
+        self.teacher.groups.add(Group.objects.get_or_create(name='Teacher')[0])
+        self.student = User.objects.create_user(
+            username="quizstudent",
+            password="testpassword"
+        )
+        self.course = Course.objects.create(
+            title="Quiz Course",
+            description="A course with a quiz.",
+            teacher=self.teacher
+        )
+        self.quiz = Quiz.objects.create(
+            title="Quiz",
+            score=30,
+            published=True,
+            course=self.course
+        )
+        self.mc_question = Question.objects.create(
+            quiz=self.quiz,
+            type=Question.MULTIPLE_CHOICE,
+            score=20,
+            content="Which of these are planets?"
+        )
+        self.earth = Answer.objects.create(question=self.mc_question, content="Earth", is_correct=True)
+        self.mars = Answer.objects.create(question=self.mc_question, content="Mars", is_correct=True)
+        self.sun = Answer.objects.create(question=self.mc_question, content="Sun", is_correct=False)
+        self.tf_question = Question.objects.create(
+            quiz=self.quiz,
+            type=Question.TRUE_FALSE,
+            score=10,
+            content="The Earth is flat."
+        )
+        self.tf_true = Answer.objects.create(question=self.tf_question, content="True", is_correct=False)
+        self.tf_false = Answer.objects.create(question=self.tf_question, content="False", is_correct=True)
+        self.enrollment = Enrollment.objects.create(student=self.student, course=self.course)
+        self.client.login(username='quizstudent', password='testpassword')
+
+
+class QuizSnapshotTests(QuizTestCase):
+
+    def test_snapshot_is_served_without_queries(self):
+        """
+        Once built, the snapshot is served without touching the db.
+        """
+        snapshot = get_quiz_snapshot(self.quiz.id)
+        self.assertEqual(snapshot.total_questions, 2)
+        self.assertEqual(snapshot.answer_key[self.mc_question.id], {self.earth.id, self.mars.id})
+        with self.assertNumQueries(0):
+            self.assertIs(get_quiz_snapshot(self.quiz.id), snapshot)
+
+    def test_snapshot_is_invalidated_on_answer_change(self):
+        get_quiz_snapshot(self.quiz.id)
+        self.sun.is_correct = True
+        self.sun.save()
+        snapshot = get_quiz_snapshot(self.quiz.id)
+        self.assertIn(self.sun.id, snapshot.answer_key[self.mc_question.id])
+
+    def test_snapshot_is_invalidated_again_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sun.save()
+            # Cached by a concurrent request before the commit
+            stale = get_quiz_snapshot(self.quiz.id)
+        self.assertIsNot(get_quiz_snapshot(self.quiz.id), stale)
+
+    def test_cascading_delete_skips_answer_lookups(self):
+        get_quiz_snapshot(self.quiz.id)
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.mc_question.delete()
+        self.assertFalse(any(
+            'SELECT "courses_question"."quiz_id"' in query['sql'] for query in queries
+        ))
+        self.assertEqual(get_quiz_snapshot(self.quiz.id).total_questions, 1)
+
+    def test_quiz_question_page(self):
+        response = self.client.get(reverse('quiz_question', args=[self.quiz.id, 1]))
+        self.assertContains(response, "Which of these are planets?")
+        self.assertContains(response, "Question 1 of 2")
+
+
+class QuestionPositionTests(QuizTestCase):
+
+    def positions(self):
+        return list(self.quiz.questions.values_list('content', 'position'))
+
+    def test_positions_follow_inserts_moves_and_deletes(self):
+        self.assertEqual([p for _, p in self.positions()], [1, 2])
+        first = Question.objects.create(
+            quiz=self.quiz,
+            type=Question.SHORT_ANSWER,
+            score=0,
+            content="Name a moon.",
+            position=1
+        )
+        self.assertEqual(self.positions(), [
+            ("Name a moon.", 1), ("Which of these are planets?", 2), ("The Earth is flat.", 3)
+        ])
+
+        first.move_to(3)
+        self.assertEqual([c for c, _ in self.positions()], [
+            "Which of these are planets?", "The Earth is flat.", "Name a moon."
+        ])
+
+        self.mc_question.delete()
+        self.assertEqual(self.positions(), [("The Earth is flat.", 1), ("Name a moon.", 2)])
+
+    def test_question_number_follows_position(self):
+        self.tf_question.move_to(1)
+        snapshot = get_quiz_snapshot(self.quiz.id)
+        self.assertEqual(snapshot.question(1).id, self.tf_question.id)
+        response = self.client.get(reverse('quiz_question', args=[self.quiz.id, 1]))
+        self.assertContains(response, "The Earth is flat.")
+
+
+class QuizShuffleTests(QuizTestCase):
+
+    def question_page_queries(self):
+        url = reverse('quiz_question', args=[self.quiz.id, 1])
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        return len(queries)
+
+    def test_order_is_stable_per_take(self):
+        self.quiz.shuffle_questions = True
+        self.quiz.shuffle_answers = True
+        self.quiz.save()
+        quiz = get_quiz_snapshot(self.quiz.id)
+        orders = set()
+        for seed in range(20):
+            take = Take(seed=seed)
+            shuffled = quiz.for_take(take)
+            self.assertEqual(shuffled, quiz.for_take(take))
+            self.assertEqual({q.id for q in shuffled.questions}, {q.id for q in quiz.questions})
+            orders.add(tuple(
+                (q.id, tuple(a.id for a in q.answers)) for q in shuffled.questions
+            ))
+        self.assertGreater(len(orders), 1)
+
+    def test_shuffling_adds_no_queries(self):
+        plain = self.question_page_queries()
+        self.quiz.shuffle_questions = True
+        self.quiz.save()
+        self.assertEqual(self.question_page_queries(), plain)
+
+
+class QuizSinglePageTests(QuizTestCase):
+
+    def test_whole_quiz_submission(self):
+        """
+        One POST stores every answer and finishes the take.
+        """
+        url = reverse('quiz_single_page', args=[self.quiz.id])
+        response = self.client.get(url)
+        self.assertContains(response, "The Earth is flat.")
+
+        response = self.client.post(url, {
+            f'question_{self.mc_question.id}': [self.earth.id, self.mars.id],
+            f'question_{self.tf_question.id}': self.tf_false.id,
+        })
+        take = Take.objects.get(user=self.student, quiz=self.quiz)
+        self.assertRedirects(response, reverse('quiz_result', args=[take.id]))
+        self.assertIsNotNone(take.finished_at)
+        self.assertEqual(
+            set(take.take_answers.values_list('answer_id', flat=True)),
+            {self.earth.id, self.mars.id, self.tf_false.id}
+        )
+
+    def test_invalid_answer_is_rejected(self):
+        url = reverse('quiz_single_page', args=[self.quiz.id])
+        response = self.client.post(url, {
+            f'question_{self.tf_question.id}': self.earth.id,
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Take.objects.filter(user=self.student, quiz=self.quiz).exists())
+
+
+class IdempotentSubmissionTests(QuizTestCase):
+
+    def test_replayed_submission_returns_original_redirect(self):
+        url = reverse('quiz_single_page', args=[self.quiz.id])
+        token = self.client.get(url).context['submission_token']
+        data = {
+            'submission_token': token,
+            f'question_{self.mc_question.id}': [self.earth.id],
+            f'question_{self.tf_question.id}': self.tf_false.id,
+        }
+        first = self.client.post(url, data)
+        take = Take.objects.get(user=self.student, quiz=self.quiz)
+        graded_at = TakeResult.objects.get(take=take).graded_at
+
+        data[f'question_{self.tf_question.id}'] = self.tf_true.id
+        with CaptureQueriesContext(connection) as queries:
+            replay = self.client.post(url, data)
+        self.assertEqual(replay.url, first.url)
+        # Only the session and the user are loaded
+        self.assertFalse([q for q in queries if 'courses_' in q['sql']])
+        self.assertEqual(TakeResult.objects.get(take=take).graded_at, graded_at)
+
+    def test_repeated_question_posts_are_upserts(self):
+        first = reverse('quiz_question', args=[self.quiz.id, 1])
+        last = reverse('quiz_question', args=[self.quiz.id, 2])
+        for answers in ([self.earth.id, self.sun.id], [self.earth.id], [self.earth.id]):
+            self.client.post(first, {'answer': answers})
+        take = Take.objects.get(user=self.student, quiz=self.quiz)
+        self.assertEqual(list(take.take_answers.values_list('answer_id', flat=True)), [self.earth.id])
+
+        for _ in range(2):
+            response = self.client.post(last, {'answer': self.tf_false.id})
+        self.assertRedirects(response, reverse('quiz_result', args=[take.id]))
+        self.assertEqual(TakeResult.objects.get(take=take).score, 30)
+
+
+class TimedQuizTests(QuizTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.quiz.time_limit = timedelta(minutes=30)
+        self.quiz.save()
+
+    def expire(self, take):
+        Take.objects.filter(id=take.id).update(
+            created_at=now() - timedelta(hours=1),
+            deadline=now() - timedelta(minutes=30)
+        )
+
+    def test_expired_takes_are_finalized_in_batches(self):
+        self.client.post(reverse('quiz_question', args=[self.quiz.id, 1]), {
+            'answer': [self.earth.id, self.mars.id]
+        })
+        take = Take.objects.get(user=self.student, quiz=self.quiz)
+        self.assertIsNotNone(take.deadline)
+        self.expire(take)
+
+        self.assertEqual(finalize_expired_takes(), 1)
+        take.refresh_from_db()
+        self.assertEqual(take.finished_at, take.deadline)
+        self.assertEqual(take.score, 20)
+        self.assertEqual(TakeResult.objects.get(take=take).score, 20)
+        self.assertEqual(finalize_expired_takes(), 0)
+
+    def test_quiz_is_rebuilt_once_after_all_batches(self):
+        for username in ("late1", "late2", "late3"):
+            user = User.objects.create_user(username=username, password="testpassword")
+            take = Take.objects.create(user=user, quiz=self.quiz)
+            TakeAnswer.objects.create(take=take, answer=self.earth)
+            self.expire(take)
+        receiver = mock.Mock()
+        quiz_regraded.connect(receiver, sender=Quiz)
+        self.addCleanup(quiz_regraded.disconnect, receiver, sender=Quiz)
+
+        self.assertEqual(finalize_expired_takes(batch_size=1), 3)
+        receiver.assert_called_once_with(signal=quiz_regraded, sender=Quiz, quiz_id=self.quiz.id)
+
+    def test_untouched_exam_takes_are_not_graded(self):
+        open_exam(self.quiz)
+        take = Take.objects.get(user=self.student, quiz=self.quiz)
+        self.expire(take)
+
+        self.assertEqual(finalize_expired_takes(), 0)
+        take.refresh_from_db()
+        self.assertIsNone(take.finished_at)
+        self.assertFalse(TakeResult.objects.filter(take=take).exists())
+        self.assertEqual(CourseStats.objects.get(course=self.course).graded_takes, 0)
+
+    def test_late_answers_are_rejected(self):
+        url = reverse('quiz_question', args=[self.quiz.id, 1])
+        self.client.get(url)
+        take = Take.objects.get(user=self.student, quiz=self.quiz)
+        self.expire(take)
+
+        response = self.client.post(url, {'answer': [self.earth.id]})
+        self.assertRedirects(response, reverse('quiz_result', args=[take.id]))
+        take.refresh_from_db()
+        self.assertEqual(take.score, 0)
+        self.assertFalse(take.take_answers.exists())
+
+
+class OpenExamTests(QuizTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.quiz.published = False
+        self.quiz.published_at = None
+        self.quiz.time_limit = timedelta(minutes=45)
+        self.quiz.save()
+
+    def test_concurrent_attempts_keep_their_start(self):
+        other = User.objects.create_user(username="practice", password="testpassword")
+        bulk_create = Take.objects.bulk_create
+
+        def insert_concurrently(*args, **kwargs):
+            # Another request starts an attempt while the exam opens
+            Take.objects.create(user=other, quiz=self.quiz)
+            return bulk_create(*args, **kwargs)
+
+        with mock.patch.object(Take.objects, 'bulk_create', side_effect=insert_concurrently):
+            _, opens_at = open_exam(self.quiz)
+        self.assertEqual(Take.objects.get(user=self.student, quiz=self.quiz).created_at, opens_at)
+        self.assertNotEqual(Take.objects.get(user=other, quiz=self.quiz).created_at, opens_at)
+
+    def test_first_page_load_is_read_only(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            created, opens_at = open_exam(self.quiz)
+        self.assertEqual(created, 1)
+        take = Take.objects.get(user=self.student, quiz=self.quiz)
+        self.assertEqual(take.created_at, opens_at)
+        self.assertEqual(take.deadline, opens_at + timedelta(minutes=45))
+        self.assertEqual(open_exam(self.quiz)[0], 0)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('quiz_question', args=[self.quiz.id, 1]))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([q for q in queries if not q['sql'].startswith('SELECT')])
+
+    def test_scheduled_exam_opens_at_publish_time(self):
+        self.quiz.published_at = now() + timedelta(hours=2)
+        self.quiz.save()
+        open_exam(self.quiz)
+        take = Take.objects.get(user=self.student, quiz=self.quiz)
+        self.assertEqual(take.created_at, self.quiz.published_at)
+        response = self.client.get(reverse('quiz_question', args=[self.quiz.id, 1]))
+        self.assertEqual(response.status_code, 404)
+
+
+class ScheduledPublishingTests(QuizTestCase):
+
+    def test_due_quizzes_are_published_in_bulk(self):
+        self.quiz.published = False
+        self.quiz.published_at = None
+        self.quiz.publish_at = now() + timedelta(hours=1)
+        self.quiz.save()
+        url = reverse('course_lesson', args=[self.course.id])
+        self.assertNotContains(self.client.get(url), "Start Quiz")
+        self.assertEqual(publish_due_quizzes(), 0)
+
+        Quiz.objects.filter(id=self.quiz.id).update(publish_at=now() - timedelta(minutes=1))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(dict(run_pending(force=True))['publish_due_quizzes'], 1)
+        self.quiz.refresh_from_db()
+        self.assertTrue(self.quiz.published)
+        self.assertIsNone(self.quiz.publish_at)
+
+        with self.assertNumQueries(0):
+            self.assertTrue(get_quiz_snapshot(self.quiz.id).is_open())
+        self.assertContains(self.client.get(url), "Start Quiz")
+
+
+class QuizGradingTests(QuizTestCase):
+
+    def submit(self, data):
+        self.client.post(reverse('quiz_single_page', args=[self.quiz.id]), data)
+        return Take.objects.get(user=self.student, quiz=self.quiz)
+
+    def test_take_is_graded_on_submission(self):
+        take = self.submit({
+            f'question_{self.mc_question.id}': [self.earth.id],
+            f'question_{self.tf_question.id}': self.tf_true.id,
+        })
+        result = TakeResult.objects.get(take=take)
+        self.assertEqual(result.score, 20)
+        self.assertEqual(take.score, 20)
+        self.assertEqual(
+            [entry['earned'] for entry in result.breakdown],
+            ['20.00', '0.00']
+        )
+
+    def test_result_page_is_read_only(self):
+        take = self.submit({
+            f'question_{self.mc_question.id}': [self.earth.id, self.sun.id],
+            f'question_{self.tf_question.id}': self.tf_false.id,
+        })
+        graded_at = TakeResult.objects.get(take=take).graded_at
+        response = self.client.get(reverse('quiz_result', args=[take.id]))
+        self.assertEqual(response.context['score'], 10)
+        self.assertContains(response, "(Incorrect)")
+        self.assertEqual(TakeResult.objects.get(take=take).graded_at, graded_at)
+
+
+class QuizRegradeTests(QuizTestCase):
+
+    def test_regrade_after_answer_key_change(self):
+        self.client.post(reverse('quiz_single_page', args=[self.quiz.id]), {
+            f'question_{self.mc_question.id}': [self.earth.id, self.sun.id],
+            f'question_{self.tf_question.id}': self.tf_false.id,
+        })
+        take = Take.objects.get(user=self.student, quiz=self.quiz)
+        self.assertEqual(take.score, 10)
+
+        self.sun.is_correct = True
+        self.sun.save()
+        self.assertEqual(regrade_quiz(self.quiz.id), (1, 1))
+
+        take.refresh_from_db()
+        self.assertEqual(take.score, 30)
+        result = TakeResult.objects.get(take=take)
+        self.assertEqual(result.score, 30)
+        self.assertEqual(result.breakdown[0]['earned'], '20.00')
+        self.assertEqual(regrade_quiz(self.quiz.id), (1, 0))
+
+
+class ItemAnalysisTests(QuizTestCase):
+
+    def setUp(self):
+        super().setUp()
+        submissions = [
+            ([self.earth.id, self.mars.id], self.tf_false.id),
+            ([self.earth.id], self.tf_false.id),
+            ([self.sun.id], self.tf_true.id),
+        ]
+        for i, (mc, tf) in enumerate(submissions):
+            user = User.objects.create_user(username=f"analysed{i}", password="testpassword")
+            Enrollment.objects.create(student=user, course=self.course)
+            self.client.login(username=f"analysed{i}", password="testpassword")
+            self.client.post(reverse('quiz_single_page', args=[self.quiz.id]), {
+                f'question_{self.mc_question.id}': mc,
+                f'question_{self.tf_question.id}': tf,
+            })
+
+    def test_statistics_are_updated_incrementally(self):
+        analysis = analyze_quiz(self.quiz.id)
+        self.assertEqual(analysis['takes'], 3)
+        mc, tf = analysis['questions']
+        self.assertAlmostEqual(mc['difficulty'], 2 / 3)
+        self.assertAlmostEqual(tf['difficulty'], 2 / 3)
+        self.assertAlmostEqual(mc['discrimination'], 1.0)
+        self.assertAlmostEqual(analysis['alpha'], 1.0)
+        self.assertEqual(
+            [rate for _, rate in mc['answers']],
+            [2 / 3, 1 / 3, 1 / 3]
+        )
+
+    def test_rebuild_matches_incremental_statistics(self):
+        def counters():
+            return sorted(QuestionStatistics.objects.filter(quiz=self.quiz).values_list(
+                'question_id', 'attempts', 'correct', 'correct_total_sum'
+            ))
+        incremental = counters()
+        rebuild_quiz_statistics(self.quiz.id)
+        self.assertEqual(counters(), incremental)
+
+
+class LeaderboardTests(QuizTestCase):
+
+    def test_ties_are_broken_by_duration(self):
+        leaderboard = Leaderboard('quiz:1', [
+            (1, 20, timedelta(minutes=5)),
+            (2, 30, timedelta(minutes=9)),
+            (3, 20, timedelta(minutes=2)),
+        ])
+        self.assertEqual([user_id for _, user_id, _, _ in leaderboard.top()], [2, 3, 1])
+        leaderboard.set(1, 40, timedelta(minutes=5))
+        self.assertEqual(leaderboard.rank(1), 1)
+        self.assertEqual(leaderboard.rank(3), 3)
+
+    def test_boards_follow_graded_takes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('quiz_single_page', args=[self.quiz.id]), {
+                f'question_{self.mc_question.id}': [self.earth.id],
+                f'question_{self.tf_question.id}': self.tf_false.id,
+            })
+        self.assertEqual(load_leaderboard(quiz_board(self.quiz.id)).rank(self.student.id), 1)
+        self.assertEqual(load_leaderboard(course_board(self.course.id)).rank(self.student.id), 1)
+
+        cache.clear()
+        response = self.client.get(reverse('quiz_leaderboard', args=[self.quiz.id]))
+        self.assertEqual(response.context['my_rank'], 1)
+        self.assertContains(response, "quizstudent")
+
+    def test_concurrent_patch_drops_the_cached_value(self):
+        cache.set('board', [1], 60)
+
+        def patch(value):
+            value.append(2)
+            # Another process patches the key meanwhile
+            patch_cached('board', lambda other: other.append(3), 60)
+
+        patch_cached('board', patch, 60)
+        self.assertIsNone(cache.get('board'))
+        cache.set('board', [1], 60)
+        patch_cached('board', lambda value: value.append(2), 60)
+        self.assertEqual(cache.get('board'), [1, 2])
+
+
+class ScoreDistributionTests(QuizTestCase):
+
+    def test_percentile_and_histogram(self):
+        distribution = ScoreDistribution(30, [0, 10, 10, 20, 30])
+        self.assertEqual(distribution.percentile(10), 40)
+        self.assertEqual(distribution.percentile(30), 90)
+        distribution.add(25)
+        self.assertEqual(len(distribution), 6)
+        self.assertEqual(sum(count for _, _, count, _ in distribution.buckets()), 6)
+        self.assertEqual(distribution.histogram[-1], 1)
+
+    def test_result_page_shows_percentile(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('quiz_single_page', args=[self.quiz.id]), {
+                f'question_{self.mc_question.id}': [self.earth.id],
+                f'question_{self.tf_question.id}': self.tf_false.id,
+            })
+        take = Take.objects.get(user=self.student, quiz=self.quiz)
+        self.assertEqual(len(get_distribution(self.quiz.id)), 1)
+        response = self.client.get(reverse('quiz_result', args=[take.id]))
+        self.assertEqual(response.context['percentile'], 50)
+
+
+class CourseSearchTests(QuizTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.astronomy = Course.objects.create(
+            title="Planets",
+            description="Stars, planets and <b>galaxies</b>.",
+            teacher=self.teacher
+        )
+        self.physics = Course.objects.create(
+            title="Physics",
+            description="Mechanics and optics.",
+            teacher=self.teacher
+        )
+        Lesson.objects.create(course=self.physics, title="Orbits", description="Kepler's laws of planetary motion.")
+        # bm25 needs a corpus where the searched terms are rare
+        for subject in ("History", "Chemistry", "Biology", "Music", "Geography"):
+            Course.objects.create(title=subject, description=f"An introduction to {subject}.", teacher=self.teacher)
+
+    def test_results_are_ranked_with_snippets(self):
+        results = search_courses("planet")
+        self.assertEqual(
+            [result.course_id for result in results],
+            [self.astronomy.id, self.physics.id]
+        )
+        self.assertIn("<mark>Planets</mark>", results[0].snippet)
+        self.assertIn("<mark>planetary</mark>", results[1].snippet)
+        snippet = search_courses("galaxies")[0].snippet
+        self.assertIn("&lt;b&gt;<mark>galaxies</mark>", snippet)
+
+    def test_index_follows_changes(self):
+        self.astronomy.title = "Astronomy"
+        self.astronomy.description = "Telescopes."
+        self.astronomy.save()
+        self.assertEqual([r.course_id for r in search_courses("planet")], [self.physics.id])
+        self.physics.lessons.all().delete()
+        self.assertEqual(search_courses("planet"), [])
+        self.teacher.first_name = "Ada"
+        self.teacher.save()
+        self.assertIn(self.physics.id, [r.course_id for r in search_courses("ada")])
+
+    def test_rows_are_found_by_rowid(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.physics.save()
+        deletes = [query['sql'] for query in queries if 'DELETE FROM courses_search' in query['sql']]
+        self.assertTrue(deletes)
+        self.assertTrue(all('WHERE rowid =' in sql for sql in deletes))
+
+        call_command('rebuild_search_index', stdout=io.StringIO())
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT rowid, kind, object_id FROM courses_search")
+            rows = cursor.fetchall()
+        self.assertEqual(len(rows), Course.objects.count() + Lesson.objects.count())
+        self.assertTrue(all(rowid == search_rowid(kind, int(object_id)) for rowid, kind, object_id in rows))
+        self.assertEqual([r.course_id for r in search_courses("optics")], [self.physics.id])
+
+    def test_course_list_search(self):
+        response = self.client.get(reverse('course_list'), {'q': 'optics'})
+        self.assertEqual([course.id for course in response.context['courses']], [self.physics.id])
+        self.assertContains(response, "<mark>optics</mark>")
+
+
+class AutocompleteTests(QuizTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.physics = Course.objects.create(title="Φυσική Λυκείου", teacher=self.teacher)
+        self.python = Course.objects.create(title="Python Basics", teacher=self.teacher)
+        self.intro = Course.objects.create(title="Intro to Python", teacher=self.teacher)
+
+    def titles(self, prefix):
+        return [item['title'] for item in suggest(prefix)]
+
+    def test_matches_are_case_and_accent_folded(self):
+        self.assertEqual(self.titles("φυσικη"), ["Φυσική Λυκείου"])
+        self.assertEqual(self.titles("ΛΥΚΕΙ"), ["Φυσική Λυκείου"])
+        # Titles starting with the prefix come first
+        self.assertEqual(self.titles("pyth"), ["Python Basics", "Intro to Python"])
+        self.assertEqual(self.titles("  "), [])
+
+    def test_steady_state_lookups_skip_the_database(self):
+        suggest("py")
+        with self.assertNumQueries(0):
+            self.assertEqual(self.titles("intro"), ["Intro to Python"])
+            response = self.client.get(reverse('course_suggestions'), {'q': 'φυσ'})
+        self.assertEqual(response.json(), [{'id': self.physics.id, 'title': "Φυσική Λυκείου"}])
+        self.assertIn("max-age=30", response['Cache-Control'])
+
+    def test_index_follows_changes(self):
+        suggest("py")
+        in_use = get_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.python.title = "Advanced Python"
+            self.python.save()
+            self.intro.delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.titles("pyth"), ["Advanced Python"])
+            self.assertEqual(self.titles("adv"), ["Advanced Python"])
+        # A search still reading the previous index is not disturbed
+        self.assertEqual([title for _, title in in_use.search("pyth")], ["Python Basics", "Intro to Python"])
+        # Another process moving the version on forces a rebuild
+        cache.clear()
+        Course.objects.filter(id=self.physics.id).update(title="Χημεία")
+        self.assertEqual(self.titles("χημ"), ["Χημεία"])
+
+    def test_saves_keeping_the_title_leave_the_index(self):
+        suggest("py")
+        in_use = get_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.python.description = "Loops and lists"
+            self.python.save()
+            self.intro.save(update_fields=['description'])
+        self.assertIs(get_index(), in_use)
+
+
+class CourseCatalogTests(QuizTestCase):
+
+    def setUp(self):
+        super().setUp()
+        other = User.objects.create_user(username="otherteacher", password="testpassword")
+        other.groups.add(Group.objects.get(name='Teacher'))
+        for i in range(15):
+            Course.objects.create(title=f"Course {i}", description="", teacher=other if i % 2 else self.teacher)
+        # Same creation time: ties are broken by id
+        Course.objects.update(created_at=now())
+        self.client.login(username="quizstudent", password="testpassword")
+
+    def test_pages_cover_catalog_once_with_constant_queries(self):
+        # Warm the per-user navigation fragment
+        self.client.get(reverse('course_list'))
+        seen, counts, cursors = [], [], []
+        cursor = None
+        while True:
+            params = {'cursor': cursor} if cursor else {}
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('course_list'), params)
+            counts.append(len(queries))
+            page = response.context['page']
+            seen += [course.id for course in page.items]
+            cursors.append(page.previous_cursor)
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+        all_courses = Course.objects.count()
+        self.assertEqual(len(counts), -(-all_courses // 12))
+        self.assertEqual(seen, sorted(seen, reverse=True))
+        self.assertEqual(len(set(seen)), all_courses)
+        # A full page and the short last page cost the same
+        self.assertEqual(len(set(counts)), 1)
+        self.assertIsNone(cursors[0])
+
+        response = self.client.get(reverse('course_list'), {'cursor': cursors[-1]})
+        self.assertEqual([course.id for course in response.context['page'].items], seen[:12])
+
+    def test_popular_pages_seek_on_the_counters(self):
+        for course in Course.objects.all():
+            CourseStats.objects.filter(course=course).update(enrollments=course.id % 4)
+        expected = list(
+            CourseStats.objects.order_by('-enrollments', '-course_id').values_list('course_id', flat=True)
+        )
+        seen, cursor = [], None
+        while True:
+            params = {'sort': 'popular', **({'cursor': cursor} if cursor else {})}
+            response = self.client.get(reverse('course_list'), params)
+            page = response.context['page']
+            seen += [course.id for course in page.items]
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+            self.assertContains(response, ">Next</a>")
+        self.assertEqual(seen, expected)
+        self.assertContains(response, ">Previous</a>")
+
+    def test_enrollment_is_annotated(self):
+        response = self.client.get(reverse('course_list'), {'enrolled_only': '1'})
+        courses = response.context['courses']
+        self.assertEqual([course.id for course in courses], [self.course.id])
+        self.assertTrue(courses[0].is_enrolled)
+        self.assertContains(response, "Enter to Course")
+
+    def test_bad_cursor_shows_first_page(self):
+        response = self.client.get(reverse('course_list'), {'cursor': 'nonsense'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.context['page'].previous_cursor)
+
+        newest = encode_cursor(('created_at', 'id'), [now(), self.course.id], 'next')
+        forged = encode_cursor(('created_at', 'id'), [5, self.course.id], 'next')
+        for sort, cursor in (('popular', newest), ('newest', forged)):
+            response = self.client.get(reverse('course_list'), {'sort': sort, 'cursor': cursor})
+            self.assertEqual(response.status_code, 200)
+            self.assertIsNone(response.context['page'].previous_cursor)
+
+
+class CourseStatsTests(QuizTestCase):
+
+    def stats(self):
+        return CourseStats.objects.get(course=self.course)
+
+    def test_counters_follow_changes(self):
+        self.enrollment.delete()
+        stats = self.stats()
+        self.assertEqual((stats.enrollments, stats.lessons, stats.quizzes), (0, 0, 1))
+        enrollment = Enrollment.objects.create(student=self.student, course=self.course)
+        lesson = Lesson.objects.create(course=self.course, title="Orbits")
+        self.client.post(reverse('quiz_single_page', args=[self.quiz.id]), {
+            f'question_{self.mc_question.id}': [self.earth.id],
+            f'question_{self.tf_question.id}': self.tf_true.id,
+        })
+        stats = self.stats()
+        self.assertEqual((stats.enrollments, stats.lessons, stats.graded_takes), (1, 1, 1))
+        self.assertAlmostEqual(stats.average_score, 200 / 3)
+        self.assertEqual(stats.last_activity_at, Take.objects.get(quiz=self.quiz).finished_at)
+
+        enrollment.delete()
+        lesson.delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.quiz.delete()
+        stats = self.stats()
+        self.assertEqual((stats.enrollments, stats.lessons, stats.quizzes, stats.graded_takes), (0, 0, 0, 0))
+        self.assertIsNone(stats.average_score)
+
+    def test_reconcile_repairs_drift(self):
+        reconcile_course_stats()
+        CourseStats.objects.filter(course=self.course).update(enrollments=7, quizzes=0)
+        checked, repaired = reconcile_course_stats(chunk_size=1)
+        self.assertEqual(checked, Course.objects.count())
+        self.assertEqual(repaired, 1)
+        self.assertEqual((self.stats().enrollments, self.stats().quizzes), (1, 1))
+        self.assertEqual(reconcile_course_stats(), (checked, 0))
+
+    def test_popular_courses_read_the_counters(self):
+        CourseStats.objects.filter(course=self.course).update(enrollments=1000)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('homepage'))
+        self.assertEqual(response.context['popular_courses'][0], self.course)
+        self.assertFalse(any('courses_enrollment' in query['sql'] for query in queries))
+
+        response = self.client.get(reverse('course_list'), {'sort': 'popular'})
+        self.assertEqual(response.context['courses'][0], self.course)
+
+
+class EnrollmentAccessTests(QuizTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.outsider = User.objects.create_user(username="outsider", password="testpassword")
+
+    def test_only_members_see_course_and_quiz_pages(self):
+        self.client.login(username="outsider", password="testpassword")
+        for url in (
+            reverse('course_lesson', args=[self.course.id]),
+            reverse('quiz_page', args=[self.quiz.id]),
+            reverse('quiz_single_page', args=[self.quiz.id]),
+            reverse('course_leaderboard', args=[self.course.id]),
+        ):
+            self.assertRedirects(self.client.get(url), reverse('course_list'), fetch_redirect_response=False)
+
+        Enrollment.objects.create(student=self.outsider, course=self.course)
+        response = self.client.get(reverse('course_lesson', args=[self.course.id]))
+        self.assertEqual(response.status_code, 200)
+
+        self.client.login(username="quizteacher", password="testpassword")
+        response = self.client.get(reverse('course_lesson', args=[self.course.id]))
+        self.assertEqual(response.status_code, 200)
+
+    def test_membership_checks_add_no_queries(self):
+        url = reverse('quiz_single_page', args=[self.quiz.id])
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertFalse(any('courses_enrollment' in query['sql'] for query in queries))
+
+        self.enrollment.delete()
+        self.assertRedirects(self.client.get(url), reverse('course_list'), fetch_redirect_response=False)
+
+
+class AttachmentTests(QuizTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=self.media, PRIVATE_MEDIA_ROOT=os.path.join(self.media, 'private'))
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.content = bytes(range(256)) * 1024
+        self.lesson = Lesson.objects.create(
+            course=self.course,
+            title="Notes",
+            description="",
+            attachment=SimpleUploadedFile('notes.pdf', self.content)
+        )
+        self.url = reverse('lesson_attachment', args=[self.course.id, self.lesson.id])
+
+    def test_members_only(self):
+        User.objects.create_user(username="outsider", password="testpassword")
+        self.client.login(username="outsider", password="testpassword")
+        self.assertRedirects(self.client.get(self.url), reverse('course_list'), fetch_redirect_response=False)
+
+    def test_no_public_url(self):
+        self.client.logout()
+        with self.assertRaises(ValueError):
+            self.lesson.attachment.url
+        self.assertFalse(self.lesson.attachment.path.startswith(self.media + os.sep + 'cas'))
+        public = '/media/cas/' + self.lesson.attachment.name.split('/', 1)[1]
+        self.assertEqual(self.client.get(public).status_code, 404)
+
+    def test_full_download_and_revalidation(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('attachment; filename="notes.pdf"', response['Content-Disposition'])
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_range_requests(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=1000-1999')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f"bytes 1000-1999/{len(self.content)}")
+        self.assertEqual(b''.join(response.streaming_content), self.content[1000:2000])
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-10')
+        self.assertEqual(b''.join(response.streaming_content), self.content[-10:])
+
+        # A stale If-Range gets the whole, current file
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.content)}-')
+        self.assertEqual(response.status_code, 416)
+
+    def test_web_server_offload(self):
+        with mock.patch.object(downloads, 'ATTACHMENT_SENDFILE', 'x-accel-redirect'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], f"/protected-media/{self.lesson.attachment.name}")
+        self.assertEqual(response.content, b'')
+
+
+class PrivateAttachmentMigrationTests(TransactionTestCase):
+    migrate_from = [('courses', '0020_content_storage')]
+    migrate_to = [('courses', '0021_private_attachments')]
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=self.media, PRIVATE_MEDIA_ROOT=os.path.join(self.media, 'private'))
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(self.migrate, MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def test_legacy_attachments_are_moved_to_private_storage(self):
+        apps = self.migrate(self.migrate_from)
+        teacher = apps.get_model('auth', 'User').objects.create(username="legacyteacher")
+        course = apps.get_model('courses', 'Course').objects.create(title="Legacy", description="", teacher=teacher)
+        with open(os.path.join(self.media, 'testLesson.docx'), 'wb') as file:
+            file.write(b'legacy slides')
+        apps.get_model('courses', 'Lesson').objects.create(
+            course=course, title="Legacy", description="", attachment='testLesson.docx'
+        )
+
+        apps = self.migrate(self.migrate_to)
+        lesson = Lesson.objects.get(title="Legacy")
+        self.assertRegex(lesson.attachment.name, r'^attachments/[0-9a-f]{2}/[0-9a-f]{64}\.docx$')
+        with lesson.attachment.open('rb') as attachment:
+            self.assertEqual(attachment.read(), b'legacy slides')
+        self.assertEqual(StoredFile.objects.get(name=lesson.attachment.name).references, 1)
+        self.assertFalse(os.path.exists(os.path.join(self.media, 'testLesson.docx')))
+
+
+def chunk_checksum(data):
+    return "sha256 " + base64.b64encode(hashlib.sha256(data).digest()).decode()
+
+
+class ChunkedUploadTests(QuizTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        settings = override_settings(
+            MEDIA_ROOT=self.media, PRIVATE_MEDIA_ROOT=os.path.join(self.media, 'private'),
+            ATTACHMENT_UPLOAD_DIR=os.path.join(self.media, 'partial'))
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.lesson = Lesson.objects.create(course=self.course, title="Video", description="")
+        self.content = os.urandom(300 * 1024)
+        self.client.login(username="quizteacher", password="testpassword")
+
+    def start(self, sha256=None):
+        return self.client.post(reverse('start_attachment_upload', args=[self.course.id, self.lesson.id]), {
+            'filename': 'lecture.mp4',
+            'size': len(self.content),
+            'sha256': sha256 or hashlib.sha256(self.content).hexdigest(),
+        })
+
+    def send(self, url, offset, data, checksum=None):
+        return self.client.patch(
+            url, data, content_type='application/offset+octet-stream',
+            headers={'Upload-Offset': str(offset), 'Upload-Checksum': checksum or chunk_checksum(data)}
+        )
+
+    def test_only_the_teacher_may_upload(self):
+        self.client.login(username="quizstudent", password="testpassword")
+        self.assertEqual(self.start().status_code, 403)
+
+    def test_resumable_upload(self):
+        response = self.start()
+        self.assertEqual(response.status_code, 201)
+        url = response['Location']
+        first, second = self.content[:100 * 1024], self.content[100 * 1024:]
+
+        self.assertEqual(self.send(url, 0, first).json()['offset'], len(first))
+        # A corrupt chunk is refused and cut off again
+        response = self.send(url, len(first), second, checksum=chunk_checksum(b'other'))
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(response['Upload-Offset'], str(len(first)))
+        # So is a chunk sent from the wrong offset
+        self.assertEqual(self.send(url, 0, first).status_code, 409)
+        self.assertEqual(self.client.head(url)['Upload-Offset'], str(len(first)))
+
+        # The running digest of the chunks spares reading the file again
+        with mock.patch('courses.uploads._hash_file', side_effect=AssertionError):
+            response = self.send(url, len(first), second)
+        self.assertTrue(response.json()['complete'])
+        self.lesson.refresh_from_db()
+        self.assertIn(hashlib.sha256(self.content).hexdigest(), self.lesson.attachment.name)
+        with self.lesson.attachment.open('rb') as attachment:
+            self.assertEqual(attachment.read(), self.content)
+        self.assertFalse(AttachmentUpload.objects.exists())
+        self.assertEqual(os.listdir(os.path.join(self.media, 'partial')), [])
+
+    def test_failed_finish_is_retried(self):
+        url = self.start()['Location']
+        with mock.patch('courses.uploads._AssembledFile', side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                self.send(url, 0, self.content)
+        self.assertEqual(self.client.head(url)['Upload-Offset'], str(len(self.content)))
+        # An empty chunk at the end of the file finishes it
+        response = self.send(url, len(self.content), b'')
+        self.assertTrue(response.json()['complete'])
+        self.lesson.refresh_from_db()
+        with self.lesson.attachment.open('rb') as attachment:
+            self.assertEqual(attachment.read(), self.content)
+        self.assertEqual(self.send(url, len(self.content), b'').status_code, 404)
+
+    def test_assembled_file_is_verified(self):
+        url = self.start(sha256='0' * 64)['Location']
+        response = self.send(url, 0, self.content)
+        self.assertEqual(response.status_code, 422)
+        self.lesson.refresh_from_db()
+        self.assertFalse(self.lesson.attachment)
+        self.assertFalse(AttachmentUpload.objects.exists())
+
+    def test_stale_uploads_are_discarded(self):
+        self.start()
+        upload = AttachmentUpload.objects.get()
+        AttachmentUpload.objects.update(updated_at=now() - timedelta(days=2))
+        self.assertEqual(discard_stale_uploads(), 1)
+        self.assertFalse(os.path.exists(partial_path(upload)))
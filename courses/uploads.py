@@ -0,0 +1,327 @@
+"""
+Resumable, chunked uploads of lesson attachments.
+
+A client starts an upload by declaring the file's name, length and
+SHA-256, then sends the bytes in order, each chunk in a PATCH request
+carrying the offset it starts at and the SHA-256 of its own bytes:
+
+    POST   /course/<course_id>/lesson/<lesson_id>/uploads/
+           filename, size, sha256              -> 201, Location
+    PATCH  /uploads/<upload_id>/
+           Upload-Offset: <offset>
+           Upload-Checksum: sha256 <base64 digest of the chunk>
+    HEAD   /uploads/<upload_id>/              -> Upload-Offset
+    DELETE /uploads/<upload_id>/
+
+Chunks are copied from the request into a partial file in
+`upload_dir()` in `UPLOAD_BLOCK_SIZE` blocks, so memory use does not
+depend on the size of the file or of a chunk. A chunk that is cut
+short or fails its checksum is cut off the partial file again; after
+an interruption the client asks for the offset and resumes from there.
+
+The process receiving the chunks keeps a running SHA-256 of the file,
+so when the last chunk arrives the assembled file is checked against
+the declared SHA-256 without reading it again (only an upload whose
+chunks went to other processes is hashed from disk), then moved into
+the storage as the lesson's attachment; the storage names it after
+that digest without hashing it a second time. Should finishing fail,
+an empty PATCH at the end of the file tries again:
+
+    PATCH  /uploads/<upload_id>/
+           Upload-Offset: <size>
+           Content-Length: 0
+"""
+import base64
+import binascii
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils.timezone import now
+
+from .models import AttachmentUpload, Lesson
+
+logger = logging.getLogger(__name__)
+
+# Size of the blocks chunks are copied and files hashed in
+UPLOAD_BLOCK_SIZE = 64 * 1024
+
+# Largest chunk a single request may carry
+MAX_CHUNK_SIZE = getattr(settings, 'ATTACHMENT_UPLOAD_MAX_CHUNK_SIZE', 32 * 1024 * 1024)
+
+# Largest file that may be uploaded
+MAX_UPLOAD_SIZE = getattr(settings, 'ATTACHMENT_UPLOAD_MAX_SIZE', 5 * 1024 ** 3)
+
+# Uploads with no chunk for this long are discarded
+STALE_UPLOAD_AGE = timedelta(days=1)
+
+_SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+
+# Running SHA-256 of the uploads this process received the chunks of,
+# by upload id, with the offset they reached
+_running_digests = {}
+_running_lock = threading.Lock()
+
+
+class UploadError(Exception):
+    """
+    A request that cannot be applied to an upload.
+
+    Attributes:
+        status (int): The HTTP status to answer with.
+    """
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class _AssembledFile(File):
+    # Lets the storage move the partial file into place instead of
+    # copying it, and name it after its verified SHA-256
+    def __init__(self, file, name, sha256):
+        super().__init__(file, name)
+        self.sha256 = sha256
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def upload_dir():
+    """
+    Return the directory partial files are assembled in:
+    `ATTACHMENT_UPLOAD_DIR`, `FILE_UPLOAD_TEMP_DIR` or the system's.
+    """
+    return (
+        getattr(settings, 'ATTACHMENT_UPLOAD_DIR', None)
+        or settings.FILE_UPLOAD_TEMP_DIR
+        or tempfile.gettempdir()
+    )
+
+
+def partial_path(upload):
+    return os.path.join(upload_dir(), f"attachment-{upload.id}.part")
+
+
+def start_upload(lesson, user, filename, size, sha256):
+    """
+    Start a resumable upload of a lesson's attachment.
+
+    Args:
+        lesson (Lesson): The lesson the file is for.
+        user (User): The user sending it.
+        filename (str): The name of the file.
+        size (str | int): The length of the file, in bytes.
+        sha256 (str): The hex SHA-256 digest of the whole file.
+
+    Returns:
+        AttachmentUpload: The new upload, at offset 0.
+
+    Raises:
+        UploadError: If the declared file is invalid or too large.
+    """
+    filename = os.path.basename(filename or '').strip()
+    if not filename:
+        raise UploadError("A file name is required.")
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise UploadError("The file size must be a number of bytes.")
+    if size < 1:
+        raise UploadError("The file is empty.")
+    if size > MAX_UPLOAD_SIZE:
+        raise UploadError(f"Files may be at most {MAX_UPLOAD_SIZE} bytes.", status=413)
+    sha256 = (sha256 or '').lower()
+    if not _SHA256_RE.match(sha256):
+        raise UploadError("The SHA-256 must be 64 hex digits.")
+
+    upload = AttachmentUpload.objects.create(
+        lesson=lesson,
+        uploaded_by=user,
+        filename=filename[:255],
+        size=size,
+        sha256=sha256
+    )
+    os.makedirs(upload_dir(), exist_ok=True)
+    open(partial_path(upload), 'wb').close()
+    return upload
+
+
+def _chunk_digest(checksum):
+    algorithm, _, value = (checksum or '').partition(' ')
+    if algorithm.lower() != 'sha256':
+        raise UploadError("Upload-Checksum must be 'sha256 <base64 digest>'.")
+    try:
+        digest = base64.b64decode(value.strip(), validate=True)
+    except binascii.Error:
+        digest = b''
+    if len(digest) != hashlib.sha256().digest_size:
+        raise UploadError("Upload-Checksum must be 'sha256 <base64 digest>'.")
+    return digest
+
+
+def write_chunk(upload_id, offset, stream, length, checksum):
+    """
+    Append a chunk to an upload, and finish the upload if it was the
+    last one. An empty chunk at the end of the file finishes an upload
+    whose finishing failed.
+
+    Args:
+        upload_id (UUID): The id of the upload.
+        offset (int): The position of the chunk in the file; must be
+            the number of bytes received so far.
+        stream: The request, read in blocks.
+        length (int): The length of the chunk.
+        checksum (str): The `Upload-Checksum` header of the chunk.
+
+    Returns:
+        AttachmentUpload: The upload, with its new offset. It is
+            complete (and deleted) when its offset reached its size.
+
+    Raises:
+        UploadError: If the chunk is out of place, too large, short or
+            corrupt. The upload is left at its previous offset.
+    """
+    expected = _chunk_digest(checksum) if length else None
+    with transaction.atomic():
+        # One chunk at a time per upload
+        upload = AttachmentUpload.objects.select_for_update().filter(pk=upload_id).first()
+        if upload is None:
+            raise UploadError("The upload is complete or was cancelled.", status=404)
+        if offset != upload.offset:
+            raise UploadError(f"The upload is at offset {upload.offset}.", status=409)
+        if length is None or (length < 1 and offset < upload.size):
+            raise UploadError("The chunk must have a Content-Length.", status=411)
+        if length > MAX_CHUNK_SIZE or offset + length > upload.size:
+            raise UploadError("The chunk is too large.", status=413)
+        if length:
+            _append_chunk(upload, offset, stream, length, expected)
+
+    if upload.offset == upload.size:
+        finish_upload(upload)
+    return upload
+
+
+def _running_digest(upload, offset):
+    # A copy of the running SHA-256 of the bytes before `offset`, or
+    # None when this process did not see them all
+    if offset == 0:
+        return hashlib.sha256()
+    with _running_lock:
+        reached, running = _running_digests.get(upload.id, (None, None))
+        return running.copy() if reached == offset else None
+
+
+def _append_chunk(upload, offset, stream, length, expected):
+    running = _running_digest(upload, offset)
+    digest = hashlib.sha256()
+    try:
+        file = open(partial_path(upload), 'r+b')
+    except FileNotFoundError:
+        # The partial file was cleaned away; the row goes with the
+        # other stale uploads
+        raise UploadError("The upload has expired.", status=410)
+    with file:
+        # Drop whatever an interrupted chunk left past the offset
+        file.truncate(offset)
+        file.seek(offset)
+        remaining = length
+        while remaining:
+            block = stream.read(min(UPLOAD_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            file.write(block)
+            digest.update(block)
+            if running is not None:
+                running.update(block)
+            remaining -= len(block)
+        if remaining or digest.digest() != expected:
+            file.truncate(offset)
+            raise UploadError("The chunk does not match its checksum.", status=422)
+
+    upload.offset = offset + length
+    upload.save(update_fields=['offset', 'updated_at'])
+    with _running_lock:
+        if running is not None:
+            _running_digests[upload.id] = (upload.offset, running)
+        else:
+            _running_digests.pop(upload.id, None)
+
+
+def _hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(UPLOAD_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def finish_upload(upload):
+    """
+    Verify an assembled file and make it the lesson's attachment.
+
+    Safe to call again after a failure, or concurrently: an upload
+    finished meanwhile is left alone.
+
+    Raises:
+        UploadError: If the file does not match its declared SHA-256,
+            or is gone; the upload is discarded.
+    """
+    error = None
+    with transaction.atomic():
+        upload = AttachmentUpload.objects.select_for_update().filter(pk=upload.pk).first()
+        if upload is None or upload.offset != upload.size:
+            return
+        path = partial_path(upload)
+        with _running_lock:
+            reached, running = _running_digests.get(upload.id, (None, None))
+        try:
+            sha256 = running.hexdigest() if reached == upload.size else _hash_file(path)
+            file = open(path, 'rb')
+        except FileNotFoundError:
+            error = UploadError("The upload has expired.", status=410)
+        else:
+            with file:
+                if sha256 == upload.sha256:
+                    lesson = Lesson.objects.get(pk=upload.lesson_id)
+                    lesson.attachment.save(upload.filename, _AssembledFile(file, upload.filename, sha256))
+                else:
+                    error = UploadError("The uploaded file does not match its SHA-256.", status=422)
+        abort_upload(upload)
+    if error is not None:
+        raise error
+
+
+def abort_upload(upload):
+    """
+    Delete an upload and its partial file.
+    """
+    AttachmentUpload.objects.filter(pk=upload.pk).delete()
+    with _running_lock:
+        _running_digests.pop(upload.pk, None)
+    try:
+        os.remove(partial_path(upload))
+    except FileNotFoundError:
+        pass
+
+
+def discard_stale_uploads(max_age=STALE_UPLOAD_AGE):
+    """
+    Delete the uploads that received no chunk for `max_age`.
+
+    Returns:
+        int: The number of uploads discarded.
+    """
+    stale = list(AttachmentUpload.objects.filter(updated_at__lt=now() - max_age))
+    for upload in stale:
+        abort_upload(upload)
+    if stale:
+        logger.info("Discarded %d stale attachment uploads", len(stale))
+    return len(stale)
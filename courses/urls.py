@@ -6,10 +6,16 @@ urlpatterns = [
     path('course/enroll/<int:course_id>/',views.enroll_course_view,name='enroll_course'),
     path('courses/enrolled/', views.enrolled_courses_view, name='enrolled_courses'),
     path('course/lesson/<int:course_id>/', views.course_lessons_view, name='course_lesson'),
+    path('course/<int:course_id>/lesson/<int:lesson_id>/attachment/', views.lesson_attachment, name='lesson_attachment'),
+    path('course/<int:course_id>/lesson/<int:lesson_id>/uploads/', views.start_attachment_upload, name='start_attachment_upload'),
+    path('uploads/<uuid:upload_id>/', views.attachment_upload, name='attachment_upload'),
     path('courses/suggestions/', views.course_suggestions, name='course_suggestions'),
     path('courses/teachers', views.teachers_view, name="teachers"),
 
     path('quiz/<int:quiz_id>/', views.redirect_to_first_question, name='quiz_page'),
     path('quiz/<int:quiz_id>/question/<int:question_number>/', views.quiz_question, name='quiz_question'),
+    path('quiz/<int:quiz_id>/all/', views.quiz_single_page, name='quiz_single_page'),
     path('quiz/result/<int:take_id>/', views.quiz_result, name="quiz_result"),
+    path('quiz/<int:quiz_id>/leaderboard/', views.quiz_leaderboard, name='quiz_leaderboard'),
+    path('course/<int:course_id>/leaderboard/', views.course_leaderboard, name='course_leaderboard'),
 ]
\ No newline at end of file
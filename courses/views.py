@@ -1,12 +1,44 @@
+import os
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import HttpResponse, JsonResponse
-from .models import Course, Enrollment, Lesson, Quiz, Question, Answer, Take, TakeAnswer
+from django.urls import reverse
+from django.http import HttpResponse, JsonResponse, Http404
+from .models import AttachmentUpload, Course, Enrollment, Lesson, Quiz, Question, Answer, Take, TakeAnswer, TakeResult
 from .forms import QuizSubmissionForm
+from .distributions import get_distribution
+from .downloads import serve_attachment
+from .enrollments import can_manage_course, enrollment_required, is_enrolled
+from .grading import grade_take
+from .leaderboards import leaderboard_context, quiz_board, course_board
+from .autocomplete import SUGGESTIONS_MAX_AGE, suggest
+from .listings import get_course_quizzes
+from .pagination import keyset_paginate
+from .search import search_courses
+from .snapshot import get_quiz_snapshot
+from .uploads import UploadError, abort_upload, start_upload, write_chunk
+from .submissions import (
+    claim_submission, complete_submission, release_submission,
+    new_submission_token, start_take, save_question_answers, complete_take, submit_quiz
+)
+from django.utils.text import slugify
 from django.utils.timezone import now
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.cache import cache_control, never_cache
+from django.views.decorators.http import require_http_methods, require_POST
 from django.contrib import messages
 from collections import defaultdict
+from decimal import Decimal
 from django.contrib.auth.models import User, Group
+from django.db.models import Exists, OuterRef
+
+# Courses on a page of the catalog
+COURSES_PER_PAGE = 12
+
+# Keyset orderings of the catalog, in descending order; the popular
+# ordering walks course_stats_popular_idx
+CATALOG_SORTS = {
+    'newest': ('created_at', 'id'),
+    'popular': ('stats__enrollments', 'stats__course_id'),
+}
 
 
 # @login_required
@@ -32,43 +64,66 @@ from django.contrib.auth.models import User, Group
 
 @login_required
 def course_list_view(request):
+    """
+    Display the course catalog a page at a time, newest or most popular
+    first, or the ranked results of a search.
+
+    The courses of a page come with their teacher, their counters and
+    the enrollment status of the user in a single query, so a page
+    costs the same number of queries whatever its size.
+    """
     query = request.GET.get('q', '')
     enrolled_only = request.GET.get('enrolled_only')
-
-    courses = Course.objects.all()
-
-    if query:
-        courses = courses.filter(title__icontains=query)
-
-    enrolled_courses = Enrollment.objects.filter(
-        student=request.user
-    ).values_list('course_id', flat=True)
-
+    sort = request.GET.get('sort')
+    if sort not in CATALOG_SORTS:
+        sort = 'newest'
+
+    courses = Course.objects.select_related('teacher', 'stats').annotate(
+        is_enrolled=Exists(
+            Enrollment.objects.filter(course=OuterRef('pk'), student=request.user)
+        ),
+    )
     if enrolled_only == "1":
-        courses = courses.filter(id__in=enrolled_courses)
+        courses = courses.filter(is_enrolled=True)
 
-    # enrollment status of user in courses
-    for course in courses:
-        course.is_enrolled = course.id in enrolled_courses
+    page = None
+    if query:
+        # Ranked full-text search, best matches first; bounded by the
+        # search itself, so not paginated.
+        results = search_courses(query)
+        courses_by_id = courses.in_bulk([result.course_id for result in results])
+        courses = []
+        for result in results:
+            course = courses_by_id.get(result.course_id)
+            if course is not None:
+                course.snippet = result.snippet
+                courses.append(course)
+    else:
+        keys = CATALOG_SORTS[sort]
+        if sort == 'popular':
+            # Every course has its stats row; an inner join lets the
+            # index drive the ordering
+            courses = courses.filter(stats__isnull=False)
+        try:
+            page = keyset_paginate(courses, request.GET.get('cursor'), COURSES_PER_PAGE, keys)
+        except ValueError:
+            page = keyset_paginate(courses, None, COURSES_PER_PAGE, keys)
+        courses = page.items
 
     return render(request, 'courses/course_list.html', {
         'courses': courses,
+        'page': page,
+        'sort': sort,
     })
 
+@cache_control(public=True, max_age=SUGGESTIONS_MAX_AGE)
 def course_suggestions(request):
+    """
+    Returns up to five course titles matching the typed prefix, from
+    the in-process autocomplete index.
+    """
     query = request.GET.get('q', '')
-
-    # Filter course titles by the query
-    courses = Course.objects.filter(title__icontains=query)[:5]
-
-    # Create a list of results.
-    data = []
-    for course in courses:
-        data.append({
-            'id': course.id,
-            'title': course.title,
-        })
-    return JsonResponse(data, safe=False)
+    return JsonResponse(suggest(query), safe=False)
 
 @login_required
 def enroll_course_view(request, course_id):
@@ -90,7 +145,7 @@ def enroll_course_view(request, course_id):
         # Check if the password is correct
         if course.password and course.password == entered_password:
             # Check if the user is already enrolled
-            if Enrollment.objects.filter(course=course, student=request.user).exists():
+            if is_enrolled(request.user, course.id):
                 messages.warning(request, "You are already enrolled in the course.")
                 return redirect('course_list')
 
@@ -115,6 +170,7 @@ def enrolled_courses_view(request):
     return render(request, 'courses/enrolled_courses.html', {'enrolled_courses': enrolled_courses})
 
 @login_required
+@enrollment_required
 def course_lessons_view(request, course_id):
     """
     View για να εμφανίζει τα lessons ενός μαθήματος στο οποίο είναι εγγεγραμμένος ο χρήστης.
@@ -140,7 +196,11 @@ def course_lessons_view(request, course_id):
     else:
         lesson = course.lessons.first()
 
-    quizzes = course.quizzes.all()
+    # Published quizzes from the cached listing, once they open
+    quizzes = [
+        quiz for quiz in get_course_quizzes(course.id)
+        if quiz['published_at'] is None or quiz['published_at'] <= now()
+    ]
 
     return render(request, 'courses/course_lessons.html', {
         'course': course,
@@ -149,78 +209,241 @@ def course_lessons_view(request, course_id):
     })
 
 @login_required
+@enrollment_required
+def lesson_attachment(request, course_id, lesson_id):
+    """
+    Sends the attachment of a lesson to the members of its course.
+
+    Supports conditional and range requests (see `courses.downloads`).
+    """
+    lesson = get_object_or_404(Lesson.objects.only('title', 'attachment'), id=lesson_id, course_id=course_id)
+    if not lesson.attachment:
+        raise Http404("This lesson has no attachment.")
+    # Stored files are named by their content hash: name the download
+    # after the lesson
+    extension = os.path.splitext(lesson.attachment.name)[1]
+    filename = f"{slugify(lesson.title, allow_unicode=True) or 'attachment'}{extension}"
+    try:
+        return serve_attachment(request, lesson.attachment, filename)
+    except FileNotFoundError:
+        raise Http404("The attachment file is missing.")
+
+def _upload_response(upload, status=200):
+    complete = upload.offset == upload.size
+    response = JsonResponse({
+        'id': str(upload.id),
+        'offset': upload.offset,
+        'size': upload.size,
+        'complete': complete,
+        'attachment_url': reverse(
+            'lesson_attachment', args=[upload.lesson.course_id, upload.lesson_id]
+        ) if complete else None,
+    }, status=status)
+    response['Upload-Offset'] = str(upload.offset)
+    response['Upload-Length'] = str(upload.size)
+    return response
+
+@login_required
+@require_POST
+def start_attachment_upload(request, course_id, lesson_id):
+    """
+    Starts a resumable upload of a lesson's attachment, for the
+    teacher of the course (see `courses.uploads`).
+    """
+    lesson = get_object_or_404(Lesson.objects.select_related('course'), id=lesson_id, course_id=course_id)
+    if not can_manage_course(request.user, course_id):
+        return JsonResponse({'error': "Only the teacher of the course may upload attachments."}, status=403)
+    try:
+        upload = start_upload(
+            lesson,
+            request.user,
+            request.POST.get('filename'),
+            request.POST.get('size'),
+            request.POST.get('sha256')
+        )
+    except UploadError as error:
+        return JsonResponse({'error': str(error)}, status=error.status)
+    response = _upload_response(upload, status=201)
+    response['Location'] = reverse('attachment_upload', args=[upload.id])
+    return response
+
+@never_cache
+@login_required
+@require_http_methods(['GET', 'HEAD', 'PATCH', 'DELETE'])
+def attachment_upload(request, upload_id):
+    """
+    Reports the offset of an upload (GET, HEAD), appends a chunk to it
+    (PATCH) or cancels it (DELETE).
+    """
+    upload = get_object_or_404(
+        AttachmentUpload.objects.select_related('lesson'), id=upload_id, uploaded_by=request.user
+    )
+    if request.method == 'DELETE':
+        abort_upload(upload)
+        return HttpResponse(status=204)
+    if request.method == 'PATCH':
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+            # A request without a body may leave out its Content-Length
+            length = int(request.headers.get('Content-Length') or 0)
+        except ValueError:
+            return JsonResponse({'error': "Upload-Offset and Content-Length are required."}, status=400)
+        try:
+            upload = write_chunk(upload.id, offset, request, length, request.headers.get('Upload-Checksum'))
+        except UploadError as error:
+            response = JsonResponse({'error': str(error)}, status=error.status)
+            response['Upload-Offset'] = str(
+                AttachmentUpload.objects.filter(id=upload.id).values_list('offset', flat=True).first() or 0
+            )
+            return response
+    return _upload_response(upload)
+
+def get_published_quiz_snapshot(quiz_id):
+    """
+    Return the cached snapshot of a published quiz.
+
+    Raises:
+        Http404: If the quiz does not exist, is not published or does
+            not open yet.
+    """
+    try:
+        quiz = get_quiz_snapshot(quiz_id)
+    except Quiz.DoesNotExist:
+        raise Http404("No Quiz matches the given query.")
+    if not quiz.is_open():
+        raise Http404("No Quiz matches the given query.")
+    return quiz
+
+@login_required
+@enrollment_required
 def quiz_question(request, quiz_id, question_number):
-    # Fetch the quiz and ensure it's published
-    quiz = get_object_or_404(Quiz, id=quiz_id, published=True)
+    # Fetch the cached quiz structure and ensure it's published
+    quiz = get_published_quiz_snapshot(quiz_id)
+
+    # A replayed POST is sent where the original submission went
+    token = request.POST.get('submission_token') if request.method == 'POST' else None
+    replayed_url = claim_submission(request.user.id, token)
+    if replayed_url:
+        return redirect(replayed_url)
 
     # Check if the user already completed the quiz
-    existing_take = Take.objects.filter(user=request.user, quiz=quiz).first()
+    existing_take = Take.objects.filter(user=request.user, quiz_id=quiz.id).first()
     if existing_take and existing_take.finished_at:
         messages.info(request, "You have already completed this quiz.")
         return redirect('quiz_result', take_id=existing_take.id)
 
-    # Fetch all questions for this quiz, ordered by their creation
-    questions = quiz.questions.all().order_by('id')
-
     # Ensure the question number is valid
-    if question_number < 1 or question_number > questions.count():
+    if not 1 <= question_number <= quiz.total_questions:
         return redirect('quiz_page', quiz_id=quiz.id)
 
     # Get or create a new Take for the user if not already started
-    take, _ = Take.objects.get_or_create(user=request.user, quiz=quiz)
+    take = existing_take
+    if take is None:
+        take = start_take(request.user, quiz)
 
-    # Get the current question
-    question = questions[question_number - 1]
+    # An attempt past its deadline is submitted as it is
+    if take.is_expired():
+        complete_take(take, quiz)
+        messages.info(request, "Time is up. Your answers have been submitted.")
+        return redirect('quiz_result', take_id=take.id)
 
-    # Pre-calculate answers for True/False questions
-    true_answer = None
-    false_answer = None
-    if question.type == Question.TRUE_FALSE:
-        true_answer = question.answers.filter(is_correct=True).first()
-        false_answer = question.answers.filter(is_correct=False).first()
+    # Get the question at this position, in the order of this take
+    question = quiz.for_take(take).question(question_number)
 
     # Handle form submission
     if request.method == 'POST':
-        user_answers = request.POST.getlist('answer')  # For multiple-choice questions
-
         if question.type == Question.SHORT_ANSWER:
-            user_answer = request.POST.get('answer')
-            if user_answer:
-                TakeAnswer.objects.update_or_create(
-                    take=take,
-                    answer=None,
-                    content=user_answer,
-                    defaults={'created_at': now()}
-                )
+            # Short answers are stored against the question's first answer
+            user_answer = request.POST.get('answer', '').strip()
+            selected = []
+            if user_answer and question.answers:
+                selected.append((question.answers[0].id, user_answer))
         else:
-            for user_answer in user_answers:
-                answer = question.answers.filter(id=user_answer).first()
-                if answer:
-                    TakeAnswer.objects.update_or_create(
-                        take=take,
-                        answer=answer,
-                        defaults={'content': answer.content, 'created_at': now()}
-                    )
-
-        if question_number < questions.count():
-            return redirect('quiz_question', quiz_id=quiz.id, question_number=question_number + 1)
+            # Validate the submitted ids against the cached answers
+            answers = {str(answer.id): answer for answer in question.answers}
+            selected = [
+                (answers[answer_id].id, None)
+                for answer_id in dict.fromkeys(request.POST.getlist('answer'))
+                if answer_id in answers
+            ]
+        save_question_answers(take, question, selected)
+
+        if question_number < quiz.total_questions:
+            url = reverse('quiz_question', args=[quiz.id, question_number + 1])
         else:
-            # Mark the quiz as completed
-            take.finished_at = now()
-            take.save()
-            return redirect('quiz_result', take_id=take.id)
+            # Mark the quiz as completed and grade it
+            complete_take(take, quiz)
+            url = reverse('quiz_result', args=[take.id])
+        complete_submission(request.user.id, token, url)
+        return redirect(url)
 
     return render(request, 'quiz/quiz_question.html', {
         'quiz': quiz,
         'question': question,
         'question_number': question_number,
-        'total_questions': questions.count(),
-        'true_answer': true_answer,
-        'false_answer': false_answer,
+        'total_questions': quiz.total_questions,
+        'true_answer': question.true_answer,
+        'false_answer': question.false_answer,
+        'deadline': take.deadline,
+        'submission_token': new_submission_token(),
+    })
+
+
+@login_required
+@enrollment_required
+def quiz_single_page(request, quiz_id):
+    """
+    Renders every question of a quiz on one page and accepts the whole
+    submission in a single POST.
+    """
+    quiz = get_published_quiz_snapshot(quiz_id)
+
+    # A replayed POST is sent where the original submission went
+    token = request.POST.get('submission_token') if request.method == 'POST' else None
+    replayed_url = claim_submission(request.user.id, token)
+    if replayed_url:
+        return redirect(replayed_url)
+
+    # Check if the user already completed the quiz
+    take = Take.objects.filter(user=request.user, quiz_id=quiz.id).first()
+    if take and take.finished_at:
+        messages.info(request, "You have already completed this quiz.")
+        return redirect('quiz_result', take_id=take.id)
+
+    # A shuffled quiz is laid out in the order of the user's take, and
+    # the clock of a timed quiz starts when it is first shown
+    if take is None and (quiz.shuffle_questions or quiz.shuffle_answers or quiz.time_limit):
+        take = start_take(request.user, quiz)
+
+    # An attempt past its deadline is submitted as it is
+    if take and take.is_expired():
+        complete_take(take, quiz)
+        messages.info(request, "Time is up. Your answers have been submitted.")
+        return redirect('quiz_result', take_id=take.id)
+
+    form = QuizSubmissionForm(request.POST or None, quiz=quiz.for_take(take) if take else quiz)
+
+    if request.method == 'POST':
+        if form.is_valid():
+            if take is None:
+                take = start_take(request.user, quiz)
+            submit_quiz(take, quiz, form.selected_answers())
+            url = reverse('quiz_result', args=[take.id])
+            complete_submission(request.user.id, token, url)
+            return redirect(url)
+        release_submission(request.user.id, token)
+
+    return render(request, 'quiz/quiz_form.html', {
+        'quiz': quiz,
+        'form': form,
+        'total_questions': quiz.total_questions,
+        'deadline': take.deadline if take else None,
+        'submission_token': new_submission_token(),
     })
 
 
 @login_required
+@enrollment_required
 def redirect_to_first_question(request, quiz_id):
     """
     Redirects to the first question of the quiz.
@@ -229,52 +452,84 @@ def redirect_to_first_question(request, quiz_id):
 
 @login_required
 def quiz_result(request, take_id):
-    take = get_object_or_404(Take, id=take_id, user=request.user)
-    quiz = take.quiz
-
-    # Fetch all user answers and group them by question
-    user_answers = take.take_answers.select_related('answer', 'answer__question')
-    
-    answers_by_question = {}
-    for user_answer in user_answers:
-        question = user_answer.answer.question if user_answer.answer else None
-        if question:
-            if question not in answers_by_question:
-                answers_by_question[question] = []
-            answers_by_question[question].append(user_answer)
-
-    # Calculate the score
-    total_questions = quiz.questions.count()
-    total_possible_score = quiz.score
-    total_earned_score = 0
-
-    # score = correct_answers  # You can adjust scoring logic here
-
-    for question, answers in answers_by_question.items():
-        if question.type == Question.MULTIPLE_CHOICE:
-            if all(answer.answer.is_correct for answer in answers):
-                total_earned_score += question.score
-        elif question.type == Question.TRUE_FALSE:
-            if len(answers) == 1 and answers[0].answer.is_correct:
-                total_earned_score += question.score
-        elif question.type == Question.SHORT_ANSWER:
-            total_earned_score += question.score
-
-    # Update the Take record
-    if take.score != total_earned_score:
-        take.score = total_earned_score
-        take.save()
+    """
+    Shows the stored result of a finished quiz attempt.
+
+    The result is graded once when the attempt is finished, so this
+    view only reads it back; the quiz structure comes from the cached
+    quiz snapshot.
+    """
+    result = TakeResult.objects.select_related('take').filter(
+        take_id=take_id,
+        take__user=request.user
+    ).first()
+
+    if result is None:
+        take = get_object_or_404(Take, id=take_id, user=request.user)
+        if not take.finished_at:
+            messages.info(request, "You have not completed this quiz yet.")
+            return redirect('quiz_page', quiz_id=take.quiz_id)
+        # Attempts finished before results were stored are graded once
+        result = grade_take(take)
+
+    quiz = get_quiz_snapshot(result.take.quiz_id)
+    entries = {entry['question']: entry for entry in result.breakdown}
+
+    # List the questions in the order the user answered them
+    question_results = []
+    for question in quiz.for_take(result.take).questions:
+        entry = entries.get(question.id)
+        if entry is None:
+            continue
+        answers = {answer.id: answer for answer in question.answers}
+        question_results.append({
+            'question': question,
+            'earned': Decimal(entry['earned']),
+            'text': entry['text'],
+            'answers': [answers[a] for a in entry['answers'] if a in answers],
+        })
+
+    distribution = get_distribution(quiz.id)
 
     return render(request, 'quiz/quiz_result.html', {
         'quiz': quiz,
-        'score': total_earned_score,
-        'total_questions': total_questions,
-        'total_possible_score': total_possible_score,
-        'answers_by_question': answers_by_question,
+        'score': result.score,
+        'percentile': distribution.percentile(result.score),
+        'histogram': distribution.buckets(),
+        'total_takes': len(distribution),
+        'total_questions': result.total_questions,
+        'total_possible_score': result.max_score,
+        'question_results': question_results,
     })
 
 
 
+@login_required
+@enrollment_required
+def quiz_leaderboard(request, quiz_id):
+    """
+    Shows the best scores of a quiz and the user's rank.
+    """
+    quiz = get_published_quiz_snapshot(quiz_id)
+    return render(request, 'courses/leaderboard.html', {
+        'title': quiz.title,
+        'course_id': quiz.course_id,
+        **leaderboard_context(quiz_board(quiz.id), request.user),
+    })
+
+@login_required
+@enrollment_required
+def course_leaderboard(request, course_id):
+    """
+    Shows the best total quiz scores of a course and the user's rank.
+    """
+    course = get_object_or_404(Course, id=course_id)
+    return render(request, 'courses/leaderboard.html', {
+        'title': course.title,
+        'course_id': course.id,
+        **leaderboard_context(course_board(course.id), request.user),
+    })
+
 def teachers_view(request):
     """
     View for displaying the list of teachers.
@@ -284,6 +539,6 @@ def teachers_view(request):
     """
     # Ανάκτηση του group των teachers
     teachers_group = Group.objects.get(name="Teacher")
-    teachers = teachers_group.user_set.all()  # Παίρνουμε τους χρήστες του group
+    teachers = teachers_group.user_set.select_related('profile')  # Παίρνουμε τους χρήστες του group
 
     return render(request, 'courses/teachers.html', {'teachers': teachers})
@@ -16,3 +16,15 @@ class ProfilesConfig(AppConfig):
     """
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'profiles'
+
+    def ready(self):
+        """
+        Generate resized copies of uploaded avatars, and count their
+        references to stored files.
+        """
+        from core.homepage import invalidate_navigation
+        from core.images import register
+        from core.storage import track
+        from .models import Profile
+        register(Profile, 'avatar', 'avatar_variants', recorded=lambda profile: invalidate_navigation(profile.user_id))
+        track(Profile, 'avatar')
@@ -0,0 +1,19 @@
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        ('profiles', '0002_profile_avatar_variants'),
+    ]
+
+    operations = [
+        # Avatars are stored by content
+        migrations.AlterField(
+            model_name='profile',
+            name='avatar',
+            field=models.ImageField(default='profiles_pics/default_pic.jpg', null=True, storage=core.storage.ContentAddressedStorage(), upload_to='profile_pics'),
+        ),
+    ]
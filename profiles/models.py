@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from core.storage import content_storage
 
 class Profile(models.Model):
     """
@@ -13,13 +14,16 @@ class Profile(models.Model):
         bio (TextField): A field to store a short biography 
             for the user.
         avatar (ImageField): A field to store the user's avatar image.
+        avatar_variants (dict): The resized copies of the avatar.
     
     Methods:
         __str__(self): Returns a string representation of the profile.
     """
     user = models.OneToOneField(User,on_delete=models.CASCADE,related_name="profile")
     bio = models.TextField(blank=True, null=True)
-    avatar = models.ImageField(default='profiles_pics/default_pic.jpg', upload_to='profile_pics',null=True)
+    avatar = models.ImageField(default='profiles_pics/default_pic.jpg', upload_to='profile_pics',null=True,storage=content_storage)
+    # Resized copies of the avatar (see core.images)
+    avatar_variants = models.JSONField(default=dict, blank=True, editable=False)
     
    
     def __str__(self):